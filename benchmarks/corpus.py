@@ -0,0 +1,47 @@
+from numpy import asarray
+from numpy.random import RandomState
+from pandas import DataFrame
+from model.preparation.equivalence import fixture_documents
+
+letters = asarray(list('abcdefghijklmnopqrstuvwxyz'))
+endings = ['.', '.', '!', '?', '!!!', '...']
+
+
+def make_vocabulary(size, random_state):
+    """ Generates a vocabulary of random lowercase words """
+    return [''.join(random_state.choice(letters, length)) for length in random_state.randint(2, 10, size)]
+
+
+def make_corpus(num_documents, mean_sentences=4, vocabulary_size=5000, fixture_rate=.1, seed=0):
+    """
+    Generates a synthetic forum corpus of sentences of Zipf-distributed words, with the fixture documents
+    (quotes, links, hashtags, entities, etc.) mixed in so every pre-processing stage has work to do
+
+    :param int num_documents: Number of documents
+    :param int mean_sentences: Mean number of sentences per document
+    :param int vocabulary_size: Number of distinct words
+    :param float fixture_rate: Fraction of sentences replaced by a fixture document
+    :param int seed: Seed of the generator, equal seeds give equal corpora
+    :return list: List of documents
+    """
+    random_state = RandomState(seed)
+    vocabulary = make_vocabulary(vocabulary_size, random_state)
+    fixtures = [document for document in fixture_documents if isinstance(document, str) and len(document) > 0]
+
+    def make_sentence():
+        if random_state.rand() < fixture_rate:
+            return fixtures[random_state.randint(len(fixtures))]
+
+        ranks = (random_state.zipf(1.3, 3 + random_state.poisson(9)) - 1) % vocabulary_size
+        sentence = ' '.join(vocabulary[rank] for rank in ranks)
+        return sentence.capitalize() + endings[random_state.randint(len(endings))]
+
+    return [
+        ' '.join(make_sentence() for _ in range(1 + random_state.poisson(mean_sentences - 1)))
+        for _ in range(num_documents)
+    ]
+
+
+def save_corpus(documents, path):
+    """ Saves a corpus as a single column csv, in the layout of the source datasets """
+    DataFrame({'content': documents}).to_csv(path, index=False)
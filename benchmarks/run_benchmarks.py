@@ -0,0 +1,165 @@
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+    from config import n_threads
+
+    parser = ArgumentParser(description='Offline throughput benchmark of every pipeline stage.')
+    parser.add_argument('--documents', type=int, default=10000, help='Number of synthetic documents')
+    parser.add_argument('--threads', type=int, nargs='+', default=sorted({1, 2, n_threads}),
+                        help='Values of n_threads process_documents is measured at')
+    parser.add_argument('--repeats', type=int, default=3, help='Runs per stage, the fastest is kept')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the corpus, embeddings, and network')
+    parser.add_argument('--output', type=str, default=None, help='Results file [data/benchmarks/<commit>.json]')
+    parser.add_argument('--compare', type=str, default=None, help='Results file of a previous run to compare with')
+    arguments = parser.parse_args()
+
+    # Imported once the arguments are parsed, so --help is fast
+    from json import dump, load
+    from platform import python_version
+    from subprocess import check_output, CalledProcessError
+    from tempfile import TemporaryDirectory
+    from time import strftime
+    from numpy import asarray
+    from utilities import make_path, make_dir, move_to_root
+    from utilities.pre_processing import runtime_clean
+    from config import batch_size, max_tokens, embedding_dimension, vectorized_embedding
+    from model.core import RealtimeEmbedding, predict_abusive_intent, compute_abusive_intent, CumulativeCalibrator
+    from model.preparation.contexts import split_into_contexts
+    from model.preparation.fused_processing import apply_fused_process
+    import model.preparation.pre_processing as pre_processing
+    from benchmarks.stubs import StubEmbedding, build_stub_network
+    from benchmarks.corpus import make_corpus, save_corpus
+    from benchmarks.timing import time_stage, compare_results
+
+    move_to_root()
+
+    try:
+        commit = check_output(['git', 'rev-parse', '--short', 'HEAD']).decode().strip()
+    except (CalledProcessError, OSError):
+        commit = 'unknown'
+
+    output_path = make_path(arguments.output or 'data/benchmarks/' + commit + '.json')
+    repeats = arguments.repeats
+    stages = []
+
+    documents = make_corpus(arguments.documents, seed=arguments.seed)
+    num_documents = len(documents)
+    print('Generated', num_documents, 'documents.')
+
+    # Each process is timed on the output of the processes before it
+    stage_documents = documents
+    for process in pre_processing.standard_processes:
+        inputs = stage_documents
+        stages.append(time_stage(
+            'process.' + process.__name__, lambda: [process(document) for document in inputs], num_documents,
+            repeats=repeats
+        ))
+        stage_documents = [process(document)[1] for document in inputs]
+
+    processes = pre_processing.standard_processes
+    stages.append(time_stage(
+        'apply_process', lambda: [pre_processing.apply_process(document, processes) for document in documents],
+        num_documents, repeats=repeats
+    ))
+    stages.append(time_stage(
+        'apply_fused_process', lambda: [apply_fused_process(document) for document in documents], num_documents,
+        repeats=repeats
+    ))
+    print('Timed pre-processing.')
+
+    with TemporaryDirectory() as working_dir:
+        source_path = make_path(working_dir) / 'source.csv'
+        target_path = make_path(working_dir) / 'contexts.csv'
+        save_corpus(documents, source_path)
+
+        # Pools are created with the module's n_threads
+        for threads in arguments.threads:
+            pre_processing.n_threads = threads
+            stages.append(time_stage(
+                'process_documents.threads=' + str(threads),
+                lambda: pre_processing.process_documents(source_path, target_path), num_documents,
+                repeats=repeats, children=True
+            ))
+        pre_processing.n_threads = n_threads
+    print('Timed process_documents.')
+
+    processed = [pre_processing.apply_process(document, processes) for document in documents]
+    stages.append(time_stage('split_into_contexts', lambda: split_into_contexts(processed), num_documents,
+                             repeats=repeats))
+
+    contexts, _ = split_into_contexts(processed)
+    num_contexts = len(contexts)
+    stages.append(time_stage('runtime_clean', lambda: runtime_clean(list(contexts)), num_contexts, 'contexts',
+                             repeats=repeats))
+    contexts = asarray(runtime_clean(list(contexts)), dtype=object)
+
+    embedding_model = StubEmbedding(embedding_dimension, seed=arguments.seed)
+
+    def embed_contexts(realtime_data):
+        for start in range(0, num_contexts, batch_size):
+            realtime_data.embed_data(contexts[start:start + batch_size])
+
+    # Cold runs start from an empty embedding table (or cache), warm runs reuse a filled one
+    stages.append(time_stage(
+        'embed_data.cold', lambda: embed_contexts(RealtimeEmbedding(embedding_model, contexts)), num_contexts,
+        'contexts', repeats=repeats
+    ))
+    warm_embedding = RealtimeEmbedding(embedding_model, contexts)
+    embed_contexts(warm_embedding)
+    stages.append(time_stage('embed_data.warm', lambda: embed_contexts(warm_embedding), num_contexts, 'contexts',
+                             repeats=repeats))
+    print('Timed embedding.')
+
+    network = build_stub_network(embedding_dimension, seed=arguments.seed)
+
+    def make_realtime_data():
+        return RealtimeEmbedding(
+            embedding_model, contexts,
+            embedding_cache=warm_embedding.embedding_cache, embedding_table=warm_embedding.embedding_table
+        )
+
+    stages.append(time_stage(
+        'predict_abusive_intent', lambda: predict_abusive_intent(make_realtime_data(), network), num_contexts,
+        'contexts', repeats=repeats
+    ))
+    abuse, intent, _ = predict_abusive_intent(make_realtime_data(), network)
+    print('Timed predictions.')
+
+    calibrator = CumulativeCalibrator.fit(intent)
+    for method in ['product', 'euclidean', 'cdf']:
+        stages.append(time_stage(
+            'compute_abusive_intent.' + method,
+            lambda: compute_abusive_intent(intent, abuse, method, calibrator if method == 'cdf' else None),
+            num_contexts, 'contexts', repeats=repeats
+        ))
+
+    # Memory is the peak traced (Python heap, including numpy arrays) allocation of each stage on its own, not its RSS
+    results = {
+        'commit': commit,
+        'time': strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': python_version(),
+        'settings': {
+            'documents': num_documents, 'contexts': num_contexts, 'seed': arguments.seed, 'repeats': repeats,
+            'batch_size': batch_size, 'max_tokens': max_tokens, 'embedding_dimension': embedding_dimension,
+            'vectorized_embedding': vectorized_embedding,
+        },
+        'stages': stages,
+    }
+
+    make_dir(output_path)
+    with open(output_path, 'w') as output_file:
+        dump(results, output_file, indent=2)
+
+    print('{:<45}{:>22}{:>15}'.format('stage', 'throughput', 'heap peak'))
+    for stage in stages:
+        print('{:<45}{:>14.1f} {}/s{:>10.1f} MB'.format(
+            stage['stage'], stage['per_second'] or 0, stage['unit'], stage['peak_memory_mb']
+        ))
+    print('Saved results to', output_path)
+
+    if arguments.compare is not None:
+        with open(arguments.compare) as baseline_file:
+            baseline = load(baseline_file)
+
+        print('Compared with', baseline['commit'])
+        for name, baseline_speed, speed, speed_up in compare_results(baseline, results):
+            print('{:<45}{:>14.1f}{:>14.1f}{:>8.2f}x'.format(name, baseline_speed, speed, speed_up))
@@ -0,0 +1,47 @@
+from zlib import crc32
+from numpy import float32
+from numpy.random import RandomState
+from keras.models import Model
+from keras.layers import Input, Dense, GRU, Bidirectional
+from tensorflow.random import set_seed
+from config import embedding_dimension
+from model.core.attention import AttentionWithContext
+
+
+class StubEmbedding:
+    """ Deterministic stand-in for a fastText model, the vector of a token is seeded by a hash of the token """
+    def __init__(self, dimension=embedding_dimension, seed=0):
+        """
+        :param int dimension: Dimension of the token vectors
+        :param int seed: Seed mixed into the hash of every token
+        """
+        self.dimension = dimension
+        self.seed = seed
+
+    def get_dimension(self):
+        return self.dimension
+
+    def get_word_vector(self, token):
+        """ Pseudo-random vector of a token, identical across runs and processes """
+        random_state = RandomState((crc32(token.encode('utf-8', 'surrogatepass')) + self.seed) % 2 ** 32)
+        return random_state.standard_normal(self.dimension).astype(float32)
+
+
+def build_stub_network(embedding_dimension=embedding_dimension, hidden_size=16, seed=0):
+    """
+    Builds a small, randomly initialized network with the inputs and outputs of the abusive intent network
+
+    :param int embedding_dimension: Dimension of the token embeddings
+    :param int hidden_size: Number of units of the recurrent layer (in each direction)
+    :param int seed: Seed of the weight initialization
+    :return Model: Network predicting abuse, intent, and a third (unused) head from embedded contexts
+    """
+    set_seed(seed)
+
+    # Variable time axis, so the network also accepts length-bucketed (token_budget) batches
+    embedded = Input(shape=(None, embedding_dimension))
+    hidden = Bidirectional(GRU(hidden_size, return_sequences=True))(embedded)
+    attended = AttentionWithContext()(hidden)
+
+    outputs = [Dense(1, activation='sigmoid', name=head)(attended) for head in ('abuse', 'intent', 'hybrid')]
+    return Model(inputs=embedded, outputs=outputs)
@@ -0,0 +1,109 @@
+from time import perf_counter
+from resource import getrusage, RUSAGE_CHILDREN
+from sys import platform
+from multiprocessing import get_context
+from tracemalloc import start as start_tracing, stop as stop_tracing, get_traced_memory
+
+
+def get_peak_rss(who=RUSAGE_CHILDREN):
+    """ Peak resident set size (MB) of the largest terminated child process (or of this process) """
+    peak = getrusage(who).ru_maxrss
+    return peak / 2 ** 20 if platform == 'darwin' else peak / 2 ** 10     # Bytes on macOS, kilobytes on Linux
+
+
+def measure_memory(function):
+    """
+    Measures the peak memory allocated while running a function, as traced by tracemalloc.
+    This only counts allocations on the Python heap (Python objects and numpy arrays), not the RSS, so memory-mapped
+    files and native allocations (ex. of fastText or TensorFlow) are left out. Unlike the peak RSS, which never
+    decreases, it only covers the allocations of this run.
+
+    :param function function: Function to measure, () -> None
+    :return float: Peak of the allocations (MB)
+    """
+    start_tracing()
+    try:
+        function()
+        _, peak = get_traced_memory()
+    finally:
+        stop_tracing()
+
+    return peak / 2 ** 20
+
+
+def run_in_child(function, connection):
+    """ Runs a function then sends the peak RSS of the processes it started """
+    function()
+    connection.send(get_peak_rss(RUSAGE_CHILDREN))
+    connection.close()
+
+
+def measure_child_memory(function):
+    """
+    Measures the peak RSS of the worker processes started by a function.
+    The function runs in a forked process, whose child usage only covers the workers of this run.
+
+    :param function function: Function to measure, () -> None
+    :return float: Peak RSS of the largest worker process (MB)
+    """
+    receiver, sender = get_context('fork').Pipe(duplex=False)
+    process = get_context('fork').Process(target=run_in_child, args=(function, sender))
+    process.start()
+    sender.close()
+
+    peak = receiver.recv()
+    process.join()
+    return peak
+
+
+def time_stage(name, function, num_items, unit='documents', repeats=1, children=False):
+    """
+    Times a benchmark stage, keeping the fastest of its repeats.
+    Memory is measured in one more (untimed) run, as tracing the allocations slows the stage down.
+
+    :param str name: Name of the stage
+    :param function function: Function running the stage, () -> None
+    :param int num_items: Number of items (documents or contexts) processed by each run
+    :param str unit: Name of the items
+    :param int repeats: Number of runs
+    :param bool children: Whether the stage runs worker processes, whose peak RSS is also reported
+    :return dict: Timing of the stage
+    """
+    timings = []
+    for _ in range(repeats):
+        start = perf_counter()
+        function()
+        timings.append(perf_counter() - start)
+
+    seconds = min(timings)
+    return {
+        'stage': name,
+        'unit': unit,
+        'items': num_items,
+        'seconds': seconds,
+        'per_second': num_items / seconds if seconds > 0 else None,
+        'peak_memory_mb': measure_memory(function),
+        'peak_child_rss_mb': measure_child_memory(function) if children else None,
+    }
+
+
+def compare_results(baseline, candidate):
+    """
+    Compares the throughput of two benchmark runs, stage by stage
+
+    :param dict baseline: Results of the reference run
+    :param dict candidate: Results of the run being compared
+    :return list: (stage, baseline per second, candidate per second, speed-up) of the stages of both runs
+    """
+    baseline_stages = {stage['stage']: stage for stage in baseline['stages']}
+    comparison = []
+
+    for stage in candidate['stages']:
+        reference = baseline_stages.get(stage['stage'])
+        if reference is None or not reference['per_second'] or not stage['per_second']:
+            continue
+        comparison.append((
+            stage['stage'], reference['per_second'], stage['per_second'], stage['per_second'] / reference['per_second']
+        ))
+
+    return comparison
@@ -0,0 +1,44 @@
+from argparse import ArgumentParser
+from pathlib import Path
+from runpy import run_path
+import sys
+
+# Sub-command -> (script, description), a script and its dependencies are only imported when its sub-command runs
+commands = {
+    'prepare': ('execution/prepare_data.py', 'Pre-process the dataset into cleaned contexts.'),
+    'compile-embeddings': ('execution/compile_embeddings.py', 'Compile an embedding table of the dataset vocabulary.'),
+    'predict': ('execution/make_predictions.py', 'Predict the abusive intent of the prepared contexts.'),
+    'serve': ('execution/serve.py', 'Serve abusive intent scores over HTTP.'),
+    'export': ('execution/export_model.py', 'Export the embedding and network as a TensorFlow SavedModel.'),
+    'evaluate-near-duplicates': (
+        'execution/evaluate_near_duplicates.py', 'Evaluate near-duplicate scoring on a labeled dataset.'
+    ),
+    'evaluate-quantization': (
+        'execution/evaluate_quantization.py', 'Compare predictions of quantized embedding tables to full precision.'
+    ),
+    'verify': ('execution/verify_pre_processing.py', 'Verify the fast pre-processing against the reference chain.'),
+    'compact-cache': ('execution/compact_cache.py', 'Evict stale documents from the pre-processing cache.'),
+    'benchmark': ('benchmarks/run_benchmarks.py', 'Run the offline throughput benchmarks (see benchmark --help).'),
+}
+pass_through = {'benchmark'}    # Sub-commands whose arguments are parsed by their script
+
+
+def main(arguments=None):
+    """ Runs the script of a sub-command, ex. python cli.py prepare """
+    parser = ArgumentParser(prog='cli.py', description='Abusive intent detection.')
+    sub_parsers = parser.add_subparsers(dest='command', metavar='command', required=True)
+
+    for name, (_, description) in commands.items():
+        sub_parsers.add_parser(name, help=description, description=description, add_help=name not in pass_through)
+
+    arguments, script_arguments = parser.parse_known_args(arguments)
+    if len(script_arguments) > 0 and arguments.command not in pass_through:
+        parser.error('unrecognized arguments: ' + ' '.join(script_arguments))
+    script_path = Path(__file__).resolve().parent / commands[arguments.command][0]
+
+    sys.argv = [str(script_path)] + script_arguments
+    run_path(str(script_path), run_name='__main__')
+
+
+if __name__ == '__main__':
+    main()
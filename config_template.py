@@ -6,8 +6,37 @@ fast_text_model = 'cc.en.300'
 n_threads = 4
 max_tokens = 200
 embedding_dimension = 300
+vectorized_embedding = False    # Embed batches by gathering rows of a dense token table (see EmbeddingTable)
+embedding_dtype = 'float32'
+embedding_quantization = None   # Storage of the compiled embedding table, None (float32), 'float16', 'int8', or 'pq'
+pq_subvector_size = 4           # Dimensions per product quantization code (ex. 300 / 4 = 75 bytes per token)
+stream_chunk_size = None    # Contexts per chunk when streaming predictions, None to load the full dataset
+prediction_format = 'csv'   # Either 'npy' (single memory-mappable store of scores and indexes) or 'csv' (vectors)
+document_top_k = 3          # Number of highest context scores averaged into a document's top_k_mean
+prepare_chunk_size = None   # Documents per chunk when streaming pre-processing, None to load the full dataset
+save_features = False       # Save the values of each pre-processing step (ex. counts) to a per-document feature table
+processing_cache = False    # Reuse prepared documents from earlier runs of prepare_data (implies streaming)
+processing_cache_age = 90   # Cached documents unused for longer (in days) are evicted by compact_cache.py
+reuse_batch_buffers = False         # Build batches in a pool of reused buffers rather than allocating every batch
+prediction_queue_size = 10          # Batches Keras queues ahead of inference (the buffer pool is sized from it)
+parallel_embedding = None   # Build batches on n_threads workers, either 'thread', 'process' (compiled tables), or None
+prefetch_batches = 4        # Number of batches embedded ahead of inference by the parallel workers
+deduplicate_contexts = False        # Embed and predict each distinct context once, scattering the scores back
+near_duplicate_threshold = None     # Score near-duplicates once per cluster above this Jaccard similarity (ex. 0.8)
+minhash_permutations = 64           # Length of the MinHash signatures used to find near-duplicates
+shingle_size = 2                    # Number of tokens per shingle compared between contexts
+embedding_cache_policy = 'lru'          # Either 'lru' or 'lfu'
+embedding_cache_entries = None          # Maximum number of cached tokens, None for no limit
+embedding_cache_bytes = 2 ** 29         # Maximum size of cached vectors in bytes, None for no limit
+instrumentation = False                 # Save stage timings, cache hit rates, and batch latencies to data/metrics/
 
 # Deep learning constants
 training_verbosity = 1
 execute_verbosity = 1
 batch_size = 512
+token_budget = None     # Tokens per length-bucketed batch (ex. 16384), None for fixed batch_size x max_tokens batches
+
+# Scoring service constants
+serve_port = 8080
+serve_max_batch_size = 256      # Maximum number of contexts per micro-batch
+serve_max_wait = 0.01           # Maximum time (in seconds) a request waits for a micro-batch to fill
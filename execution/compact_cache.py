@@ -0,0 +1,16 @@
+if __name__ == '__main__':
+    from utilities import make_path, check_existence, move_to_root
+    from config import processing_cache_age, save_features
+    from model.preparation.pre_processing import standard_processes
+    from model.preparation.pre_processing_cache import compact_cache, get_chain_identity
+
+    move_to_root()
+
+    cache_path = make_path('data/cache/') / 'pre_processing.sqlite'
+    check_existence(cache_path)
+
+    # Results of other chains (or versions) than the one used by prepare_data.py can never be hit again
+    chain_identity = get_chain_identity(standard_processes, collect_values=save_features)
+
+    evicted, remaining = compact_cache(cache_path, max_age=processing_cache_age, chain_identity=chain_identity)
+    print('Evicted', evicted, 'cached documents,', remaining, 'remain.')
@@ -0,0 +1,25 @@
+if __name__ == '__main__':
+    from utilities import make_path, check_existence, move_to_root
+    from config import dataset, fast_text_model, embedding_quantization, pq_subvector_size
+    from fasttext import load_model as ft_load
+    from model.preparation.embedding_compilation import compile_embeddings, quantize_compiled
+
+    move_to_root()
+
+    base = make_path('data/')
+    embedding_path = base / 'model' / (fast_text_model + '.bin')
+    context_path = base / 'source' / (dataset + '_clean.csv')
+    target_dir = base / 'model' / (dataset + '_embeddings/')
+
+    check_existence([embedding_path, context_path])
+    print('Config complete.')
+
+    embedding_model = ft_load(str(embedding_path))
+    print('Loaded model.')
+
+    num_tokens = compile_embeddings(context_path, embedding_model, target_dir, embedding_path)
+    print('Compiled', num_tokens, 'tokens to', target_dir)
+
+    if embedding_quantization is not None:
+        num_bytes = quantize_compiled(target_dir, embedding_quantization, pq_subvector_size)
+        print('Quantized the table to', embedding_quantization + ',', num_bytes, 'bytes.')
@@ -0,0 +1,42 @@
+if __name__ == '__main__':
+    from utilities import make_path, check_existence, load_data, move_to_root
+    from utilities.pre_processing import runtime_clean
+    from config import dataset, fast_text_model, minhash_permutations, shingle_size
+    from fasttext import load_model as ft_load
+    from model.core import RealtimeEmbedding, AttentionWithContext, predict_abusive_intent, CompiledEmbedding, \
+        is_compiled, is_stale, evaluate_near_duplicates
+    from keras.models import load_model as keras_load
+    from json import dumps
+
+    move_to_root()
+
+    thresholds = [.95, .9, .8, .7, .6]
+
+    base = make_path('data/')
+    embedding_path = base / 'model' / (fast_text_model + '.bin')
+    compiled_dir = base / 'model' / (dataset + '_embeddings/')
+    model_dir = base / 'model' / 'production/'
+    sample_path = base / 'source' / (dataset + '_labeled.csv')    # 'contexts' and binary 'label' columns
+    context_path = base / 'source' / (dataset + '_clean.csv')
+
+    use_compiled = is_compiled(compiled_dir) and not is_stale(compiled_dir, embedding_path, context_path)
+    if is_compiled(compiled_dir) and not use_compiled:
+        print('The compiled embedding table is out of date, run compile_embeddings.py to recompile it.')
+    check_existence([compiled_dir if use_compiled else embedding_path, model_dir, sample_path])
+
+    fallback_model = ft_load(str(embedding_path)) if embedding_path.exists() else None
+    embedding_model = CompiledEmbedding(compiled_dir, fallback_model) if use_compiled else fallback_model
+    model = keras_load(model_dir, custom_objects={'AttentionWithContext': AttentionWithContext})
+
+    sample = load_data(sample_path)
+    contexts = runtime_clean(sample['contexts'].values)
+    print('Loaded', len(contexts), 'labeled contexts.')
+
+    def score_contexts(subset):
+        return predict_abusive_intent(RealtimeEmbedding(embedding_model, subset), model)[2]
+
+    results = evaluate_near_duplicates(
+        contexts, sample['label'].values, score_contexts, thresholds, minhash_permutations, shingle_size
+    )
+    for result in results:
+        print(dumps(result))
@@ -0,0 +1,46 @@
+if __name__ == '__main__':
+    from utilities import make_path, check_existence, load_data, move_to_root, context_dtypes
+    from utilities.pre_processing import runtime_clean
+    from config import dataset, fast_text_model, pq_subvector_size
+    from model.core import RealtimeEmbedding, AttentionWithContext, predict_abusive_intent, CompiledEmbedding, \
+        is_quantized, is_stale, evaluate_quantization, quantization_methods
+    from model.preparation.embedding_compilation import quantize_compiled
+    from keras.models import load_model as keras_load
+    from json import dumps
+
+    move_to_root()
+
+    sample_size = 100000    # Number of contexts scored with each table
+
+    base = make_path('data/')
+    embedding_path = base / 'model' / (fast_text_model + '.bin')
+    compiled_dir = base / 'model' / (dataset + '_embeddings/')
+    model_dir = base / 'model' / 'production/'
+    context_path = base / 'source' / (dataset + '_clean.csv')
+
+    check_existence([compiled_dir, model_dir, context_path])
+    if is_stale(compiled_dir, embedding_path, context_path):
+        raise ValueError('The compiled embedding table is out of date, run compile_embeddings.py to recompile it.')
+    print('Config complete.')
+
+    for method in quantization_methods:
+        if not is_quantized(compiled_dir, method):
+            print('Quantized the table to', method + ',', quantize_compiled(compiled_dir, method, pq_subvector_size),
+                  'bytes.')
+
+    model = keras_load(model_dir, custom_objects={'AttentionWithContext': AttentionWithContext})
+    contexts = load_data(
+        context_path, columns=['contexts'], index_col=None, dtypes={'contexts': context_dtypes['contexts']}
+    )
+    contexts = runtime_clean(contexts['contexts'].values[:sample_size])
+    print('Loaded', len(contexts), 'contexts.')
+
+    def score_contexts(embedding_model):
+        return predict_abusive_intent(RealtimeEmbedding(embedding_model, contexts), model)
+
+    results = evaluate_quantization(
+        score_contexts, CompiledEmbedding(compiled_dir, quantization=None),
+        {method: CompiledEmbedding(compiled_dir, quantization=method) for method in quantization_methods}
+    )
+    for result in results:
+        print(dumps(result))
@@ -0,0 +1,28 @@
+if __name__ == '__main__':
+    from utilities import make_path, check_existence, move_to_root
+    from config import dataset, fast_text_model
+    from fasttext import load_model as ft_load
+    from model.core import AttentionWithContext, CompiledEmbedding
+    from model.core.saved_model_export import export_saved_model
+    from keras.models import load_model as keras_load
+
+    move_to_root()
+
+    oov_fallback = True     # Embed out-of-vocabulary tokens from fastText subwords inside the graph
+
+    base = make_path('data/')
+    embedding_path = base / 'model' / (fast_text_model + '.bin')
+    compiled_dir = base / 'model' / (dataset + '_embeddings/')
+    model_dir = base / 'model' / 'production/'
+    target_dir = base / 'model' / 'serving/'
+
+    check_existence([compiled_dir, model_dir] + ([embedding_path] if oov_fallback else []))
+    print('Config complete.')
+
+    compiled_embedding = CompiledEmbedding(compiled_dir)
+    model = keras_load(model_dir, custom_objects={'AttentionWithContext': AttentionWithContext})
+    oov_model = ft_load(str(embedding_path)) if oov_fallback else None
+    print('Loaded models.')
+
+    export_saved_model(model, compiled_embedding, target_dir, oov_model=oov_model)
+    print('Exported SavedModel to', target_dir)
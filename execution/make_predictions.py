@@ -1,37 +1,155 @@
-from utilities import make_path, check_existence, load_data, output_abusive_intent, save_vector
+from utilities import make_path, check_existence, load_data, output_abusive_intent, save_vector, load_tokenized, \
+    is_tokenized, load_data_chunks, save_predictions, index_columns, context_dtypes, load_predictions, \
+    export_predictions_csv, metrics, move_to_root
 from utilities.pre_processing import runtime_clean
-from config import dataset, fast_text_model
+from config import dataset, fast_text_model, stream_chunk_size, parallel_embedding, deduplicate_contexts, \
+    near_duplicate_threshold, minhash_permutations, shingle_size, prediction_format, document_top_k, \
+    vectorized_embedding
 from fasttext import load_model as ft_load
-from model.core import RealtimeEmbedding, AttentionWithContext, predict_abusive_intent
+from model.core import RealtimeEmbedding, AttentionWithContext, predict_abusive_intent, CompiledEmbedding, \
+    is_compiled, is_stale, stream_predictions, ParallelEmbedding, find_duplicates, get_duplicate_ratio, \
+    scatter_predictions, cluster_near_duplicates, DocumentIndex
 from keras.models import load_model as keras_load
-from numpy import argsort
+from numpy import argsort, save
 
 
+move_to_root()
+
 base = make_path('data/')
 embedding_path = base / 'model' / (fast_text_model + '.bin')
+compiled_dir = base / 'model' / (dataset + '_embeddings/')
 model_dir = base / 'model' / 'production/'
 context_path = base / 'source' / (dataset + '_clean.csv')
+tokenized_path = base / 'source' / (dataset + '_tokens/')
 target_dir = base / 'predictions/'
+store_path = target_dir / 'predictions.npy'
 
-check_existence([embedding_path, model_dir, context_path])
+# Stale compiled tables (see compile_embeddings.py) are not used
+use_compiled = is_compiled(compiled_dir) and not is_stale(compiled_dir, embedding_path, context_path)
+if is_compiled(compiled_dir) and not use_compiled:
+    print('The compiled embedding table is out of date, run compile_embeddings.py to recompile it.')
+check_existence([compiled_dir if use_compiled else embedding_path, model_dir, context_path])
 print('Config complete.')
 
-embedding_model = ft_load(str(embedding_path))
-model = keras_load(model_dir, custom_objects={'AttentionWithContext': AttentionWithContext})
+# Prefer the memory-mapped corpus table over the full fastText model, which embeds the tokens missing from the table
+with metrics.stage('load_models'):
+    fallback_model = ft_load(str(embedding_path)) if embedding_path.exists() else None
+    embedding_model = CompiledEmbedding(compiled_dir, fallback_model) if use_compiled else fallback_model
+    model = keras_load(model_dir, custom_objects={'AttentionWithContext': AttentionWithContext})
+if use_compiled and fallback_model is None:
+    print('No fastText model, tokens missing from the compiled table are embedded as zeros.')
 print('Loaded models.')
 
-contexts = load_data(context_path)['contexts'].values
-contexts = runtime_clean(contexts)
-realtime_data = RealtimeEmbedding(embedding_model, contexts)
-print('Loaded and prepared data.')
+bundle_headers = ['abuse', 'intent', 'abusive_intent']
+sample_size = 25
+document_indexes, scores = None, None
 
-prediction_bundle = predict_abusive_intent(realtime_data, model)
+# Stream large datasets chunk by chunk, keeping memory flat
+if stream_chunk_size is not None:
+    context_chunks = (
+        (chunk['contexts'].values, chunk[index_columns].values) for chunk in load_data_chunks(
+            context_path, stream_chunk_size, columns=list(context_dtypes), index_col=None, dtypes=context_dtypes
+        )
+    )
+    target_paths, cluster_path = None, None
+    if prediction_format == 'csv':
+        target_paths = [target_dir / (header + '.csv') for header in bundle_headers]
+        cluster_path = target_dir / 'cluster_id.csv'
 
-bundle_headers = ['abuse', 'intent', 'abusive_intent']
-for prediction, header in zip(prediction_bundle, bundle_headers):
-    target_path = target_dir / (header + '.csv')
-    save_vector(prediction, target_path)
+    with metrics.stage('stream_predictions'):
+        top_contexts, counts = stream_predictions(
+            context_chunks, embedding_model, model, target_paths, sample_size, deduplicate=deduplicate_contexts,
+            store_path=store_path if prediction_format == 'npy' else None,
+            near_duplicate_threshold=near_duplicate_threshold, num_permutations=minhash_permutations,
+            shingle_size=shingle_size, cluster_path=cluster_path
+        )
+    output_abusive_intent(*top_contexts.get_results())
 
-sample_size = 25
-indexes = reversed(argsort(prediction_bundle[-1])[-sample_size:])
-output_abusive_intent(indexes, prediction_bundle, contexts)
+    # Duplicates and near-duplicates are only found within each chunk
+    if deduplicate_contexts:
+        duplicate_ratio = 1 - counts['unique_contexts'] / counts['contexts'] if counts['contexts'] > 0 else 0.
+        metrics.set_gauge('duplicate_ratio', duplicate_ratio)
+        print('Collapsed', counts['contexts'], 'contexts to', counts['unique_contexts'],
+              'unique contexts (within chunks), dedup ratio', round(duplicate_ratio, 4))
+    if near_duplicate_threshold is not None:
+        print('Grouped contexts into', counts['clusters'], 'near-duplicate clusters (within chunks).')
+
+    if prediction_format == 'npy':
+        records = load_predictions(store_path)
+        document_indexes, scores = records['document_index'], records['abusive_intent']
+else:
+    # Pre-tokenized contexts (see prepare_data.py) skip string handling and tokenization
+    with metrics.stage('load_contexts'):
+        if is_tokenized(tokenized_path):
+            contexts = load_tokenized(tokenized_path)
+            index_dtypes = {column: context_dtypes[column] for column in index_columns}
+            indexes = load_data(context_path, columns=index_columns, index_col=None, dtypes=index_dtypes).values
+        else:
+            context_data = load_data(
+                context_path, columns=list(context_dtypes), index_col=None, dtypes=context_dtypes
+            )
+            contexts = runtime_clean(context_data['contexts'].values)
+            indexes = context_data[index_columns].values
+
+    # Only embed and predict each distinct context once
+    unique_contexts, inverse = contexts, None
+    if deduplicate_contexts:
+        with metrics.stage('deduplicate'):
+            first_indexes, inverse = find_duplicates(contexts)
+        unique_contexts = contexts[first_indexes]
+        duplicate_ratio = get_duplicate_ratio(first_indexes, inverse)
+        metrics.set_gauge('duplicate_ratio', duplicate_ratio)
+        print('Collapsed', len(contexts), 'contexts to', len(first_indexes), 'unique contexts, dedup ratio',
+              round(duplicate_ratio, 4))
+
+    # Only embed and predict one representative of each cluster of near-duplicates
+    cluster_ids = None
+    if near_duplicate_threshold is not None:
+        with metrics.stage('cluster_near_duplicates'):
+            representatives, representative_ids = cluster_near_duplicates(
+                unique_contexts, near_duplicate_threshold, minhash_permutations, shingle_size
+            )
+        unique_contexts = unique_contexts[representatives]
+        cluster_ids = representative_ids if inverse is None else representative_ids[inverse]
+        inverse = cluster_ids
+        print('Grouped contexts into', len(representatives), 'near-duplicate clusters.')
+
+    # Parallel workers gather from the dense token table, so they imply vectorized embedding
+    realtime_data = RealtimeEmbedding(
+        embedding_model, unique_contexts, vectorized=vectorized_embedding or parallel_embedding is not None
+    )
+    if parallel_embedding is not None:
+        realtime_data = ParallelEmbedding(realtime_data, use_processes=parallel_embedding == 'process')
+    print('Loaded and prepared data.')
+
+    with metrics.stage('predict'):
+        prediction_bundle = predict_abusive_intent(realtime_data, model)
+    if inverse is not None:
+        prediction_bundle = scatter_predictions(prediction_bundle, inverse)
+
+    with metrics.stage('save_predictions'):
+        if prediction_format == 'npy':
+            save_predictions(store_path, prediction_bundle, indexes, cluster_ids)
+        else:
+            for prediction, header in zip(prediction_bundle, bundle_headers):
+                target_path = target_dir / (header + '.csv')
+                save_vector(prediction, target_path)
+            if cluster_ids is not None:
+                save_vector(cluster_ids, target_dir / 'cluster_id.csv')
+
+    document_indexes, scores = indexes[:, 0], prediction_bundle[-1]
+
+    indexes = reversed(argsort(prediction_bundle[-1])[-sample_size:])
+    output_abusive_intent(indexes, prediction_bundle, contexts)
+
+# Reduce context scores to document scores, the unit moderators act on
+if document_indexes is not None:
+    with metrics.stage('aggregate_documents'):
+        document_scores = DocumentIndex(document_indexes).aggregate(scores, document_top_k)
+        if prediction_format == 'npy':
+            save(target_dir / 'documents.npy', document_scores)
+        else:
+            export_predictions_csv(document_scores, target_dir / 'documents.csv')
+    print('Scored', len(document_scores), 'documents.')
+
+metrics.save(base / 'metrics' / 'make_predictions')
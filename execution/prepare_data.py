@@ -1,15 +1,33 @@
 if __name__ == '__main__':
-    from utilities import make_path, check_existence
-    from config import dataset
+    from utilities import make_path, check_existence, metrics, move_to_root
+    from config import dataset, prepare_chunk_size, processing_cache, save_features
     from model.preparation.pre_processing import process_documents
 
+    move_to_root()
+
     content_index = -1
 
     base_path = make_path('data/source/')
     source_path = base_path / (dataset + '.csv')
     cleaned_path = base_path / (dataset + '_clean.csv')
+    tokenized_path = base_path / (dataset + '_tokens/')
+    features_path = base_path / (dataset + '_features.npz') if save_features else None
+    cache_path = make_path('data/cache/') / 'pre_processing.sqlite' if processing_cache else None
 
     check_existence(source_path)
     print('Config complete.')
 
-    process_documents(source_path, cleaned_path, content_index=content_index)
+    # Without a feature table, the fused engine skips counting the values of the pre-processing steps
+    with metrics.stage('process_documents'):
+        cache_statistics = process_documents(
+            source_path, cleaned_path, content_index=content_index, tokenized_path=tokenized_path, fused=True,
+            chunk_size=prepare_chunk_size, features_path=features_path, cache_path=cache_path
+        )
+    if cache_statistics is not None:
+        print('Reused', cache_statistics['hits'], 'cached documents, processed', cache_statistics['misses'], 'others.')
+
+        lookups = cache_statistics['hits'] + cache_statistics['misses']
+        metrics.set_gauges('pre_processing_cache', cache_statistics)
+        metrics.set_gauge('pre_processing_cache_hit_rate', cache_statistics['hits'] / lookups if lookups > 0 else 0.)
+
+    metrics.save(make_path('data/metrics/') / 'prepare_data')
@@ -0,0 +1,45 @@
+if __name__ == '__main__':
+    from utilities import make_path, check_existence, move_to_root
+    from utilities.pre_processing import runtime_clean
+    from config import dataset, fast_text_model, serve_port, serve_max_batch_size, serve_max_wait
+    from fasttext import load_model as ft_load
+    from model.core import RealtimeEmbedding, AttentionWithContext, predict_abusive_intent, CompiledEmbedding, \
+        is_compiled, is_stale
+    from model.core.scoring_service import MicroBatcher, serve_scores
+    from keras.models import load_model as keras_load
+
+    move_to_root()
+
+    base = make_path('data/')
+    embedding_path = base / 'model' / (fast_text_model + '.bin')
+    compiled_dir = base / 'model' / (dataset + '_embeddings/')
+    model_dir = base / 'model' / 'production/'
+    context_path = base / 'source' / (dataset + '_clean.csv')
+
+    use_compiled = is_compiled(compiled_dir) and not is_stale(compiled_dir, embedding_path, context_path)
+    if is_compiled(compiled_dir) and not use_compiled:
+        print('The compiled embedding table is out of date, run compile_embeddings.py to recompile it.')
+    check_existence([compiled_dir if use_compiled else embedding_path, model_dir])
+    print('Config complete.')
+
+    # Live contexts are mostly covered by the compiled table, the fastText model embeds the remaining tokens
+    fallback_model = ft_load(str(embedding_path)) if embedding_path.exists() else None
+    embedding_model = CompiledEmbedding(compiled_dir, fallback_model) if use_compiled else fallback_model
+    model = keras_load(model_dir, custom_objects={'AttentionWithContext': AttentionWithContext})
+    if use_compiled and fallback_model is None:
+        print('No fastText model, tokens missing from the compiled table are embedded as zeros.')
+    print('Loaded models.')
+
+    # Keep the embedding table and cache warm across batches
+    shared_embedding = RealtimeEmbedding(embedding_model, [])
+
+    def score_contexts(contexts):
+        realtime_data = RealtimeEmbedding(
+            embedding_model, runtime_clean(contexts),
+            embedding_cache=shared_embedding.embedding_cache, embedding_table=shared_embedding.embedding_table
+        )
+        return predict_abusive_intent(realtime_data, model, serial=True)
+
+    batcher = MicroBatcher(score_contexts, serve_max_batch_size, serve_max_wait)
+    print('Serving on port', serve_port)
+    serve_scores(batcher, port=serve_port)
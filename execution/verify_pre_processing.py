@@ -0,0 +1,32 @@
+if __name__ == '__main__':
+    from utilities import make_path, load_data, move_to_root
+    from config import dataset
+    from model.preparation.equivalence import fixture_documents, find_mismatches, apply_soup_reference_process, \
+        apply_reference_process
+    from utilities.pre_processing import remove_quotes, remove_quotes_reference
+
+    move_to_root()
+
+    content_index = -1
+    sample_size = 10000     # Number of dataset documents verified, on top of the fixtures
+
+    source_path = make_path('data/source/') / (dataset + '.csv')
+
+    documents = list(fixture_documents)
+    if source_path.exists():
+        documents += list(load_data(source_path, index_col=None).values[:sample_size, content_index])
+    print('Verifying', len(documents), 'documents.')
+
+    # The quote scanner is compared with BeautifulSoup on its own, then both are compared through the whole chain
+    text_documents = [document for document in documents if isinstance(document, str)]
+    checks = [
+        ('Quote scanner (on its own)', text_documents, remove_quotes_reference, remove_quotes),
+        ('Quote scanner (standard chain)', documents, apply_soup_reference_process, apply_reference_process),
+        ('Fused engine (standard chain)', documents, apply_reference_process, None),
+    ]
+    for name, check_documents, reference, candidate in checks:
+        mismatches = find_mismatches(check_documents, reference, candidate) if candidate is not None \
+            else find_mismatches(check_documents, reference)
+        for index in mismatches:
+            print(name, 'mismatch on document', index, repr(check_documents[index])[:200])
+        print(name + (' is equivalent.' if len(mismatches) == 0 else ': ' + str(len(mismatches)) + ' mismatches.'))
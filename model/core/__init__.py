@@ -1,3 +1,33 @@
-from model.core.abusive_intent_network import *
-from model.core.attention import *
-from model.core.realtime_embedding import *
+from utilities.lazy_exports import make_lazy_exports
+
+# Names are imported from their submodule on first use, so Keras and TensorFlow are only loaded by the embedding,
+# attention, and streaming code (ex. compute_abusive_intent or DocumentIndex do not load them)
+__getattr__, __dir__, __all__ = make_lazy_exports(__name__, {
+    'abusive_intent_network': [
+        'compute_inner_product', 'CumulativeCalibrator', 'estimate_cumulative', 'compute_abusive_intent',
+        'predict_on_batches', 'predict_abusive_intent',
+    ],
+    'attention': ['dot_product', 'AttentionWithContext'],
+    'compiled_embedding': [
+        'matrix_filename', 'vocabulary_filename', 'sources_filename', 'CompiledEmbedding', 'is_compiled', 'hash_file',
+        'describe_file', 'save_sources', 'is_stale',
+    ],
+    'deduplication': ['find_duplicates', 'get_duplicate_ratio', 'scatter_predictions'],
+    'document_scores': ['document_dtype', 'DocumentIndex'],
+    'embedding_cache': ['cache_policies', 'EmbeddingCache', 'make_embedding_cache'],
+    'embedding_table': ['EmbeddingTable'],
+    'realtime_embedding': ['RealtimeEmbedding', 'compute_sample_weights', 'compute_budget_batches'],
+    'near_duplicates': [
+        'mersenne_prime', 'max_hash', 'shingle_multiplier', 'choose_bands', 'hash_shingles', 'compute_signatures',
+        'cluster_signatures', 'cluster_near_duplicates', 'evaluate_near_duplicates',
+    ],
+    'quantization': [
+        'quantization_methods', 'num_centroids', 'get_quantized_paths', 'is_quantized', 'assign_centroids',
+        'train_codebook', 'encode_rows', 'QuantizedMatrix', 'load_quantized', 'save_quantization_parameters',
+        'evaluate_quantization',
+    ],
+    'parallel_embedding': [
+        'worker_state', 'get_slot_view', 'initialize_worker', 'build_batch', 'build_worker_batch', 'ParallelEmbedding',
+    ],
+    'streaming': ['TopContexts', 'stream_predictions'],
+})
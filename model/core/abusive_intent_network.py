@@ -1,6 +1,7 @@
-from keras.models import Model
-from config import execute_verbosity
-from numpy import ndarray, vectorize, cumsum, sqrt, argmin, histogram
+from time import perf_counter
+from config import execute_verbosity, prediction_queue_size
+from numpy import ndarray, cumsum, histogram, quantile, linspace, searchsorted, savez, load, concatenate
+from utilities.instrumentation import metrics
 
 
 def compute_inner_product(value_one, value_two, norm=2):
@@ -8,7 +9,60 @@ def compute_inner_product(value_one, value_two, norm=2):
     return (value_one ** norm + value_two ** norm) ** (1 / norm)
 
 
-# TODO correct to space bins based on distribution
+class CumulativeCalibrator:
+    """ Estimated cumulative distribution of a dataset, evaluated with a binary search over the bin edges """
+    def __init__(self, bin_edges, cumulative):
+        """
+        :param ndarray bin_edges: Left edges of the bins, ascending
+        :param ndarray cumulative: Estimated cumulative distribution at each bin edge
+        """
+        self.bin_edges = bin_edges
+        self.cumulative = cumulative
+
+    @classmethod
+    def fit(cls, data, num_bins=1000, spacing='uniform'):
+        """
+        Estimates the cumulative distribution of a dataset
+
+        :param ndarray data: Data vector, numpy array
+        :param int num_bins: Number of bins to use in the estimation, int
+        :param str spacing: Either 'uniform' (equal width bins) or 'quantile' (bins spaced on the distribution)
+        :return CumulativeCalibrator: Fitted calibrator
+        """
+        if spacing == 'quantile':
+            levels = linspace(0, 1, num_bins + 1)[:-1]
+            return cls(quantile(data, levels), levels)
+
+        distribution, bin_edges = histogram(data, bins=num_bins)
+        bin_edges = bin_edges[:-1]
+
+        cumulative = cumsum(distribution)           # Get cumulative sum
+        cumulative -= cumulative[0]                 # Shift distribution to align with bin edges
+        cumulative = cumulative / cumulative[-1]    # Convert cumulative to percentile
+
+        return cls(bin_edges, cumulative)
+
+    def __call__(self, predictions):
+        """
+        Evaluates the estimated cumulative distribution, O(log bins) per prediction
+
+        :param ndarray predictions: Array of predictions
+        :return ndarray: Approx cumulative distribution at each prediction
+        """
+        bin_indexes = searchsorted(self.bin_edges, predictions, side='right') - 1   # Get index of the bin
+        return self.cumulative[bin_indexes.clip(min=0)]
+
+    def save(self, path):
+        """ Saves the calibrator to a .npz file """
+        savez(path, bin_edges=self.bin_edges, cumulative=self.cumulative)
+
+    @classmethod
+    def load(cls, path):
+        """ Loads a calibrator saved with save """
+        arrays = load(path)
+        return cls(arrays['bin_edges'], arrays['cumulative'])
+
+
 def estimate_cumulative(data, num_bins=1000):
     """
     Estimates the cumulative distribution of a dataset
@@ -17,31 +71,17 @@ def estimate_cumulative(data, num_bins=1000):
     :param int num_bins: Number of bins to use in the estimation, int
     :return: Estimated function
     """
-    distribution, bin_edges = histogram(data, bins=num_bins)
-    bin_edges = bin_edges[:-1]
-
-    cumulative = cumsum(distribution)           # Get cumulative sum
-    cumulative -= cumulative[0]                 # Shift distribution to align with bin edges
-    cumulative = cumulative / cumulative[-1]    # Convert cumulative to percentile
-
-    def cumulative_function(prediction):
-        relative_locations = bin_edges <= prediction
-        if relative_locations[-1]:              # If its in the last bin
-            return cumulative[-1]
-
-        bin_index = argmin(relative_locations) - 1  # Get index of the bin
-        return cumulative[bin_index]            # Return approx cumulative sum at the point
+    return CumulativeCalibrator.fit(data, num_bins)
 
-    return cumulative_function
 
-
-def compute_abusive_intent(intent_predictions, abuse_predictions, method='product'):
+def compute_abusive_intent(intent_predictions, abuse_predictions, method='product', calibrator=None):
     """
     Compute a 'score' for abusive intent from intent and abuse predictions
 
     :param ndarray intent_predictions: Array of intent predictions
     :param ndarray abuse_predictions: Array of abuse predictions
     :param str method: Choice of abusive intent computation
+    :param CumulativeCalibrator calibrator: Pre-fitted intent distribution for the 'cdf' method [fit to intent by default]
     :return ndarray: Array of abusive intent predictions
     """
     if not isinstance(intent_predictions, ndarray):
@@ -54,11 +94,11 @@ def compute_abusive_intent(intent_predictions, abuse_predictions, method='produc
         raise TypeError('Predictions should be a vector, not an array')
 
     if method == 'cdf':
-        cumulative_function = vectorize(estimate_cumulative(intent_predictions))
-        return abuse_predictions * cumulative_function(intent_predictions)
+        if calibrator is None:
+            calibrator = CumulativeCalibrator.fit(intent_predictions)
+        return abuse_predictions * calibrator(intent_predictions)
     elif method == 'euclidean':
-        norm = vectorize(compute_inner_product)
-        return norm(intent_predictions, abuse_predictions)
+        return compute_inner_product(intent_predictions, abuse_predictions)
     elif method == 'product':
         pass
     else:
@@ -67,22 +107,74 @@ def compute_abusive_intent(intent_predictions, abuse_predictions, method='produc
     return intent_predictions * abuse_predictions
 
 
-def predict_abusive_intent(realtime_documents, abusive_intent_network, method='product'):
+def predict_on_batches(batches, abusive_intent_network):
+    """
+    Makes predictions batch by batch, each batch is consumed before the next one is requested.
+    When instrumented, the time taken to get (embed) and to predict each batch is recorded.
+
+    :param Iterable batches: Iterable of embedded batches
+    :param Model abusive_intent_network: keras network trained to predict abuse and intent
+    :return list: Predictions of each head of the network
+    """
+    if not metrics.enabled:
+        batch_predictions = [abusive_intent_network.predict_on_batch(batch) for batch in batches]
+    else:
+        batch_predictions = []
+        batches = iter(batches)
+        while True:
+            start = perf_counter()
+            batch = next(batches, None)
+            if batch is None:
+                break
+
+            embedded = perf_counter()
+            batch_predictions.append(abusive_intent_network.predict_on_batch(batch))
+            metrics.observe('embed_batch_seconds', embedded - start)
+            metrics.observe('predict_batch_seconds', perf_counter() - embedded)
+
+    return [concatenate([predictions[head] for predictions in batch_predictions]) for head in range(3)]
+
+
+def predict_abusive_intent(realtime_documents, abusive_intent_network, method='product', calibrator=None,
+                           serial=False):
     """
     Makes abusive intent predictions for a list of pre-processed documents
 
-    :param RealtimeEmbedding realtime_documents: list or array of pre-processed documents
+    :param RealtimeEmbedding realtime_documents: list or array of pre-processed documents (or a ParallelEmbedding)
     :param Model abusive_intent_network: keras network trained to predict abuse and intent
     :param str method: method used to make abusive intent predictions
+    :param CumulativeCalibrator calibrator: Pre-fitted intent distribution used by the 'cdf' method
+    :param bool serial: Whether batches are embedded then predicted one at a time, without the Keras generator queue
+        and progress bar (ex. for small, latency bound requests)
     :return tuple: tuple of abuse, intent, and abusive-intent predictions
     """
-    abuse_predictions, intent_predictions, _ = [
-        predictions.reshape(-1) for predictions in abusive_intent_network.predict_generator(
-            realtime_documents, verbose=execute_verbosity
+    # Imported here, so the scoring functions of this module can be used without loading TensorFlow
+    from model.core.parallel_embedding import ParallelEmbedding
+
+    if isinstance(realtime_documents, ParallelEmbedding):
+        # Batches are views of shared slots, so each is consumed before the next is requested
+        predictions_bundle = predict_on_batches(realtime_documents, abusive_intent_network)
+    elif metrics.enabled or serial:
+        # Embed then predict one batch at a time, so the latency of each step can be told apart
+        batches = (realtime_documents[index] for index in range(len(realtime_documents)))
+        predictions_bundle = predict_on_batches(batches, abusive_intent_network)
+    else:
+        # Batch buffers are only reused once Keras is done with them, as the pool is sized from the queue (see
+        # get_pool_size)
+        predictions_bundle = abusive_intent_network.predict_generator(
+            realtime_documents, verbose=execute_verbosity, max_queue_size=prediction_queue_size, workers=1
         )
-     ]
 
-    abusive_intent_predictions = compute_abusive_intent(intent_predictions, abuse_predictions, method)
+    abuse_predictions, intent_predictions, _ = [
+        realtime_documents.restore_order(predictions.reshape(-1)) for predictions in predictions_bundle
+    ]
+
+    abusive_intent_predictions = compute_abusive_intent(intent_predictions, abuse_predictions, method, calibrator)
+
+    if metrics.enabled:
+        sequence = realtime_documents.realtime_documents if isinstance(realtime_documents, ParallelEmbedding) \
+            else realtime_documents
+        metrics.set_gauges('embedding_cache', sequence.get_cache_statistics())
 
     return abuse_predictions, intent_predictions, abusive_intent_predictions
 
@@ -0,0 +1,68 @@
+from numpy import zeros, dtype as numpy_dtype, ndarray
+
+
+def get_pool_size(max_queue_size, workers=1):
+    """
+    Number of buffers a pool needs to feed Keras (predict_generator) without overwriting a batch still in use.
+    Batches alive at once are those queued, one being built by each worker, one held by the enqueuer while the queue
+    is full, and the one being predicted.
+
+    :param int max_queue_size: Maximum number of batches queued by Keras
+    :param int workers: Number of Keras workers building batches
+    :return int: Number of buffers
+    """
+    return max_queue_size + workers + 2
+
+
+class BatchBufferPool:
+    """ Small pool of preallocated, reused batch buffers """
+    def __init__(self, num_buffers, max_elements, embedding_dimension, dtype='float32'):
+        """
+        Round-robin pool of flat buffers, each viewed as a contiguous (documents, width, dimension) batch.
+        Buffers are handed out in turn, so num_buffers must exceed the number of batches alive at once.
+
+        :param int num_buffers: Number of buffers in the pool
+        :param int max_elements: Maximum number of token slots (documents x width) in a batch
+        :param int embedding_dimension: Dimension of the token embeddings
+        :param str dtype: Data type of the batches
+        """
+        self.num_buffers = num_buffers
+        self.max_elements = max_elements
+        self.embedding_dimension = embedding_dimension
+        self.dtype = numpy_dtype(dtype)
+
+        self.buffers = [None] * num_buffers         # Allocated on first use
+        self.used_masks = [None] * num_buffers      # Token slots holding non-zero values, per buffer
+        self.next_buffer = 0
+
+    def get_view(self, buffer_index, num_documents, width):
+        """ Views the start of a flat buffer as a contiguous batch """
+        size = num_documents * width * self.embedding_dimension
+        return self.buffers[buffer_index][:size].reshape(num_documents, width, self.embedding_dimension)
+
+    def acquire(self, num_documents, width, used_mask, zero=True):
+        """
+        Provides a batch array from the pool
+
+        :param int num_documents: Number of documents in the batch
+        :param int width: Number of token slots per document
+        :param ndarray used_mask: Boolean (num_documents, width) mask of the slots the caller will fill
+        :param bool zero: Whether the returned batch must be zeroed (False if the caller overwrites every slot)
+        :return ndarray: Batch array of shape (num_documents, width, dimension)
+        """
+        if num_documents * width > self.max_elements:
+            return zeros((num_documents, width, self.embedding_dimension), self.dtype)
+
+        buffer_index = self.next_buffer
+        self.next_buffer = (self.next_buffer + 1) % self.num_buffers
+
+        if self.buffers[buffer_index] is None:
+            self.buffers[buffer_index] = zeros(self.max_elements * self.embedding_dimension, self.dtype)
+
+        # Re-zero only the slots written by the previous user of the buffer
+        previous_mask = self.used_masks[buffer_index]
+        if zero and previous_mask is not None:
+            self.get_view(buffer_index, *previous_mask.shape)[previous_mask] = 0
+
+        self.used_masks[buffer_index] = used_mask
+        return self.get_view(buffer_index, num_documents, width)
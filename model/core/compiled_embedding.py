@@ -0,0 +1,137 @@
+from pathlib import Path
+from hashlib import blake2b
+from json import dump, load as load_json
+from numpy import load, zeros, ndarray
+from config import embedding_quantization
+from model.core.quantization import load_quantized
+from utilities.tokenized_contexts import load_strings
+
+matrix_filename = 'embeddings.npy'
+vocabulary_filename = 'vocabulary.npz'
+sources_filename = 'sources.json'
+
+
+class CompiledEmbedding:
+    """ Memory-mapped, corpus-specific embedding table compiled from a fastText model """
+    def __init__(self, directory, fallback_model=None, quantization=embedding_quantization):
+        """
+        Loads a compiled embedding table, the matrix is memory-mapped rather than read into memory
+
+        :param Path directory: Directory containing the compiled matrix and vocabulary
+        :param _FastText fallback_model: Optional fastText model used for tokens missing from the table
+        :param str quantization: Quantized table used in place of the float32 matrix, either 'float16', 'int8', or 'pq'
+            (see quantize_compiled), None for full precision [embedding_quantization in config by default]
+        """
+        self.directory = Path(directory)
+        self.fallback_model = fallback_model
+        self.quantization = quantization
+
+        tokens = load_strings(self.directory / vocabulary_filename)
+        if quantization is None:
+            self.matrix = load(self.directory / matrix_filename, mmap_mode='r')
+        else:
+            self.matrix = load_quantized(self.directory, quantization, len(tokens) + 1)
+        self.vocabulary = dict(zip(tokens.tolist(), range(1, len(tokens) + 1)))    # Row 0 is padding
+
+        self.embedding_dimension = self.matrix.shape[1]
+        self.missing_vector = zeros(self.embedding_dimension, self.matrix.dtype)
+
+    def __getstate__(self):
+        """ Pickles by reference to the directory so worker processes re-map the same file """
+        return {'directory': self.directory, 'fallback_model': None, 'quantization': self.quantization}
+
+    def __setstate__(self, state):
+        self.__init__(state['directory'], state['fallback_model'], state['quantization'])
+
+    def get_dimension(self):
+        """ Dimension of the embeddings, mirrors the fastText API """
+        return self.embedding_dimension
+
+    def get_word_vector(self, token):
+        """
+        Gets the embedding of a token, mirrors the fastText API
+
+        :param str token: Target token
+        :return ndarray: Token embedding, zeros if the token is unknown and there is no fallback model
+        """
+        row = self.vocabulary.get(token)
+        if row is not None:
+            return self.matrix[row]
+
+        if self.fallback_model is not None:
+            return self.fallback_model.get_word_vector(token)
+        return self.missing_vector
+
+
+def is_compiled(directory):
+    """ Checks whether a directory contains a compiled embedding table """
+    directory = Path(directory)
+    return (directory / matrix_filename).exists() and (directory / vocabulary_filename).exists()
+
+
+def hash_file(path, block_size=2 ** 20):
+    """ Hashes the content of a file """
+    digest = blake2b(digest_size=20)
+    with open(path, 'rb') as source_file:
+        for block in iter(lambda: source_file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def describe_file(path):
+    """ Describes a source file by its path, size, and modification time """
+    stat = Path(path).stat()
+    return {'path': str(path), 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def save_sources(directory, embedding_path, context_path):
+    """
+    Records the fastText model and the corpus a table is compiled from (see is_stale)
+
+    :param Path directory: Directory of the compiled embedding table
+    :param Path embedding_path: Path to the fastText model
+    :param Path context_path: Path to the cleaned contexts
+    """
+    sources = {
+        'embedding_model': describe_file(embedding_path),
+        'corpus': dict(describe_file(context_path), hash=hash_file(context_path)),
+    }
+    with open(Path(directory) / sources_filename, 'w') as sources_file:
+        dump(sources, sources_file, indent=2)
+
+
+def is_stale(directory, embedding_path, context_path):
+    """
+    Checks whether a compiled table is out of date with the fastText model or the corpus it is compiled from.
+    Tables without recorded sources are stale, sources that do not exist (ex. on a serving machine) are not compared.
+
+    :param Path directory: Directory of the compiled embedding table
+    :param Path embedding_path: Path to the current fastText model
+    :param Path context_path: Path to the current cleaned contexts
+    :return bool: Whether the table must be recompiled
+    """
+    sources_path = Path(directory) / sources_filename
+    if not sources_path.exists():
+        return True
+
+    with open(sources_path) as sources_file:
+        sources = load_json(sources_file)
+
+    # The model is too large to hash, so it is compared by name, size, and modification time
+    model = sources['embedding_model']
+    if Path(embedding_path).exists():
+        current = describe_file(embedding_path)
+        if Path(model['path']).name != Path(embedding_path).name \
+                or (model['size'], model['mtime']) != (current['size'], current['mtime']):
+            return True
+
+    # The corpus is only hashed if it has been modified since compilation
+    corpus = sources['corpus']
+    if Path(context_path).exists():
+        current = describe_file(context_path)
+        if current['size'] != corpus['size']:
+            return True
+        if current['mtime'] != corpus['mtime'] and hash_file(context_path) != corpus['hash']:
+            return True
+
+    return False
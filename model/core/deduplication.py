@@ -0,0 +1,43 @@
+from numpy import fromiter, maximum, flatnonzero, concatenate, int64
+from utilities.tokenized_contexts import TokenizedContexts
+
+
+def find_duplicates(contexts):
+    """
+    Finds the unique contexts of a collection, so duplicates are only embedded and predicted once
+
+    :param ndarray contexts: Array of cleaned contexts (or a TokenizedContexts, compared by token ids)
+    :return tuple: Index of the first occurrence of each unique context, unique context index of every context
+    """
+    if isinstance(contexts, TokenizedContexts):
+        tokens, offsets = contexts.tokens, contexts.offsets
+        keys = (tokens[start:end].tobytes() for start, end in zip(offsets[:-1], offsets[1:]))
+    else:
+        keys = iter(contexts)
+
+    # Unique indexes are assigned in order of first appearance
+    unique_ids = {}
+    inverse = fromiter((unique_ids.setdefault(key, len(unique_ids)) for key in keys), int64, len(contexts))
+
+    if len(inverse) == 0:
+        return inverse.copy(), inverse
+
+    running_max = maximum.accumulate(inverse)
+    first_indexes = flatnonzero(concatenate(([True], running_max[1:] > running_max[:-1])))
+    return first_indexes, inverse
+
+
+def get_duplicate_ratio(first_indexes, inverse):
+    """ Fraction of contexts that are duplicates of an earlier context """
+    return 1 - len(first_indexes) / len(inverse) if len(inverse) > 0 else 0.
+
+
+def scatter_predictions(prediction_bundle, inverse):
+    """
+    Scatters the predictions of the unique contexts back to every context
+
+    :param tuple prediction_bundle: Abuse, intent, and abusive-intent predictions of the unique contexts
+    :param ndarray inverse: Unique context index of every context (from find_duplicates)
+    :return tuple: Abuse, intent, and abusive-intent predictions of every context
+    """
+    return tuple(predictions[inverse] for predictions in prediction_bundle)
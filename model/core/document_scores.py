@@ -0,0 +1,103 @@
+from numpy import asarray, argsort, arange, flatnonzero, concatenate, append, full, empty, zeros, where, minimum, \
+    maximum, add, inf, dtype, int64, float32
+
+# Record layout of the document-level scores
+document_dtype = dtype([
+    ('document_index', int64), ('num_contexts', int64), ('max', float32), ('mean', float32), ('top_k_mean', float32)
+])
+
+
+class DocumentIndex:
+    """ Groups contexts by document (CSR-style), for segment reductions and O(1) retrieval of a document's contexts """
+    def __init__(self, document_indexes):
+        """
+        :param ndarray document_indexes: Document index of every context
+        """
+        document_indexes = asarray(document_indexes)
+        is_sorted = len(document_indexes) < 2 or bool((document_indexes[1:] >= document_indexes[:-1]).all())
+
+        # Contexts are usually saved in document order, in which case no sort is needed
+        self.order = None if is_sorted else argsort(document_indexes, kind='stable')
+        sorted_indexes = document_indexes if is_sorted else document_indexes[self.order]
+
+        starts = flatnonzero(concatenate(([True], sorted_indexes[1:] != sorted_indexes[:-1]))) \
+            if len(sorted_indexes) > 0 else arange(0)
+        self.documents = sorted_indexes[starts]
+        self.offsets = append(starts, len(sorted_indexes))
+
+        # Dense position lookup for (mostly) contiguous document indexes, otherwise a dictionary
+        self.positions, self.position_map = None, None
+        if len(self.documents) > 0 and 0 <= self.documents[0] and self.documents[-1] < 2 * len(self.documents) + 1024:
+            self.positions = full(int(self.documents[-1]) + 1, -1, int64)
+            self.positions[self.documents] = arange(len(self.documents))
+        else:
+            self.position_map = {document: position for position, document in enumerate(self.documents.tolist())}
+
+    def __len__(self):
+        return len(self.documents)
+
+    def get_counts(self):
+        """ Number of contexts of each document """
+        return self.offsets[1:] - self.offsets[:-1]
+
+    def get_position(self, document_index):
+        """ Position of a document in self.documents, -1 if it has no contexts """
+        if self.positions is not None:
+            return int(self.positions[document_index]) if 0 <= document_index < len(self.positions) else -1
+        return self.position_map.get(document_index, -1)
+
+    def get_contexts(self, document_index):
+        """
+        Gets the contexts of a document
+
+        :param int document_index: Index of the document
+        :return ndarray: Row of each of the document's contexts (empty if it has none)
+        """
+        position = self.get_position(document_index)
+        if position < 0:
+            return arange(0)
+
+        start, end = self.offsets[position], self.offsets[position + 1]
+        return arange(start, end) if self.order is None else self.order[start:end]
+
+    def get_scores(self, document_index, scores):
+        """ Gets the scores of the contexts of a document """
+        return asarray(scores)[self.get_contexts(document_index)]
+
+    def sort_values(self, values):
+        """ Orders context values by document, so each document is a contiguous segment """
+        values = asarray(values)
+        return values if self.order is None else values[self.order]
+
+    def aggregate(self, scores, top_k=3):
+        """
+        Reduces context scores to document scores with segment reductions
+
+        :param ndarray scores: Score of every context
+        :param int top_k: Number of highest context scores averaged by top_k_mean
+        :return ndarray: Records of the document index, number of contexts, and max, mean, and top-k mean scores
+        """
+        records = empty(len(self), document_dtype)
+        records['document_index'] = self.documents
+        if len(self) == 0:
+            return records
+
+        values = self.sort_values(scores).astype(float32)
+        starts, counts = self.offsets[:-1], self.get_counts()
+        records['num_contexts'] = counts
+        records['max'] = maximum.reduceat(values, starts)
+        records['mean'] = add.reduceat(values, starts, dtype=float) / counts
+
+        # Sum the k highest scores of each document, removing the current maximum of each document per pass
+        segments = arange(len(self)).repeat(counts)
+        top_sums = zeros(len(self))
+        for _ in range(min(top_k, int(counts.max()))):
+            maxima = maximum.reduceat(values, starts)
+            top_sums += where(maxima > -inf, maxima, 0)
+
+            is_max = flatnonzero(values == maxima[segments])
+            is_first = concatenate(([True], segments[is_max[1:]] != segments[is_max[:-1]]))
+            values[is_max[is_first]] = -inf
+        records['top_k_mean'] = top_sums / minimum(counts, top_k)
+
+        return records
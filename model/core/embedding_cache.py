@@ -0,0 +1,145 @@
+from collections import OrderedDict, defaultdict
+from numpy import ndarray
+from config import embedding_cache_policy, embedding_cache_entries, embedding_cache_bytes
+
+cache_policies = ('lru', 'lfu')
+
+
+class EmbeddingCache:
+    """ Bounded token embedding cache with LRU or LFU eviction and hit/miss/eviction counters """
+    def __init__(self, max_entries=None, max_bytes=None, policy='lru'):
+        """
+        Caches token embeddings up to a memory budget, a budget of None is unbounded
+
+        :param int max_entries: Maximum number of cached tokens
+        :param int max_bytes: Maximum number of bytes of cached vectors
+        :param str policy: Eviction policy, either 'lru' (least recently used) or 'lfu' (least frequently used)
+        """
+        if policy not in cache_policies:
+            raise ValueError('Invalid cache policy', policy, 'expected one of', cache_policies)
+
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.policy = policy
+
+        self.entries = OrderedDict()                # token -> vector, in recency order for LRU
+        self.frequencies = {}                       # token -> access count (LFU only)
+        self.frequency_buckets = defaultdict(OrderedDict)
+        self.min_frequency = 0
+
+        self.num_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, token):
+        return token in self.entries
+
+    def _touch(self, token):
+        """ Records an access of a cached token """
+        if self.policy == 'lru':
+            self.entries.move_to_end(token)
+            return
+
+        frequency = self.frequencies[token]
+        bucket = self.frequency_buckets[frequency]
+        del bucket[token]
+        if len(bucket) == 0:
+            del self.frequency_buckets[frequency]
+            if self.min_frequency == frequency:
+                self.min_frequency += 1
+
+        self.frequencies[token] = frequency + 1
+        self.frequency_buckets[frequency + 1][token] = None
+
+    def _evict(self):
+        """ Removes a single token according to the eviction policy """
+        if self.policy == 'lru':
+            token, vector = self.entries.popitem(last=False)
+        else:
+            bucket = self.frequency_buckets[self.min_frequency]
+            token, _ = bucket.popitem(last=False)
+            if len(bucket) == 0:
+                del self.frequency_buckets[self.min_frequency]
+                if len(self.frequency_buckets) > 0:
+                    self.min_frequency = min(self.frequency_buckets)
+
+            del self.frequencies[token]
+            vector = self.entries.pop(token)
+
+        self.num_bytes -= vector.nbytes
+        self.evictions += 1
+
+    def _over_budget(self, extra_entries=0, extra_bytes=0):
+        """ Whether the cache would exceed its budget with the additional entries and bytes """
+        if self.max_entries is not None and len(self.entries) + extra_entries > self.max_entries:
+            return True
+        return self.max_bytes is not None and self.num_bytes + extra_bytes > self.max_bytes
+
+    def get(self, token):
+        """
+        Gets the embedding of a token, if cached
+
+        :param str token: Target token
+        :return ndarray: Token embedding, None if not cached
+        """
+        vector = self.entries.get(token)
+        if vector is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._touch(token)
+        return vector
+
+    def put(self, token, vector):
+        """
+        Caches the embedding of a token, evicting other tokens if the budget is exceeded
+
+        :param str token: Target token
+        :param ndarray vector: Embedding of the token
+        """
+        if token in self.entries:
+            self.num_bytes += vector.nbytes - self.entries[token].nbytes
+            self.entries[token] = vector
+            self._touch(token)
+            return
+
+        # Make room before inserting, so a new token is never its own eviction candidate
+        while len(self.entries) > 0 and self._over_budget(1, vector.nbytes):
+            self._evict()
+
+        self.entries[token] = vector
+        self.num_bytes += vector.nbytes
+        if self.policy == 'lfu':
+            self.frequencies[token] = 1
+            self.frequency_buckets[1][token] = None
+            self.min_frequency = 1
+
+    def clear(self):
+        """ Removes all cached tokens, counters are kept """
+        self.entries.clear()
+        self.frequencies.clear()
+        self.frequency_buckets.clear()
+        self.min_frequency = 0
+        self.num_bytes = 0
+
+    def get_statistics(self):
+        """ Returns the cache counters as a dictionary """
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self.entries),
+            'bytes': self.num_bytes,
+            'hit_rate': self.hits / lookups if lookups > 0 else 0.0,
+        }
+
+
+def make_embedding_cache():
+    """ Creates an embedding cache using the budget and policy set in the config """
+    return EmbeddingCache(embedding_cache_entries, embedding_cache_bytes, embedding_cache_policy)
@@ -0,0 +1,332 @@
+from fasttext.FastText import _FastText
+from numpy import zeros, empty, fromiter, arange, unique, lexsort, argpartition, flatnonzero, int32, int64, \
+    dtype as numpy_dtype, ndarray
+from itertools import chain
+from model.core.embedding_cache import cache_policies
+
+
+class EmbeddingTable:
+    """ Token to row-id vocabulary backed by a contiguous (float32 by default) embedding matrix """
+    def __init__(self, embedding_model, initial_capacity=8192, max_entries=None, max_bytes=None, policy='lru',
+                 dtype='float32'):
+        """
+        Maintains a dense embedding matrix that grows in bulk as new tokens are seen.
+        When a batch would exceed the budget, rows of tokens not in that batch are evicted (in bulk) by the policy
+        and reused for its new tokens.
+
+        :param _FastText embedding_model: FastText embedding model
+        :param int initial_capacity: Number of matrix rows to allocate up-front
+        :param int max_entries: Maximum number of tokens in the table, None for no limit
+        :param int max_bytes: Maximum size of the matrix in bytes, None for no limit
+        :param str policy: Eviction policy, either 'lru' (least recently used) or 'lfu' (least frequently used)
+        :param str dtype: Data type of the matrix, the data type of the batches avoids a conversion when gathering
+        """
+        if policy not in cache_policies:
+            raise ValueError('Invalid cache policy', policy, 'expected one of', cache_policies)
+
+        self.embedding_model = embedding_model
+        self.policy = policy
+        self.embedding_dimension = embedding_model.get_dimension()
+        self.dtype = numpy_dtype(dtype)
+
+        row_bytes = self.embedding_dimension * self.dtype.itemsize
+        limits = [limit for limit in (max_entries, None if max_bytes is None else max_bytes // row_bytes - 1)
+                  if limit is not None]
+        self.max_entries = min(limits) if len(limits) > 0 else None
+
+        self.vocabulary = {}
+        self.matrix = zeros((max(initial_capacity, 2), self.embedding_dimension), self.dtype)
+        self.size = 1                   # Row 0 is reserved as the (zero) padding vector
+        self.frozen = False             # Frozen tables map unknown tokens to their fallback table, or the padding row
+        self.fallback_table = None      # Rows past the frozen matrix are rows of the fallback table
+
+        # Eviction state of every row, rows mapped by map_vocabulary are pinned
+        self.row_tokens = [None] * self.matrix.shape[0]
+        self.last_used = zeros(self.matrix.shape[0], int64)
+        self.frequencies = zeros(self.matrix.shape[0], int64)
+        self.pinned = zeros(self.matrix.shape[0], bool)
+        self.free_rows = []
+        self.clock = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_compiled(cls, compiled_embedding, max_entries=None, max_bytes=None, policy='lru', dtype='float32'):
+        """
+        Creates a frozen table that gathers directly from a (memory-mapped) compiled embedding.
+        Tokens missing from the compiled vocabulary are embedded by its fallback model into a bounded side table,
+        without a fallback model they are embedded as the (zero) padding vector.
+
+        :param CompiledEmbedding compiled_embedding: Compiled embedding table
+        :param int max_entries: Maximum number of tokens in the side table, None for no limit
+        :param int max_bytes: Maximum size of the side table in bytes, None for no limit
+        :param str policy: Eviction policy of the side table, either 'lru' or 'lfu'
+        :param str dtype: Data type of the side table
+        :return EmbeddingTable: Table sharing the vocabulary and matrix of the compiled embedding
+        """
+        table = cls(compiled_embedding, initial_capacity=2, policy=policy)
+        table.vocabulary = compiled_embedding.vocabulary
+        table.matrix = compiled_embedding.matrix
+        table.size = compiled_embedding.matrix.shape[0]
+        table.frozen = True
+
+        if compiled_embedding.fallback_model is not None:
+            table.fallback_table = cls(
+                compiled_embedding.fallback_model, max_entries=max_entries, max_bytes=max_bytes, policy=policy,
+                dtype=dtype
+            )
+
+        return table
+
+    def __len__(self):
+        """ Number of tokens in the vocabulary """
+        return len(self.vocabulary)
+
+    def clear(self):
+        """ Removes all tokens from the table, counters are kept """
+        self.evictions += len(self.vocabulary)
+        self.vocabulary = {}
+        self.size = 1
+        self.free_rows = []
+
+        # Start a new matrix rather than overwriting rows, so gathers already in flight stay valid
+        self.matrix = zeros(self.matrix.shape, self.dtype)
+        self.row_tokens = [None] * self.matrix.shape[0]
+        self.last_used[:], self.frequencies[:], self.pinned[:] = 0, 0, False
+
+    def get_statistics(self):
+        """ Returns the table counters as a dictionary, including the tokens of the fallback table """
+        lookups = self.hits + self.misses
+        statistics = {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self.vocabulary),
+            'bytes': self.size * (self.matrix.nbytes // self.matrix.shape[0]),
+            'hit_rate': self.hits / lookups if lookups > 0 else 0.0,
+        }
+
+        if self.fallback_table is not None:
+            fallback_statistics = self.fallback_table.get_statistics()
+            for name in ('evictions', 'entries', 'bytes'):
+                statistics[name] += fallback_statistics[name]
+            statistics['fallback_entries'] = fallback_statistics['entries']
+
+        return statistics
+
+    def get_matrices(self):
+        """ Current matrix and fallback table matrix (None without a fallback table), to capture with the ids """
+        return self.matrix, None if self.fallback_table is None else self.fallback_table.matrix
+
+    def reserve(self, num_rows):
+        """ Grows the matrix (by doubling) so that it can hold at least num_rows rows """
+        capacity = self.matrix.shape[0]
+        if num_rows <= capacity:
+            return
+
+        while capacity < num_rows:
+            capacity *= 2
+
+        matrix = zeros((capacity, self.embedding_dimension), self.dtype)
+        matrix[:self.size] = self.matrix[:self.size]
+        self.matrix = matrix
+
+        self.row_tokens.extend([None] * (capacity - len(self.row_tokens)))
+        for name in ('last_used', 'frequencies', 'pinned'):
+            state = zeros(capacity, getattr(self, name).dtype)
+            state[:self.size] = getattr(self, name)[:self.size]
+            setattr(self, name, state)
+
+    def evict(self, num_rows, batch_tokens):
+        """
+        Evicts tokens by the eviction policy, freeing their rows for reuse. Tokens of the current batch and pinned
+        tokens are never evicted.
+
+        :param int num_rows: Number of rows to free
+        :param set batch_tokens: Tokens of the current batch
+        """
+        candidates = ~self.pinned[:self.size]
+        candidates[0] = False
+        candidates[self.free_rows] = False
+        candidates[[self.vocabulary[token] for token in batch_tokens if token in self.vocabulary]] = False
+        candidates = flatnonzero(candidates)
+
+        # Rank by least recent use, or by least frequent then least recent use
+        if self.policy == 'lru':
+            ranks = self.last_used[candidates]
+        else:
+            ranks = lexsort((self.last_used[candidates], self.frequencies[candidates])).argsort()
+
+        num_rows = min(num_rows, len(candidates))
+        if num_rows == 0:
+            return
+        victims = candidates[argpartition(ranks, num_rows - 1)[:num_rows]].tolist()
+
+        for row in victims:
+            del self.vocabulary[self.row_tokens[row]]
+            self.row_tokens[row] = None
+        self.free_rows.extend(victims)
+        self.evictions += len(victims)
+
+        # Freed rows are overwritten by a copy of the matrix, so gathers already in flight stay valid
+        self.matrix = self.matrix.copy()
+
+    def add_tokens(self, tokens, pinned=False):
+        """
+        Computes embeddings for a collection of unseen tokens, filling free rows before appending to the matrix
+
+        :param list tokens: List of unique tokens not already in the vocabulary
+        :param bool pinned: Whether the tokens are exempt from eviction
+        """
+        if len(tokens) == 0:
+            return
+
+        rows = self.free_rows[:len(tokens)]
+        del self.free_rows[:len(rows)]
+
+        start, end = self.size, self.size + len(tokens) - len(rows)
+        self.reserve(end)
+        self.size = end
+        rows.extend(range(start, end))
+
+        for row, token in zip(rows, tokens):
+            self.matrix[row] = self.embedding_model.get_word_vector(token)
+            self.vocabulary[token] = row
+            self.row_tokens[row] = token
+
+        self.last_used[rows], self.frequencies[rows], self.pinned[rows] = self.clock, 0, pinned
+
+    def admit(self, batch_tokens):
+        """
+        Adds the unseen tokens of a batch in bulk, evicting if the budget would be exceeded
+
+        :param set batch_tokens: Unique tokens of the batch
+        :return int: Number of unseen tokens
+        """
+        new_tokens = [token for token in batch_tokens if token not in self.vocabulary]
+        self.clock += 1
+
+        if self.max_entries is not None:
+            overflow = len(self.vocabulary) + len(new_tokens) - self.max_entries
+            if overflow > 0:    # Evict in bulk (an eighth of the budget at least), as each eviction copies the matrix
+                self.evict(max(overflow, self.max_entries // 8), batch_tokens)
+
+        self.add_tokens(new_tokens)
+        return len(new_tokens)
+
+    def record_use(self, row_ids):
+        """ Updates the recency and frequency of the rows used by a batch, which only matter with a budget """
+        if self.max_entries is None:
+            return
+
+        rows, counts = unique(row_ids, return_counts=True)
+        self.last_used[rows] = self.clock
+        self.frequencies[rows] += counts
+
+    def map_vocabulary(self, tokens):
+        """
+        Maps an external vocabulary onto table rows, adding any unseen tokens in bulk.
+        The mapping must stay valid, so the table budget is not applied to these tokens.
+
+        :param ndarray tokens: Array of tokens, indexed by external token id
+        :return ndarray: int32 array where entry id + 1 is the table row of external token id (entry 0 is padding)
+        """
+        tokens = tokens.tolist()
+        unseen_tokens = list({token: None for token in tokens if token not in self.vocabulary})
+        if not self.frozen:
+            self.add_tokens(unseen_tokens, pinned=True)
+        elif self.fallback_table is not None:
+            self.fallback_table.add_tokens(
+                [token for token in unseen_tokens if token not in self.fallback_table.vocabulary], pinned=True
+            )
+
+        row_map = zeros(len(tokens) + 1, int32)
+        row_map[1:] = fromiter(map(self.get_lookup(), tokens), int32, len(tokens))
+        return row_map
+
+    def get_lookup(self):
+        """ Gets the function mapping a token to its row, every token must have been added """
+        vocabulary = self.vocabulary
+        if not self.frozen:
+            return vocabulary.__getitem__
+
+        if self.fallback_table is None:
+            def lookup(token):
+                return vocabulary.get(token, 0)
+        else:
+            offset, fallback_vocabulary = self.size, self.fallback_table.vocabulary
+
+            def lookup(token):
+                return vocabulary.get(token) or offset + fallback_vocabulary[token]    # Compiled rows start at 1
+        return lookup
+
+    def tokenize(self, data_subset, max_tokens, width=None):
+        """
+        Converts a batch of documents into a matrix of token ids
+
+        :param ndarray data_subset: Array of documents
+        :param int max_tokens: Maximum number of tokens taken from each document
+        :param int width: Width of the id matrix [max_tokens by default]
+        :return ndarray: int32 id matrix of shape (batch, width), padded with row 0
+        """
+        width = max_tokens if width is None else width
+        token_lists = [document.split(' ')[:max_tokens] for document in data_subset]
+
+        # Add all unseen tokens of the batch in bulk, those of a frozen table go to its fallback table
+        batch_tokens = set(chain.from_iterable(token_lists))
+        if not self.frozen:
+            num_new = self.admit(batch_tokens)
+        else:
+            unknown_tokens = {token for token in batch_tokens if token not in self.vocabulary}
+            num_new = len(unknown_tokens)
+            if self.fallback_table is not None:
+                self.fallback_table.admit(unknown_tokens)
+
+        self.hits += len(batch_tokens) - num_new
+        self.misses += num_new
+
+        lengths = fromiter(map(len, token_lists), int32, len(token_lists))
+        flat_ids = fromiter(map(self.get_lookup(), chain.from_iterable(token_lists)), int32, int(lengths.sum()))
+        if not self.frozen:
+            self.record_use(flat_ids)
+        elif self.fallback_table is not None:
+            self.fallback_table.record_use(flat_ids[flat_ids >= self.size] - self.size)
+
+        # Scatter the flat (row-major) ids into the padded matrix
+        token_ids = zeros((len(token_lists), width), int32)
+        token_ids[arange(width) < lengths[:, None]] = flat_ids
+
+        return token_ids
+
+    def gather(self, token_ids, out=None, matrix=None, fallback_matrix=None):
+        """
+        Gathers the embeddings of an id matrix
+
+        :param ndarray token_ids: Matrix of token ids
+        :param ndarray out: Optional destination array of shape token_ids.shape + (dimension,)
+        :param ndarray matrix: Matrix to gather from, captured when the ids were made [current matrix by default]
+        :param ndarray fallback_matrix: Matrix of the fallback table, captured with matrix (see get_matrices)
+        :return ndarray: Embedded data
+        """
+        matrix = self.matrix if matrix is None else matrix
+        if out is None:
+            out = empty(token_ids.shape + (self.embedding_dimension,), matrix.dtype)
+
+        if out.dtype == matrix.dtype:
+            matrix.take(token_ids, axis=0, out=out, mode='clip')
+        else:   # Ex. a compiled float32 table gathered into float64 batches
+            out[...] = matrix.take(token_ids, axis=0, mode='clip')
+
+        if self.fallback_table is not None:
+            fallback_matrix = self.fallback_table.matrix if fallback_matrix is None else fallback_matrix
+            is_fallback = token_ids >= self.size
+            if is_fallback.any():
+                out[is_fallback] = fallback_matrix.take(token_ids[is_fallback] - self.size, axis=0)
+
+        return out
+
+    def embed(self, data_subset, max_tokens, width=None):
+        """ Computes word embeddings for a batch of documents with a single gather """
+        return self.gather(self.tokenize(data_subset, max_tokens, width))
@@ -0,0 +1,178 @@
+from time import perf_counter
+from numpy import arange, zeros, full, where, minimum, flatnonzero, concatenate, unique, asarray, abs as absolute, \
+    uint32, uint64
+from numpy.random import RandomState
+from utilities.tokenized_contexts import TokenizedContexts, tokenize_contexts
+
+mersenne_prime = uint64((1 << 61) - 1)
+max_hash = uint64((1 << 32) - 1)
+shingle_multiplier = uint64(1000003)
+
+
+def choose_bands(num_permutations, threshold):
+    """
+    Picks the LSH split of the signatures whose S-curve midpoint, (1 / bands) ** (1 / rows), is closest to the threshold
+
+    :param int num_permutations: Length of the MinHash signatures
+    :param float threshold: Jaccard similarity threshold
+    :return tuple: Number of bands, number of rows per band
+    """
+    splits = [(num_permutations // rows, rows) for rows in range(1, num_permutations + 1) if num_permutations % rows == 0]
+    return min(splits, key=lambda split: abs((1 / split[0]) ** (1 / split[1]) - threshold))
+
+
+def hash_shingles(contexts, shingle_size):
+    """
+    Hashes the token shingles (n-grams) of tokenized contexts, contexts shorter than a shingle form a single shingle
+
+    :param TokenizedContexts contexts: Pre-tokenized contexts
+    :param int shingle_size: Number of tokens per shingle
+    :return tuple: uint64 array of shingle hashes, index of the context of each shingle
+    """
+    tokens = asarray(contexts.tokens).astype(uint64)
+    offsets = asarray(contexts.offsets)
+    lengths = offsets[1:] - offsets[:-1]
+
+    owners = arange(len(lengths)).repeat(lengths)
+    ends = offsets[1:][owners]
+    positions = arange(len(tokens))
+    is_start = (positions + shingle_size <= ends) | \
+        ((positions == offsets[:-1][owners]) & (lengths[owners] < shingle_size))
+
+    # Polynomial hash of each window, tokens past the end of their context are replaced by a marker
+    hashes = zeros(len(tokens), uint64)
+    for offset in range(shingle_size):
+        shifted = positions + offset
+        token = where(shifted < ends, tokens[minimum(shifted, max(len(tokens) - 1, 0))], max_hash)
+        hashes = (hashes * shingle_multiplier + token + uint64(1)) & max_hash
+
+    return hashes[is_start], owners[is_start]
+
+
+def compute_signatures(contexts, num_permutations=64, shingle_size=2, seed=0):
+    """
+    Computes the MinHash signatures of contexts over their token shingles
+
+    :param TokenizedContexts contexts: Pre-tokenized contexts
+    :param int num_permutations: Length of the signatures
+    :param int shingle_size: Number of tokens per shingle
+    :param int seed: Seed of the hash permutations
+    :return ndarray: uint32 matrix of shape (contexts, num_permutations), empty contexts have maximal signatures
+    """
+    hashes, owners = hash_shingles(contexts, shingle_size)
+    signatures = full((len(contexts), num_permutations), max_hash, uint32)
+    if len(hashes) == 0:
+        return signatures
+
+    # Shingles are ordered by context, so each context is a contiguous segment
+    starts = flatnonzero(concatenate(([True], owners[1:] != owners[:-1])))
+    segment_owners = owners[starts]
+
+    random_state = RandomState(seed)
+    multipliers = random_state.randint(1, 1 << 32, num_permutations, dtype=uint64)
+    increments = random_state.randint(0, 1 << 32, num_permutations, dtype=uint64)
+
+    for permutation in range(num_permutations):
+        permuted = (multipliers[permutation] * hashes + increments[permutation]) % mersenne_prime & max_hash
+        signatures[segment_owners, permutation] = minimum.reduceat(permuted, starts)
+
+    return signatures
+
+
+def cluster_signatures(signatures, threshold):
+    """
+    Groups contexts whose estimated Jaccard similarity is above a threshold, with LSH banding of their signatures
+
+    :param ndarray signatures: MinHash signatures of shape (contexts, permutations)
+    :param float threshold: Jaccard similarity threshold
+    :return tuple: Index of the representative (first member) of each cluster, cluster index of every context
+    """
+    num_contexts, num_permutations = signatures.shape
+    num_bands, rows = choose_bands(num_permutations, threshold)
+    parents = arange(num_contexts)
+    context_indexes = arange(num_contexts)
+
+    def find(index):
+        root = index
+        while parents[root] != root:
+            root = parents[root]
+        while parents[index] != root:
+            parents[index], index = root, parents[index]
+        return root
+
+    for band in range(num_bands):
+        band_hashes = zeros(num_contexts, uint64)
+        for column in range(band * rows, (band + 1) * rows):
+            band_hashes = band_hashes * shingle_multiplier + signatures[:, column].astype(uint64)
+
+        # Candidates share a bucket with its first member, and are kept if their signatures agree enough
+        _, first_members, buckets = unique(band_hashes, return_index=True, return_inverse=True)
+        heads = first_members[buckets]
+        candidates = flatnonzero(heads != context_indexes)
+        similarities = (signatures[candidates] == signatures[heads[candidates]]).mean(axis=1)
+
+        for candidate, head in zip(candidates[similarities >= threshold], heads[candidates[similarities >= threshold]]):
+            candidate_root, head_root = find(candidate), find(head)
+            if candidate_root != head_root:     # Earliest context becomes the root (representative)
+                parents[max(candidate_root, head_root)] = min(candidate_root, head_root)
+
+    roots = asarray([find(index) for index in range(num_contexts)], dtype=parents.dtype)
+    representatives, cluster_ids = unique(roots, return_inverse=True)
+    return representatives, cluster_ids
+
+
+def cluster_near_duplicates(contexts, threshold=0.8, num_permutations=64, shingle_size=2, seed=0):
+    """
+    Clusters near-duplicate contexts (ex. templated messages differing by a mention or number)
+
+    :param ndarray contexts: Array of cleaned contexts (or a TokenizedContexts)
+    :param float threshold: Jaccard similarity (of token shingles) above which contexts are grouped
+    :param int num_permutations: Length of the MinHash signatures
+    :param int shingle_size: Number of tokens per shingle
+    :param int seed: Seed of the hash permutations
+    :return tuple: Index of the representative (first member) of each cluster, cluster index of every context
+    """
+    if not isinstance(contexts, TokenizedContexts):
+        contexts = tokenize_contexts(list(contexts))
+
+    signatures = compute_signatures(contexts, num_permutations, shingle_size, seed)
+    return cluster_signatures(signatures, threshold)
+
+
+def evaluate_near_duplicates(contexts, labels, score_contexts, thresholds, num_permutations=64, shingle_size=2):
+    """
+    Measures the speed and accuracy trade-off of scoring one representative per near-duplicate cluster
+
+    :param ndarray contexts: Array of cleaned, labeled contexts
+    :param ndarray labels: Binary abusive intent label of each context
+    :param function score_contexts: Scores an array of contexts, (contexts) -> abusive_intent
+    :param list thresholds: Jaccard thresholds to evaluate
+    :param int num_permutations: Length of the MinHash signatures
+    :param int shingle_size: Number of tokens per shingle
+    :return list: Dictionary of results for every threshold, preceded by the results of scoring every context
+    """
+    labels = asarray(labels).astype(bool)
+
+    start = perf_counter()
+    full_scores = score_contexts(contexts)
+    results = [{
+        'threshold': None, 'seconds': perf_counter() - start, 'scored_fraction': 1.,
+        'accuracy': float(((full_scores >= .5) == labels).mean()), 'mean_absolute_drift': 0., 'changed_labels': 0.
+    }]
+
+    for threshold in thresholds:
+        start = perf_counter()
+        representatives, cluster_ids = cluster_near_duplicates(contexts, threshold, num_permutations, shingle_size)
+        scores = score_contexts(contexts[representatives])[cluster_ids]
+        seconds = perf_counter() - start
+
+        results.append({
+            'threshold': threshold,
+            'seconds': seconds,
+            'scored_fraction': len(representatives) / max(len(contexts), 1),
+            'accuracy': float(((scores >= .5) == labels).mean()),
+            'mean_absolute_drift': float(absolute(scores - full_scores).mean()),
+            'changed_labels': float(((scores >= .5) != (full_scores >= .5)).mean()),
+        })
+
+    return results
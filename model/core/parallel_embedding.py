@@ -0,0 +1,141 @@
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from multiprocessing import RawArray
+from threading import Lock
+from warnings import warn
+from numpy import frombuffer, dtype as numpy_dtype
+from config import n_threads, prefetch_batches, batch_size, max_tokens, embedding_dtype
+from model.core.realtime_embedding import RealtimeEmbedding
+from model.core.compiled_embedding import CompiledEmbedding
+
+# State of the current process pool worker
+worker_state = {}
+
+
+def get_slot_view(slot, shape, dimension):
+    """ Views the start of a flat shared slot as a contiguous batch of the given (documents, width) shape """
+    size = shape[0] * shape[1] * dimension
+    return slot[:size].reshape(shape[0], shape[1], dimension)
+
+
+def initialize_worker(embedding_model, data_source, token_budget, shared_slots):
+    """ Process pool initializer, builds a worker-local embedding sequence over the shared batch slots """
+    worker_state['sequence'] = RealtimeEmbedding(
+        embedding_model, data_source, vectorized=True, token_budget=token_budget
+    )
+    worker_state['slots'] = [frombuffer(slot, embedding_dtype) for slot in shared_slots]
+
+
+def build_batch(sequence, slots, index, slot_index, lock=None):
+    """
+    Embeds the batch at a given index into a shared slot
+
+    :param RealtimeEmbedding sequence: Embedding sequence providing the batch
+    :param list slots: List of flat batch slots
+    :param int index: Batch index
+    :param int slot_index: Index of the destination slot
+    :param Lock lock: Lock guarding the (non thread-safe) tokenization, if the sequence is shared
+    :return tuple: (documents, width) shape of the batch
+    """
+    data_subset, width = sequence.get_batch_source(index)
+
+    if lock is None:
+        token_ids = sequence.get_token_ids(data_subset, width)
+        matrices = sequence.embedding_table.get_matrices()
+    else:
+        with lock:
+            token_ids = sequence.get_token_ids(data_subset, width)
+            matrices = sequence.embedding_table.get_matrices()     # Table rows in use are never overwritten
+
+    # The gather overwrites the whole view, so slots never need to be zeroed
+    batch = get_slot_view(slots[slot_index], token_ids.shape, sequence.embedding_dimension)
+    sequence.embedding_table.gather(token_ids, batch, *matrices)
+
+    return token_ids.shape
+
+
+def build_worker_batch(index, slot_index):
+    """ Process pool task, embeds a batch into a shared slot using the worker-local sequence """
+    return build_batch(worker_state['sequence'], worker_state['slots'], index, slot_index)
+
+
+class ParallelEmbedding:
+    """ Builds the batches of a RealtimeEmbedding on a pool of workers, prefetching ahead of inference """
+    def __init__(self, realtime_documents, num_workers=n_threads, prefetch=prefetch_batches, use_processes=False):
+        """
+        Embeds batches in parallel into a ring of shared buffers (slots), handed to inference without copying.
+        Thread workers share the sequence and only serialize tokenization, the gather runs without the GIL.
+        Process workers each build their own sequence over a CompiledEmbedding, so that all workers share one
+        page-cached table. Other embedding models (ex. fastText models, which cannot be pickled, or a fastText fallback
+        model) would have to be loaded by every worker, so threads are used instead.
+
+        :param RealtimeEmbedding realtime_documents: Vectorized embedding sequence to parallelize
+        :param int num_workers: Number of embedding workers
+        :param int prefetch: Number of batches built ahead of inference (i.e. number of slots)
+        :param bool use_processes: Whether to use worker processes rather than threads
+        """
+        if realtime_documents.embedding_table is None:
+            raise ValueError('Parallel embedding requires a vectorized RealtimeEmbedding.')
+
+        embedding_model = realtime_documents.embedding_model
+        is_shareable = isinstance(embedding_model, CompiledEmbedding) and embedding_model.fallback_model is None
+        if use_processes and not is_shareable:
+            warn('Process workers require a CompiledEmbedding without a fallback model, using threads instead.')
+            use_processes = False
+
+        self.realtime_documents = realtime_documents
+        self.num_workers = num_workers
+        self.prefetch = max(prefetch, 1)
+        self.use_processes = use_processes
+
+        # Each slot holds the largest possible batch
+        dimension = realtime_documents.embedding_dimension
+        max_elements = max(batch_size * max_tokens, realtime_documents.token_budget or 0)
+        slot_bytes = max_elements * dimension * numpy_dtype(embedding_dtype).itemsize
+
+        self.shared_slots = [RawArray('b', slot_bytes) for _ in range(self.prefetch)]
+        self.slots = [frombuffer(slot, embedding_dtype) for slot in self.shared_slots]
+
+    def __len__(self):
+        return len(self.realtime_documents)
+
+    def restore_order(self, predictions):
+        """ Scatters predictions back into the order of the data source """
+        return self.realtime_documents.restore_order(predictions)
+
+    def make_executor(self):
+        """ Creates the worker pool """
+        if not self.use_processes:
+            return ThreadPoolExecutor(self.num_workers)
+
+        documents = self.realtime_documents
+        return ProcessPoolExecutor(
+            self.num_workers, initializer=initialize_worker,
+            initargs=(documents.embedding_model, documents.data_source, documents.token_budget, self.shared_slots)
+        )
+
+    def submit(self, executor, index, lock):
+        """ Schedules the batch at a given index into its slot """
+        slot_index = index % self.prefetch
+        if self.use_processes:
+            return executor.submit(build_worker_batch, index, slot_index)
+        return executor.submit(build_batch, self.realtime_documents, self.slots, index, slot_index, lock)
+
+    def __iter__(self):
+        """
+        Yields the batches in order. A yielded batch is a view of a shared slot,
+        it is only valid until the next batch is requested.
+        """
+        num_batches = len(self)
+        dimension = self.realtime_documents.embedding_dimension
+        lock = Lock()
+
+        with self.make_executor() as executor:
+            pending = [self.submit(executor, index, lock) for index in range(min(self.prefetch, num_batches))]
+
+            for index in range(num_batches):
+                shape = pending[index % self.prefetch].result()
+                yield get_slot_view(self.slots[index % self.prefetch], shape, dimension)
+
+                # The consumer is done with the slot, so refill it with the next batch
+                if index + self.prefetch < num_batches:
+                    pending[index % self.prefetch] = self.submit(executor, index + self.prefetch, lock)
@@ -0,0 +1,246 @@
+from pathlib import Path
+from time import perf_counter
+from numpy import asarray, empty, zeros, arange, bincount, multiply, rint, abs as absolute, sqrt, where, load, \
+    savez, float16, float32, int8, int32, uint8
+from numpy.random import RandomState
+
+quantization_methods = ['float16', 'int8', 'pq']
+num_centroids = 256     # Product quantization centroids per subspace, so each code is a single byte
+
+
+def get_quantized_paths(directory, method):
+    """ Paths of the codes and of the parameters (scales or codebook) of a quantized table """
+    directory = Path(directory)
+    return directory / ('embeddings_' + method + '.npy'), directory / ('quantization_' + method + '.npz')
+
+
+def is_quantized(directory, method):
+    """ Checks whether a compiled embedding table has been quantized with a method """
+    return all(path.exists() for path in get_quantized_paths(directory, method))
+
+
+def assign_centroids(points, centroids):
+    """ Index of the nearest centroid (squared euclidean distance) of each point """
+    distances = (centroids ** 2).sum(axis=1) - 2 * points @ centroids.T
+    return distances.argmin(axis=1)
+
+
+def train_codebook(matrix, subvector_size=4, sample_size=16384, iterations=15, seed=0):
+    """
+    Trains a product quantization codebook with k-means on each subspace of a sample of embedding rows
+
+    :param ndarray matrix: Embedding matrix, row 0 is the padding vector
+    :param int subvector_size: Number of dimensions per subspace
+    :param int sample_size: Number of rows the centroids are fitted to
+    :param int iterations: Number of k-means iterations
+    :param int seed: Seed of the row sample and of the initial centroids
+    :return ndarray: float32 codebook of shape (subspaces, 256, subvector_size), centroid 0 of every subspace is zero
+    """
+    num_rows, dimension = matrix.shape
+    if dimension % subvector_size != 0:
+        raise ValueError('The embedding dimension must be a multiple of the subvector size.')
+
+    random_state = RandomState(seed)
+    rows = 1 + random_state.choice(num_rows - 1, min(sample_size, num_rows - 1), replace=False)
+    sample = asarray(matrix[sorted(rows)], float32)
+
+    # Centroid 0 is kept at zero, so the padding row is restored exactly
+    codebook = zeros((dimension // subvector_size, num_centroids, subvector_size), float32)
+    trained = num_centroids - 1
+
+    for subspace in range(len(codebook)):
+        points = sample[:, subspace * subvector_size:(subspace + 1) * subvector_size]
+        centroids = points[random_state.choice(len(points), trained, replace=len(points) < trained)].copy()
+
+        for _ in range(iterations):
+            assignments = assign_centroids(points, centroids)
+            counts = bincount(assignments, minlength=trained)
+
+            non_empty = counts > 0     # Empty clusters keep their centroid
+            for column in range(subvector_size):
+                sums = bincount(assignments, weights=points[:, column], minlength=trained)
+                centroids[non_empty, column] = sums[non_empty] / counts[non_empty]
+
+        codebook[subspace, 1:] = centroids
+
+    return codebook
+
+
+def encode_rows(rows, method, codebook=None):
+    """
+    Quantizes embedding rows
+
+    :param ndarray rows: float32 embedding rows
+    :param str method: Either 'float16', 'int8' (scaled per row), or 'pq' (product quantization)
+    :param ndarray codebook: Product quantization codebook (see train_codebook)
+    :return tuple: Codes of the rows, their int8 scales (None for other methods)
+    """
+    rows = asarray(rows, float32)
+
+    if method == 'float16':
+        return rows.astype(float16), None
+    if method == 'int8':
+        scales = absolute(rows).max(axis=1) / 127
+        codes = rint(rows / where(scales > 0, scales, 1)[:, None]).clip(-127, 127).astype(int8)
+        return codes, scales.astype(float32)
+    if method == 'pq':
+        subvector_size = codebook.shape[2]
+        codes = empty((len(rows), len(codebook)), uint8)
+        for subspace, centroids in enumerate(codebook):
+            points = rows[:, subspace * subvector_size:(subspace + 1) * subvector_size]
+            codes[:, subspace] = assign_centroids(points, centroids)
+        return codes, None
+
+    raise ValueError('Unknown quantization method ' + str(method) + ', expected one of ' + str(quantization_methods))
+
+
+class QuantizedMatrix:
+    """ Quantized embedding matrix, rows are dequantized to float32 as they are gathered """
+    def __init__(self, method, codes, scales=None, codebook=None):
+        """
+        Mirrors the parts of the ndarray interface used on embedding matrices (shape, take, row indexing),
+        so it can stand in for the float32 matrix of a compiled embedding
+
+        :param str method: Either 'float16', 'int8', or 'pq'
+        :param ndarray codes: Codes of each row (memory-mapped when loaded)
+        :param ndarray scales: Scale of each row ('int8')
+        :param ndarray codebook: Product quantization codebook ('pq')
+        """
+        self.method = method
+        self.codes = codes
+        self.scales = scales
+        self.codebook = codebook
+
+        if method == 'pq':
+            num_subspaces, centroids, subvector_size = codebook.shape
+            self.shape = (codes.shape[0], num_subspaces * subvector_size)
+
+            # Each subspace's codes are offset into the flattened codebook, so all subvectors are gathered at once
+            self.flat_codebook = codebook.reshape(-1, subvector_size)
+            self.code_offsets = arange(num_subspaces, dtype=int32) * centroids
+        else:
+            self.shape = codes.shape
+
+        self.dtype = float32().dtype
+        self.nbytes = sum(array.nbytes for array in (codes, scales, codebook) if array is not None)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, row):
+        """ Dequantizes a row """
+        return self.take(asarray([row]))[0]
+
+    def __array__(self, dtype=None, copy=None):
+        """ Dequantizes the full matrix """
+        matrix = self.take(arange(len(self)))
+        return matrix if dtype is None else matrix.astype(dtype)
+
+    def take(self, indices, axis=0, out=None, mode='clip'):
+        """
+        Gathers dequantized rows, mirrors ndarray.take along the rows
+
+        :param ndarray indices: Array of row indexes
+        :param int axis: Must be 0
+        :param ndarray out: float32 destination of shape indices.shape + (dimension,), ex. a batch buffer
+        :param str mode: How out of range indexes are handled, see ndarray.take
+        :return ndarray: Dequantized rows
+        """
+        if axis != 0:
+            raise ValueError('Quantized matrices can only be gathered along their rows.')
+
+        indices = asarray(indices)
+        if out is None:
+            out = empty(indices.shape + (self.shape[1],), float32)
+
+        codes = self.codes.take(indices, axis=0, mode=mode)
+        if self.method == 'float16':
+            out[...] = codes
+        elif self.method == 'int8':
+            multiply(codes, self.scales.take(indices, mode=mode)[..., None], out=out)
+        else:
+            subvectors = out.reshape(indices.shape + self.codebook.shape[::2]) if out.flags.c_contiguous else None
+            if subvectors is None:
+                out[...] = self.flat_codebook.take(codes + self.code_offsets, axis=0).reshape(out.shape)
+            else:
+                self.flat_codebook.take(codes + self.code_offsets, axis=0, out=subvectors)
+
+        return out
+
+
+def load_quantized(directory, method, num_rows=None):
+    """
+    Loads a quantized table saved by quantize_compiled, the codes are memory-mapped
+
+    :param Path directory: Directory of the compiled embedding table
+    :param str method: Quantization method
+    :param int num_rows: Number of rows of the compiled table (vocabulary and padding) [not checked by default]
+    :return QuantizedMatrix: Quantized matrix
+    """
+    codes_path, parameters_path = get_quantized_paths(directory, method)
+    if not is_quantized(directory, method):
+        raise FileNotFoundError('No ' + method + ' table in ' + str(directory) + ', run compile_embeddings.py first.')
+
+    codes = load(codes_path, mmap_mode='r')
+    if num_rows is not None and codes.shape[0] != num_rows:
+        raise ValueError(
+            'The ' + method + ' table in ' + str(directory) + ' has ' + str(codes.shape[0]) + ' rows rather than '
+            + str(num_rows) + ', it is out of date, run compile_embeddings.py again.'
+        )
+
+    parameters = load(parameters_path)
+    return QuantizedMatrix(
+        method, codes,
+        scales=parameters['scales'] if 'scales' in parameters else None,
+        codebook=parameters['codebook'] if 'codebook' in parameters else None
+    )
+
+
+def save_quantization_parameters(path, scales=None, codebook=None):
+    """ Saves the scales or codebook of a quantized table """
+    parameters = {name: value for name, value in (('scales', scales), ('codebook', codebook)) if value is not None}
+    savez(path, **parameters)
+
+
+def evaluate_quantization(score_contexts, reference_embedding, quantized_embeddings, num_rows=10000, seed=0):
+    """
+    Measures the size of quantized embedding tables and the change of their predictions from the full precision table
+
+    :param function score_contexts: Scores the evaluation contexts, (embedding_model) -> (abuse, intent, abusive_intent)
+    :param CompiledEmbedding reference_embedding: Full precision (float32) compiled embedding
+    :param dict quantized_embeddings: Quantized compiled embeddings, keyed by method
+    :param int num_rows: Number of table rows the reconstruction error is measured on
+    :param int seed: Seed of the sampled rows
+    :return list: Dictionary of results for every method, preceded by the results of the full precision table
+    """
+    reference_matrix = reference_embedding.matrix
+    rows = RandomState(seed).randint(0, len(reference_matrix), min(num_rows, len(reference_matrix)))
+    reference_rows = asarray(reference_matrix[rows], float32)
+
+    start = perf_counter()
+    reference_bundle = score_contexts(reference_embedding)
+    results = [{'method': None, 'seconds': perf_counter() - start, 'bytes': reference_matrix.nbytes}]
+
+    for method, embedding in quantized_embeddings.items():
+        start = perf_counter()
+        bundle = score_contexts(embedding)
+        seconds = perf_counter() - start
+
+        squared_error = ((embedding.matrix.take(rows) - reference_rows) ** 2).sum()
+        result = {
+            'method': method,
+            'seconds': seconds,
+            'bytes': embedding.matrix.nbytes,
+            'compression': reference_matrix.nbytes / embedding.matrix.nbytes,
+            'relative_error': float(sqrt(squared_error / max((reference_rows ** 2).sum(), 1e-12))),
+        }
+
+        for name, predictions, reference in zip(('abuse', 'intent', 'abusive_intent'), bundle, reference_bundle):
+            drift = absolute(predictions - reference)
+            result[name + '_mean_drift'] = float(drift.mean())
+            result[name + '_max_drift'] = float(drift.max())
+            result[name + '_changed_labels'] = float(((predictions >= .5) != (reference >= .5)).mean())
+
+        results.append(result)
+
+    return results
@@ -1,26 +1,60 @@
 from fasttext.FastText import _FastText
 from tensorflow.keras.utils import Sequence
-from numpy import zeros, ones, ndarray, abs
-from config import batch_size, max_tokens
+from numpy import zeros, ones, ndarray, abs, asarray, argsort, fromiter, empty_like, arange, int32, int64
+from config import batch_size, max_tokens, vectorized_embedding, embedding_cache_entries, embedding_cache_bytes, \
+    token_budget as default_token_budget, embedding_dtype, reuse_batch_buffers, prediction_queue_size, \
+    embedding_cache_policy
+from model.core.batch_buffers import BatchBufferPool, get_pool_size
+from utilities.tokenized_contexts import TokenizedContexts
+from model.core.embedding_table import EmbeddingTable
+from model.core.embedding_cache import make_embedding_cache
+from model.core.compiled_embedding import CompiledEmbedding
 from math import ceil
 
 
 class RealtimeEmbedding(Sequence):
     """ Extends TensorFlow Sequence to provide on-the-fly fastText token embedding """
-    def __init__(self, embedding_model, data_source, labels=None, uniform_weights=False):
+    def __init__(self, embedding_model, data_source, labels=None, uniform_weights=False,
+                 vectorized=vectorized_embedding, embedding_cache=None, token_budget=default_token_budget,
+                 embedding_table=None):
         """
         Implements Keras data sequence for on-the-fly embedding generation
 
-        :param _FastText embedding_model: FastText embedding model
-        :param ndarray data_source: List of documents to embed on the fly
+        :param _FastText embedding_model: FastText embedding model (or a CompiledEmbedding)
+        :param ndarray data_source: List of documents to embed on the fly (or pre-tokenized TokenizedContexts)
         :param ndarray labels: Array of data labels
         :param bool labels_in_progress: Whether passed labels should be taken as initial labels and marked
         :param bool uniform_weights: Whether weights should be uniform (i.e. 1)
+        :param bool vectorized: Whether batches are built with a single gather from a dense embedding table
+        :param EmbeddingCache embedding_cache: Token embedding cache [bounded cache from config by default]
+        :param int token_budget: When set, predictions are made on length-sorted batches of at most this many
+            (padded) tokens, each padded only to its longest context. Requires a model with a variable time axis.
+        :param EmbeddingTable embedding_table: Existing embedding table to reuse (ex. across chunks of a dataset)
         """
 
         self.embedding_model = embedding_model
         self.embedding_dimension = embedding_model.get_dimension()
-        self.embedding_cache = {}
+        self.embedding_cache = make_embedding_cache() if embedding_cache is None else embedding_cache
+
+        # Pre-tokenized contexts can only be embedded through the table
+        is_tokenized = isinstance(data_source, TokenizedContexts)
+        vectorized = vectorized or is_tokenized
+
+        self.embedding_table = embedding_table
+        if self.embedding_table is None and vectorized:
+            if isinstance(embedding_model, CompiledEmbedding):
+                self.embedding_table = EmbeddingTable.from_compiled(
+                    embedding_model, embedding_cache_entries, embedding_cache_bytes, embedding_cache_policy,
+                    embedding_dtype
+                )
+            else:
+                self.embedding_table = EmbeddingTable(
+                    embedding_model, max_entries=embedding_cache_entries, max_bytes=embedding_cache_bytes,
+                    policy=embedding_cache_policy, dtype=embedding_dtype
+                )
+
+        # Table row of each pre-tokenized vocabulary id
+        self.token_row_map = self.embedding_table.map_vocabulary(data_source.vocabulary) if is_tokenized else None
 
         self.data_source = data_source
         self.working_data_source = self.data_source
@@ -36,6 +70,46 @@ class RealtimeEmbedding(Sequence):
         self.uniform_weights = uniform_weights
         self.data_length = ceil(len(self.working_data_source) / batch_size)
 
+        # Reused batch buffers, large enough for either a fixed-size or a token budget batch
+        self.buffer_pool = None
+        if reuse_batch_buffers:
+            self.buffer_pool = BatchBufferPool(
+                get_pool_size(prediction_queue_size), max(batch_size * max_tokens, token_budget or 0),
+                self.embedding_dimension, embedding_dtype
+            )
+
+        # Length-bucketed batching (prediction only)
+        self.token_budget = token_budget
+        self.sorted_order = None
+        self.token_counts = None
+        self.batch_bounds = None
+        if token_budget is not None and is_tokenized:
+            self.token_counts = data_source.get_lengths().clip(max=max_tokens).astype(int32)
+        elif token_budget is not None:
+            self.data_source = asarray(data_source, dtype=object)
+            self.token_counts = fromiter(
+                (min(len(document.split(' ')), max_tokens) for document in self.data_source),
+                int32, len(self.data_source)
+            )
+
+        if token_budget is not None:
+            self.sorted_order = argsort(self.token_counts, kind='stable')
+            self.batch_bounds = compute_budget_batches(self.token_counts[self.sorted_order], token_budget)
+
+    def restore_order(self, predictions):
+        """
+        Scatters predictions made on (length-sorted) batches back into the order of the data source
+
+        :param ndarray predictions: Vector of predictions in batch order
+        :return ndarray: Vector of predictions aligned with the data source
+        """
+        if self.sorted_order is None:
+            return predictions
+
+        restored = empty_like(predictions)
+        restored[self.sorted_order] = predictions
+        return restored
+
     def update_labels(self, new_labels):
         """ Updates the labels being fed """
         self.labels = new_labels.copy()
@@ -78,35 +152,88 @@ class RealtimeEmbedding(Sequence):
 
         return weights
 
-    def embed_data(self, data_subset):
-        """ Computes word embeddings for provided data subset """
+    def allocate_batch(self, used_mask, zero=True):
+        """ Gets a batch array for the token slots in used_mask, from the buffer pool when enabled """
+        if self.buffer_pool is not None:
+            return self.buffer_pool.acquire(*used_mask.shape, used_mask, zero)
+
+        return zeros(used_mask.shape + (self.embedding_dimension,), embedding_dtype)
+
+    def get_token_ids(self, data_subset, width=max_tokens):
+        """ Converts a data subset into a matrix of embedding table rows (vectorized mode only) """
+        if self.token_row_map is not None:
+            return self.token_row_map[data_subset.token_matrix(max_tokens, width)]
+
+        return self.embedding_table.tokenize(data_subset, max_tokens, width)
+
+    def embed_data(self, data_subset, width=max_tokens):
+        """ Computes word embeddings for provided data subset, padded to width tokens """
+        if self.embedding_table is not None:
+            token_ids = self.get_token_ids(data_subset, width)
+
+            # The gather overwrites every slot (padding gathers the zero row), so no zeroing is needed
+            return self.embedding_table.gather(token_ids, self.allocate_batch(token_ids != 0, zero=False))
+
+        # Split documents into tokens and limit
+        token_lists = [document.split(' ')[:max_tokens] for document in data_subset]
+        lengths = fromiter(map(len, token_lists), int32, len(token_lists))
+
         # Initialize embedding of data
-        embedded_data = zeros((data_subset.shape[0], max_tokens, self.embedding_dimension), float)
+        embedded_data = self.allocate_batch(arange(width) < lengths[:, None])
 
         # Embed all documents
-        for doc_index, document in enumerate(data_subset):
-            document_tokens = document.split(' ')[:max_tokens]  # Split document into tokens and limit
-
+        for doc_index, document_tokens in enumerate(token_lists):
             # For each token in document
             for token_index, token in enumerate(document_tokens):
                 # If token embedding is not already cached, compute it and store
-                if token not in self.embedding_cache:
-                    self.embedding_cache[token] = self.embedding_model.get_word_vector(token)
+                embedding = self.embedding_cache.get(token)
+                if embedding is None:
+                    embedding = self.embedding_model.get_word_vector(token)
+                    self.embedding_cache.put(token, embedding)
 
                 # Add embedding to array
-                embedded_data[doc_index, token_index] = self.embedding_cache[token]
+                embedded_data[doc_index, token_index] = embedding
 
         return embedded_data
 
+    def get_cache_statistics(self):
+        """ Returns the hit, miss, and eviction counters of the active embedding cache """
+        if self.embedding_table is not None:
+            return self.embedding_table.get_statistics()
+        return self.embedding_cache.get_statistics()
+
     def __len__(self):
         """ Overrides length method to compute the length in batches """
         if self.is_training:
             return self.data_length
+        if self.batch_bounds is not None:
+            return len(self.batch_bounds) - 1
 
         return ceil(len(self.data_source) / batch_size)
 
+    def get_batch_source(self, index):
+        """
+        Provides the (un-embedded) prediction batch at a given index
+
+        :param int index: Batch index
+        :return tuple: Data subset of the batch, number of tokens the batch is padded to
+        """
+        if self.batch_bounds is None:
+            batch_start = int(index * batch_size)
+            return self.data_source[batch_start:batch_start + batch_size], max_tokens
+
+        batch_start, batch_end = self.batch_bounds[index], self.batch_bounds[index + 1]
+        batch_indexes = self.sorted_order[batch_start:batch_end]
+
+        # Contexts are sorted by length, so the last one is the longest in the batch
+        width = max(int(self.token_counts[batch_indexes[-1]]), 1)
+        return self.data_source[batch_indexes], width
+
     def __getitem__(self, index):
         """ Provides the batch of data at a given index """
+        if not self.is_training:
+            return self.embed_data(*self.get_batch_source(index))
+
         batch_start = int(index * batch_size)
         batch_end = batch_start + batch_size
 
@@ -141,3 +268,25 @@ def compute_sample_weights(labels, midpoint=0.5):
     """
 
     return 2 * abs(labels - midpoint)
+
+
+def compute_budget_batches(sorted_counts, token_budget):
+    """
+    Splits length-sorted contexts into batches whose padded size (count x longest) fits in a token budget
+
+    :param ndarray sorted_counts: Token counts of the contexts in ascending order
+    :param int token_budget: Maximum number of (padded) tokens per batch
+    :return ndarray: Batch boundaries, batch i spans [bounds[i], bounds[i + 1])
+    """
+    bounds = [0]
+    batch_start = 0
+    for index, count in enumerate(sorted_counts.tolist()):
+        # Every batch holds at least one context, even if it alone exceeds the budget
+        if index > batch_start and (index - batch_start + 1) * max(count, 1) > token_budget:
+            bounds.append(index)
+            batch_start = index
+
+    if len(sorted_counts) > 0:
+        bounds.append(len(sorted_counts))
+
+    return asarray(bounds, dtype=int64)
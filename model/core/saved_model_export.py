@@ -0,0 +1,145 @@
+import tensorflow as tf
+from keras.models import Model
+from numpy import asarray, zeros, float32
+from config import max_tokens
+from model.core.compiled_embedding import CompiledEmbedding
+
+
+def collect_subwords(embedding_model, tokens):
+    """
+    Collects the fastText character n-grams (subwords) of a collection of tokens and their vectors
+
+    :param _FastText embedding_model: FastText embedding model
+    :param list tokens: List of tokens
+    :return tuple: Array of n-grams (including the < and > word markers), float32 matrix of their vectors
+    """
+    subword_ids = {}
+    for token in tokens:
+        subwords, ids = embedding_model.get_subwords(token)
+        for subword, subword_id in zip(subwords, ids):
+            if subword != token:
+                subword_ids.setdefault(subword, subword_id)
+
+    matrix = zeros((len(subword_ids), embedding_model.get_dimension()), float32)
+    for row, subword_id in enumerate(subword_ids.values()):
+        matrix[row] = embedding_model.get_input_vector(subword_id)
+
+    return asarray(list(subword_ids), dtype=str), matrix
+
+
+class AbusiveIntentModule(tf.Module):
+    """ End-to-end, string-in abusive intent model: tokenization, embedding lookup, and network in one graph """
+    def __init__(self, abusive_intent_network, tokens, matrix, method='product', calibrator=None,
+                 subwords=None, subword_matrix=None):
+        """
+        :param Model abusive_intent_network: keras network trained to predict abuse and intent
+        :param ndarray tokens: Vocabulary, token i is row i + 1 of the matrix (row 0 is padding)
+        :param ndarray matrix: Frozen embedding matrix
+        :param str method: method used to make abusive intent predictions
+        :param CumulativeCalibrator calibrator: Fitted intent distribution, required by the 'cdf' method
+        :param ndarray subwords: Optional character n-grams used to embed out-of-vocabulary tokens
+        :param ndarray subword_matrix: Vectors of the character n-grams
+        """
+        super(AbusiveIntentModule, self).__init__()
+        if method == 'cdf' and calibrator is None:
+            raise ValueError('The cdf method requires a fitted calibrator.')
+
+        self.network = abusive_intent_network
+        self.method = method
+        self.embedding_dimension = matrix.shape[1]
+
+        self.matrix = tf.Variable(asarray(matrix, dtype=float32), trainable=False, name='embeddings')
+        self.vocabulary = tf.lookup.StaticHashTable(
+            tf.lookup.KeyValueTensorInitializer(tf.constant(tokens), tf.range(1, len(tokens) + 1, dtype=tf.int64)),
+            default_value=0
+        )
+
+        self.bin_edges, self.cumulative = None, None
+        if calibrator is not None:
+            self.bin_edges = tf.constant(calibrator.bin_edges, tf.float32)
+            self.cumulative = tf.constant(calibrator.cumulative, tf.float32)
+
+        self.subword_matrix, self.subword_lengths = None, None
+        if subwords is not None and len(subwords) > 0:
+            self.subword_matrix = tf.Variable(asarray(subword_matrix, dtype=float32), trainable=False, name='subwords')
+            self.subword_table = tf.lookup.StaticHashTable(
+                tf.lookup.KeyValueTensorInitializer(
+                    tf.constant(subwords), tf.range(len(subwords), dtype=tf.int64)
+                ), default_value=-1
+            )
+            lengths = [len(subword) for subword in subwords]
+            self.subword_lengths = range(min(lengths), max(lengths) + 1)
+
+    def embed_unknown(self, tokens):
+        """ Embeds out-of-vocabulary tokens as the mean of their known character n-gram vectors """
+        characters = tf.strings.unicode_split(tf.strings.join(['<', tokens, '>']), 'UTF-8')
+        ngrams = tf.concat([
+            tf.strings.ngrams(characters, length, separator='') for length in self.subword_lengths
+        ], axis=1)
+
+        ngram_ids = tf.ragged.map_flat_values(self.subword_table.lookup, ngrams)
+        is_known = tf.cast(ngram_ids >= 0, tf.float32)
+
+        vectors = tf.ragged.map_flat_values(
+            lambda ids, known: tf.gather(self.subword_matrix, tf.maximum(ids, 0)) * known[:, None],
+            ngram_ids, is_known
+        )
+        counts = tf.maximum(tf.reduce_sum(is_known, axis=1), 1)
+        return tf.reduce_sum(vectors, axis=1) / counts[:, None]
+
+    def combine(self, intent, abuse):
+        """ Computes abusive intent from intent and abuse, mirroring compute_abusive_intent """
+        if self.method == 'cdf':
+            bin_indexes = tf.maximum(tf.searchsorted(self.bin_edges, intent, side='right') - 1, 0)
+            return abuse * tf.gather(self.cumulative, bin_indexes)
+        if self.method == 'euclidean':
+            return tf.sqrt(intent ** 2 + abuse ** 2)
+        return intent * abuse
+
+    @tf.function(input_signature=[tf.TensorSpec([None], tf.string, name='contexts')])
+    def serve(self, contexts):
+        """ Predicts abuse, intent, and abusive intent for a batch of cleaned contexts """
+        tokens = tf.strings.split(contexts, sep=' ')[:, :max_tokens]
+        flat_tokens = tokens.flat_values
+        flat_ids = self.vocabulary.lookup(flat_tokens)
+
+        flat_vectors = tf.gather(self.matrix, flat_ids)
+        if self.subword_matrix is not None:
+            unknown = tf.where(tf.equal(flat_ids, 0))
+            flat_vectors = tf.tensor_scatter_nd_update(
+                flat_vectors, unknown, self.embed_unknown(tf.gather_nd(flat_tokens, unknown))
+            )
+
+        embedded = tokens.with_flat_values(flat_vectors).to_tensor(
+            shape=[None, max_tokens, self.embedding_dimension]
+        )
+
+        abuse, intent, _ = self.network(embedded, training=False)
+        abuse, intent = tf.reshape(abuse, [-1]), tf.reshape(intent, [-1])
+
+        return {'abuse': abuse, 'intent': intent, 'abusive_intent': self.combine(intent, abuse)}
+
+
+def export_saved_model(abusive_intent_network, compiled_embedding, target_dir, method='product', calibrator=None,
+                       oov_model=None):
+    """
+    Exports a single SavedModel that takes cleaned context strings and returns the predictions
+
+    :param Model abusive_intent_network: keras network trained to predict abuse and intent
+    :param CompiledEmbedding compiled_embedding: Compiled embedding table providing the vocabulary and matrix
+    :param Path target_dir: Destination directory of the SavedModel
+    :param str method: method used to make abusive intent predictions
+    :param CumulativeCalibrator calibrator: Fitted intent distribution, required by the 'cdf' method
+    :param _FastText oov_model: Optional fastText model whose subword vectors embed out-of-vocabulary tokens
+    """
+    tokens = sorted(compiled_embedding.vocabulary, key=compiled_embedding.vocabulary.get)
+
+    subwords, subword_matrix = None, None
+    if oov_model is not None:
+        subwords, subword_matrix = collect_subwords(oov_model, tokens)
+
+    module = AbusiveIntentModule(
+        abusive_intent_network, asarray(tokens, dtype=str), compiled_embedding.matrix, method, calibrator,
+        subwords, subword_matrix
+    )
+    tf.saved_model.save(module, str(target_dir), signatures={'serving_default': module.serve})
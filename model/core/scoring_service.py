@@ -0,0 +1,184 @@
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from queue import Queue, Empty
+from threading import Thread, Lock
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from time import perf_counter
+from json import loads, dumps
+from numpy import asarray, percentile
+
+
+class MicroBatcher:
+    """ Collects concurrent scoring requests into micro-batches bounded in size and waiting time """
+    def __init__(self, score_contexts, max_batch_size=256, max_wait=0.01, history_size=1000):
+        """
+        :param function score_contexts: Scores an array of contexts, (contexts) -> (abuse, intent, abusive_intent)
+        :param int max_batch_size: Maximum number of contexts per micro-batch
+        :param float max_wait: Maximum time (in seconds) the first request of a batch waits for others to join
+        :param int history_size: Number of recent batches kept for the latency and size metrics
+        """
+        self.score_contexts = score_contexts
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+
+        self.requests = Queue()
+        self.metrics_lock = Lock()
+        self.batch_latencies = deque(maxlen=history_size)
+        self.batch_sizes = deque(maxlen=history_size)
+        self.num_requests = 0
+        self.num_batches = 0
+
+        self.worker = Thread(target=self.run, daemon=True)
+        self.worker.start()
+
+    def submit(self, contexts):
+        """
+        Queues contexts for scoring
+
+        :param list contexts: List of contexts
+        :return Future: Future resolving to a tuple of abuse, intent, and abusive-intent predictions
+        """
+        result = Future()
+        self.requests.put((list(contexts), result))
+        return result
+
+    def collect_batch(self):
+        """ Blocks for a first request then gathers more until the batch is full or the wait expires """
+        batch = [self.requests.get()]
+        num_contexts = len(batch[0][0])
+        deadline = perf_counter() + self.max_wait
+
+        while num_contexts < self.max_batch_size:
+            remaining = deadline - perf_counter()
+            if remaining <= 0:
+                break
+
+            try:
+                request = self.requests.get(timeout=remaining)
+            except Empty:
+                break
+
+            batch.append(request)
+            num_contexts += len(request[0])
+
+        return batch
+
+    def run(self):
+        """ Scores micro-batches until the process exits """
+        while True:
+            batch = self.collect_batch()
+            contexts = asarray([context for request_contexts, _ in batch for context in request_contexts], dtype=object)
+
+            start = perf_counter()
+            try:
+                prediction_bundle = self.score_contexts(contexts) if len(contexts) > 0 else ([], [], [])
+            except Exception as error:
+                for _, result in batch:
+                    result.set_exception(error)
+                continue
+            latency = perf_counter() - start
+
+            # Scatter the batch predictions back to each request
+            offset = 0
+            for request_contexts, result in batch:
+                end = offset + len(request_contexts)
+                result.set_result(tuple(predictions[offset:end] for predictions in prediction_bundle))
+                offset = end
+
+            with self.metrics_lock:
+                self.batch_latencies.append(latency)
+                self.batch_sizes.append(len(contexts))
+                self.num_requests += len(batch)
+                self.num_batches += 1
+
+    def get_metrics(self):
+        """ Returns the queue depth and recent batch latency (in seconds) and size metrics """
+        with self.metrics_lock:
+            latencies = asarray(self.batch_latencies)
+            sizes = asarray(self.batch_sizes)
+            metrics = {
+                'queue_depth': self.requests.qsize(),
+                'requests': self.num_requests,
+                'batches': self.num_batches,
+            }
+
+        if len(latencies) > 0:
+            metrics['batch_latency'] = {
+                'mean': float(latencies.mean()),
+                'p50': float(percentile(latencies, 50)),
+                'p95': float(percentile(latencies, 95)),
+                'max': float(latencies.max()),
+            }
+            metrics['batch_size'] = {'mean': float(sizes.mean()), 'max': int(sizes.max())}
+
+        return metrics
+
+
+def make_request_handler(batcher, timeout=30):
+    """
+    Creates an HTTP request handler scoring contexts through a micro-batcher.
+    POST /score with {"contexts": [...]} returns the abuse, intent, and abusive_intent scores of each context,
+    GET /metrics returns the batcher metrics.
+
+    :param MicroBatcher batcher: Micro-batcher scoring the contexts
+    :param float timeout: Maximum time (in seconds) to wait for the scores of a request
+    :return type: Request handler class
+    """
+    class ScoringRequestHandler(BaseHTTPRequestHandler):
+        def send_json(self, status, content):
+            body = dumps(content).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path != '/metrics':
+                return self.send_json(404, {'error': 'Unknown path.'})
+            self.send_json(200, batcher.get_metrics())
+
+        def do_POST(self):
+            if self.path != '/score':
+                return self.send_json(404, {'error': 'Unknown path.'})
+
+            try:
+                request = loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                contexts = request['contexts']
+                if not isinstance(contexts, list) or not all(isinstance(context, str) for context in contexts):
+                    raise TypeError('Expected contexts to be a list of strings.')
+            except (ValueError, KeyError, TypeError) as error:
+                return self.send_json(400, {'error': str(error)})
+
+            try:
+                abuse, intent, abusive_intent = batcher.submit(contexts).result(timeout)
+            except FutureTimeoutError:
+                return self.send_json(503, {'error': 'Scoring timed out, the service is overloaded.'})
+            except Exception as error:
+                return self.send_json(500, {'error': repr(error)})
+
+            self.send_json(200, {
+                'abuse': [float(value) for value in abuse],
+                'intent': [float(value) for value in intent],
+                'abusive_intent': [float(value) for value in abusive_intent],
+            })
+
+        def log_message(self, *args):
+            pass    # Keep the console quiet, metrics are available through /metrics
+
+    return ScoringRequestHandler
+
+
+def serve_scores(batcher, host='127.0.0.1', port=8080):
+    """
+    Serves scoring requests until interrupted
+
+    :param MicroBatcher batcher: Micro-batcher scoring the contexts
+    :param str host: Host to bind to [local only by default]
+    :param int port: Port to listen on
+    """
+    server = ThreadingHTTPServer((host, port), make_request_handler(batcher))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
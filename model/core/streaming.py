@@ -0,0 +1,138 @@
+from heapq import heappush, heappushpop
+from numpy import ndarray
+from utilities import append_vector, PredictionStoreWriter
+from utilities.pre_processing import runtime_clean
+from model.core.realtime_embedding import RealtimeEmbedding
+from model.core.abusive_intent_network import predict_abusive_intent
+from model.core.deduplication import find_duplicates, scatter_predictions
+from model.core.near_duplicates import cluster_near_duplicates
+
+
+class TopContexts:
+    """ Keeps the K contexts with the highest abusive intent seen so far in a bounded min-heap """
+    def __init__(self, sample_size):
+        """
+        :param int sample_size: Number of contexts to keep (K)
+        """
+        self.sample_size = sample_size
+        self.heap = []
+
+    def push(self, prediction_bundle, contexts, offset=0):
+        """
+        Offers a chunk of predictions to the heap
+
+        :param tuple prediction_bundle: Tuple of abuse, intent, and abusive-intent predictions of the chunk
+        :param ndarray contexts: Contexts of the chunk
+        :param int offset: Index of the first context of the chunk in the full dataset
+        """
+        abuse, intent, abusive_intent = prediction_bundle
+
+        # Only chunk members that beat the current K-th best can enter the heap
+        threshold = self.heap[0][0] if len(self.heap) == self.sample_size else None
+        candidates = (abusive_intent > threshold).nonzero()[0] if threshold is not None \
+            else range(len(abusive_intent))
+
+        for index in candidates:
+            entry = (abusive_intent[index], offset + index, abuse[index], intent[index], contexts[index])
+            if len(self.heap) < self.sample_size:
+                heappush(self.heap, entry)
+            elif entry[0] > self.heap[0][0]:
+                heappushpop(self.heap, entry)
+
+    def get_results(self):
+        """
+        Gets the kept contexts, highest abusive intent first
+
+        :return tuple: Dataset indexes, (abuse, intent, abusive-intent) dictionaries and context dictionary by index
+        """
+        entries = sorted(self.heap, reverse=True)
+        indexes = [entry[1] for entry in entries]
+
+        abusive_intent, abuse, intent, contexts = [
+            {entry[1]: entry[field] for entry in entries} for field in (0, 2, 3, 4)
+        ]
+
+        return indexes, (abuse, intent, abusive_intent), contexts
+
+
+def stream_predictions(context_chunks, embedding_model, abusive_intent_network, target_paths=None, sample_size=25,
+                       method='product', calibrator=None, deduplicate=False, store_path=None,
+                       near_duplicate_threshold=None, num_permutations=64, shingle_size=2, cluster_path=None):
+    """
+    Makes abusive intent predictions chunk by chunk, appending them to the output files as it goes.
+    Duplicates and near-duplicates are only found within a chunk.
+
+    :param Iterator context_chunks: Iterator of arrays of (un-cleaned) contexts, or of (contexts, indexes) tuples
+        where indexes is the (contexts x 2) array of their document and context indexes
+    :param _FastText embedding_model: FastText embedding model (or a CompiledEmbedding)
+    :param Model abusive_intent_network: keras network trained to predict abuse and intent
+    :param list target_paths: Paths of the abuse, intent, and abusive-intent csv outputs [not written if None]
+    :param int sample_size: Number of top abusive intent contexts to keep
+    :param str method: method used to make abusive intent predictions
+    :param CumulativeCalibrator calibrator: Pre-fitted intent distribution, so 'cdf' scores are consistent across chunks
+    :param bool deduplicate: Whether duplicate contexts within a chunk are only predicted once
+    :param Path store_path: Path of the binary prediction store (see PredictionStoreWriter) [not written if None]
+    :param float near_duplicate_threshold: Jaccard similarity above which near-duplicates are predicted once per
+        cluster [not clustered if None]
+    :param int num_permutations: Length of the MinHash signatures
+    :param int shingle_size: Number of tokens per shingle
+    :param Path cluster_path: Path of the near-duplicate cluster id csv output [not written if None]
+    :return tuple: Top abusive intent contexts of the full dataset, dictionary of the number of contexts, of unique
+        contexts, and of near-duplicate clusters
+    """
+    target_paths = [] if target_paths is None else target_paths
+    cluster_paths = [cluster_path] if cluster_path is not None and near_duplicate_threshold is not None else []
+    for path in target_paths + cluster_paths:       # Start from empty outputs
+        open(path, 'w').close()
+    store = None
+    if store_path is not None:
+        store = PredictionStoreWriter(store_path, with_clusters=near_duplicate_threshold is not None)
+
+    top_contexts = TopContexts(sample_size)
+    counts = {'contexts': 0, 'unique_contexts': 0, 'clusters': 0}
+    embedding_table, embedding_cache = None, None
+    offset = 0
+
+    for contexts in context_chunks:
+        contexts, indexes = contexts if isinstance(contexts, tuple) else (contexts, None)
+        contexts = runtime_clean(contexts)
+        unique_contexts, inverse = contexts, None
+        if deduplicate:
+            first_indexes, inverse = find_duplicates(contexts)
+            unique_contexts = contexts[first_indexes]
+        counts['unique_contexts'] += len(unique_contexts)
+
+        # Cluster ids are offset by the clusters of the previous chunks, so they are unique across the dataset
+        cluster_ids = None
+        if near_duplicate_threshold is not None:
+            representatives, representative_ids = cluster_near_duplicates(
+                unique_contexts, near_duplicate_threshold, num_permutations, shingle_size
+            )
+            unique_contexts = unique_contexts[representatives]
+            inverse = representative_ids if inverse is None else representative_ids[inverse]
+            cluster_ids = inverse + counts['clusters']
+            counts['clusters'] += len(representatives)
+
+        # Share the embedding table and cache across chunks
+        realtime_data = RealtimeEmbedding(
+            embedding_model, unique_contexts, embedding_cache=embedding_cache, embedding_table=embedding_table
+        )
+        embedding_table, embedding_cache = realtime_data.embedding_table, realtime_data.embedding_cache
+
+        prediction_bundle = predict_abusive_intent(realtime_data, abusive_intent_network, method, calibrator)
+        if inverse is not None:
+            prediction_bundle = scatter_predictions(prediction_bundle, inverse)
+        for prediction, path in zip(prediction_bundle, target_paths):
+            append_vector(prediction, path)
+        for path in cluster_paths:
+            append_vector(cluster_ids, path)
+        if store is not None:
+            store.append(prediction_bundle, indexes, cluster_ids)
+
+        top_contexts.push(prediction_bundle, contexts, offset)
+        offset += len(contexts)
+        counts['contexts'] += len(contexts)
+
+    if store is not None:
+        store.close()
+    return top_contexts, counts
@@ -13,6 +13,11 @@ def split_document(document):
     return list(filter(lambda context: len(context) > 1, contexts))
 
 
+def get_document_contexts(document):
+    """ Splits a document into its non-zero length contexts """
+    return list(filter(lambda content: len(content) > 0 or content == ' ', split_document(document)))
+
+
 def split_into_contexts(documents, original_indexes=None):
     """
     Splits documents into contexts (sentences)
@@ -27,9 +32,7 @@ def split_into_contexts(documents, original_indexes=None):
     # For each document in corpus
     for index, document in enumerate(documents):
         # Split document into non-zero length contexts
-        document_contexts = list(filter(
-            lambda content: len(content) > 0 or content == ' ', split_document(document)
-        ))
+        document_contexts = get_document_contexts(document)
 
         # Compute index of contexts and get index of the original document
         corpus_index = index if original_indexes is None else original_indexes[index]
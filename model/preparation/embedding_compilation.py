@@ -0,0 +1,107 @@
+from pathlib import Path
+from numpy import float32
+from numpy.lib.format import open_memmap
+from numpy import load, empty
+from utilities import load_data, make_dir, save_strings
+from utilities.pre_processing import runtime_clean
+from model.core.compiled_embedding import matrix_filename, vocabulary_filename, sources_filename, save_sources
+from model.core.quantization import train_codebook, encode_rows, get_quantized_paths, save_quantization_parameters, \
+    quantization_methods
+from config import max_tokens
+
+
+def collect_vocabulary(contexts):
+    """
+    Collects the set of tokens used by a collection of contexts, as tokenized during embedding
+
+    :param ndarray contexts: Array of cleaned contexts
+    :return list: Sorted list of unique tokens
+    """
+    vocabulary = set()
+    for context in contexts:
+        vocabulary.update(context.split(' ')[:max_tokens])
+
+    return sorted(vocabulary)
+
+
+def compile_embeddings(context_path, embedding_model, target_dir, embedding_path):
+    """
+    Compiles a corpus-specific embedding table from a fastText model.
+    Out-of-vocabulary tokens are resolved through fastText's subword vectors.
+
+    :param Path context_path: Path to the cleaned contexts (output of process_documents)
+    :param _FastText embedding_model: FastText embedding model
+    :param Path target_dir: Directory the matrix and vocabulary are saved to
+    :param Path embedding_path: Path the fastText model was loaded from, recorded to detect stale tables
+    :return int: Number of tokens in the compiled vocabulary
+    """
+    contexts = runtime_clean(
+        load_data(context_path, columns=['contexts'], index_col=None, dtypes={'contexts': object})['contexts'].values
+    )
+    tokens = collect_vocabulary(contexts)
+
+    target_dir = Path(target_dir)
+    make_dir(target_dir / matrix_filename)
+
+    # Sources are recorded last, so an interrupted compilation is left stale
+    sources_path = target_dir / sources_filename
+    if sources_path.exists():
+        sources_path.unlink()
+
+    # Quantized tables of the previous compilation no longer match the vocabulary
+    for method in quantization_methods:
+        for path in get_quantized_paths(target_dir, method):
+            if path.exists():
+                path.unlink()
+
+    # Write vectors straight into the on-disk matrix, row 0 is left as the zero padding vector
+    matrix = open_memmap(
+        target_dir / matrix_filename, mode='w+', dtype=float32,
+        shape=(len(tokens) + 1, embedding_model.get_dimension())
+    )
+    matrix[0] = 0
+    for row, token in enumerate(tokens, start=1):
+        matrix[row] = embedding_model.get_word_vector(token)
+    matrix.flush()
+    del matrix
+
+    save_strings(target_dir / vocabulary_filename, tokens)
+    save_sources(target_dir, embedding_path, context_path)
+    return len(tokens)
+
+
+def quantize_compiled(directory, method, subvector_size=4, chunk_rows=65536, seed=0):
+    """
+    Quantizes a compiled embedding table, the codes are written chunk by chunk next to the float32 matrix
+
+    :param Path directory: Directory of the compiled embedding table
+    :param str method: Either 'float16', 'int8' (scaled per row), or 'pq' (product quantization)
+    :param int subvector_size: Number of dimensions per product quantization code
+    :param int chunk_rows: Number of rows quantized at once
+    :param int seed: Seed of the product quantization training
+    :return int: Size of the quantized table in bytes
+    """
+    matrix = load(Path(directory) / matrix_filename, mmap_mode='r')
+    codes_path, parameters_path = get_quantized_paths(directory, method)
+
+    codebook = train_codebook(matrix, subvector_size, seed=seed) if method == 'pq' else None
+    scales = empty(len(matrix), float32) if method == 'int8' else None
+
+    codes = None
+    for start in range(0, len(matrix), chunk_rows):
+        chunk_codes, chunk_scales = encode_rows(matrix[start:start + chunk_rows], method, codebook)
+        if codes is None:
+            codes = open_memmap(
+                codes_path, mode='w+', dtype=chunk_codes.dtype, shape=(len(matrix),) + chunk_codes.shape[1:]
+            )
+
+        codes[start:start + chunk_rows] = chunk_codes
+        if scales is not None:
+            scales[start:start + chunk_rows] = chunk_scales
+
+    codes.flush()
+    num_bytes = codes.nbytes + sum(array.nbytes for array in (scales, codebook) if array is not None)
+    del codes
+
+    save_quantization_parameters(parameters_path, scales, codebook)
+    return num_bytes
@@ -0,0 +1,65 @@
+from functools import partial
+from model.preparation.pre_processing import apply_process, standard_processes
+from model.preparation.fused_processing import fused_process
+from utilities.pre_processing.html_formatting import remove_quotes, remove_quotes_reference
+
+# Storm-front style forum posts and tweets covering every stage of the standard chain
+fixture_documents = [
+    '',
+    None,
+    'Plain lowercase context without anything special',
+    'I will DESTROY them all tomorrow!!! #GoTeam #fightBACK2020',
+    'Check this out http://www.example.com/path/to?q=1&x=2 and https://t.co/AbCdEf',
+    'Broken link at the end http:/',
+    '<div style="margin:20px; margin-top:5px; ">\n<div class="smallfont" style="margin-bottom:2px">Quote:</div>\n'
+    '<table cellpadding="6" cellspacing="0" border="0" width="100%"><tr><td class="alt2" style="border:1px inset">'
+    'Originally Posted by <strong>someone</strong></td></tr></table>\n</div>They will pay for this.',
+    '<div align="right">Sent from my phone</div>We should march on them next week.',
+    '<div style="margin:20px; margin-top:5px; ">nested <div>inner</div> quote</div>After the quote.',
+    '<DIV style="margin:20px; margin-top:5px; ">upper case tag</DIV>trailing text',
+    '<div style="margin:20px; margin-top:5px;">not quite the quote style</div>kept',
+    '<div style="margin:20px; margin-top:5px; ">unclosed quote that runs to the end',
+    'Bold <b>words</b> and a line<br />break<br> with &amp; and &lt;tag&gt; entities',
+    'Entities &#8220;quoted&#8221; and an emoji &#128512; and &#1234567; left over',
+    'It’s fine, café naïve über \U0001F600',
+    'Image:my picture.png was posted (s) and [x] here',
+    'The U.S.A. and the U.K. are e.g. places',
+    'Numbers 3.5km 1st 2nd 100 and 1,000,000',
+    'Sooooo cooool!!! aaaargh___ zzz',
+    'Mixed <a href="http://bad.example.org/x">link text</a> <3 and > arrows',
+    'A & B > C < D',
+    'open <p> para',
+    'a <i>b',
+    'use <tab> key',
+    'stray </a> end',
+    '<div>unclosed div <div align="right">sig</div> and more',
+    '<b><i>mismatched</b></i> nesting <div/>self closed',
+    '<div style="margin:20px; margin-top:5px; ">quote</div><p>para <!-- comment --> and </p>',
+]
+
+
+def apply_reference_process(document):
+    """ Applies standard_processes one after another, collecting values """
+    return apply_process(document, standard_processes, collect_values=True)
+
+
+def apply_soup_reference_process(document):
+    """ Applies standard_processes one after another with the BeautifulSoup quote removal, collecting values """
+    processes = [remove_quotes_reference if process is remove_quotes else process for process in standard_processes]
+    return apply_process(document, processes, collect_values=True)
+
+
+def find_mismatches(documents, reference=apply_reference_process, candidate=partial(fused_process, collect_values=True)):
+    """
+    Compares two pre-processing functions over a set of documents, exactly as given.
+    Pass chain functions (ex. apply_reference_process) to compare the output of whole chains, or single processes
+    (ex. remove_quotes and remove_quotes_reference) to compare them on their own.
+
+    :param list documents: List of documents
+    :param function reference: Reference processing function [standard_processes by default]
+    :param function candidate: Processing function being verified [fused engine by default]
+    :return list: Indexes of the documents whose results (values or processed content) differ
+    """
+    return [
+        index for index, document in enumerate(documents) if reference(document) != candidate(document)
+    ]
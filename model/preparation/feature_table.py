@@ -0,0 +1,64 @@
+from pathlib import Path
+from numpy import asarray, arange, concatenate, savez, load, int32, int64
+
+document_index_column = 'document_index'
+
+
+class FeatureTable:
+    """ Typed columns of the values computed by the pre-processing functions, keyed by document index """
+    def __init__(self, processes):
+        """
+        :param list processes: List of pre-processing functions, columns are named from their get_header
+        """
+        self.columns = [
+            (position, header) for position, header in enumerate(process('', get_header=True) for process in processes)
+            if header is not None
+        ]
+        self.chunks = {header: [] for _, header in self.columns}
+        self.chunks[document_index_column] = []
+
+    def __len__(self):
+        return sum(map(len, self.chunks[document_index_column]))
+
+    def add(self, document_values, document_offset=0):
+        """
+        Adds the values of consecutive documents
+
+        :param list document_values: List of the process values of each document (as from apply_process)
+        :param int document_offset: Index of the first document
+        """
+        self.chunks[document_index_column].append(arange(document_offset, document_offset + len(document_values)))
+
+        for position, header in self.columns:
+            column = [values[position] for values in document_values]
+            if all(isinstance(value, str) for value in column):
+                self.chunks[header].append(asarray(column, dtype=str))
+            else:
+                self.chunks[header].append(asarray(column, dtype=int32))
+
+    def get_columns(self):
+        """ Gets the concatenated columns, as a dictionary keyed by header """
+        columns = {}
+        for header, chunks in self.chunks.items():
+            columns[header] = concatenate(chunks) if len(chunks) > 0 else asarray([], dtype=int64)
+
+        return columns
+
+    def save(self, target_path):
+        """ Saves the columns as a (numpy .npz) binary table """
+        target_path = Path(target_path)
+        target_path.parent.mkdir(parents=True, exist_ok=True)
+
+        with open(target_path, 'wb') as target_file:
+            savez(target_file, **self.get_columns())
+
+
+def load_features(path):
+    """
+    Loads a feature table saved with FeatureTable.save
+
+    :param Path path: Path to the feature table
+    :return dict: Dictionary of columns keyed by header, including the document_index column
+    """
+    with load(path) as table:
+        return {header: table[header] for header in table.files}
@@ -0,0 +1,123 @@
+from re import compile
+from html import unescape
+from string import ascii_uppercase
+from utilities.pre_processing.html_formatting import remove_quotes
+from utilities.pre_processing.hyperlinks import pull_hyperlinks, url_regex
+from utilities.pre_processing.hashtags import split_hashtags
+from utilities.pre_processing.basic_statistics import tag_regex, image_regex, bracket_regex, emoji_regex, acronym, \
+    partial_clean
+
+# Digit and repeat substitutions merged into one pass, digits take precedence as in the sequential chain
+digit_repeat_regex = compile(r'([0-9]+(\.[0-9]+)?([a-z]{2})?)|(\w)\4{2,}')
+upper_bytes = ascii_uppercase.encode('ascii')
+num_values = 14     # Number of processes in standard_processes
+
+
+def remove_acronym_periods(match):
+    return match[0].replace('.', '') + ' '
+
+
+def fused_process(document, collect_values=False):
+    """
+    Applies the standard pre-processing chain (standard_processes) with fewer passes.
+    Stages whose trigger characters are absent are skipped, and the digit and repeat substitutions share a pass.
+    Output is identical to apply_process with standard_processes.
+
+    :param str document: Contents of a document
+    :param bool collect_values: Whether the values of each process (counts, hyperlinks) are computed
+    :return tuple: List of the values of standard_processes (None if not collected), processed document content
+    """
+    if not isinstance(document, str):
+        document = ''
+
+    values = [None] * num_values if collect_values else None
+    if collect_values:
+        values[0] = len(document)
+
+    # HTML quotes (and the associated re-serialization)
+    count, document = remove_quotes(document)
+    if collect_values:
+        values[1] = count
+
+    # Special characters, HTML entities and unicode are the only non-ascii sources
+    if '&' in document:
+        document = unescape(document)
+    if not document.isascii():
+        from unidecode import unidecode     # Only loaded once a non-ascii document is seen
+        document = unidecode(document.replace('’', '\''))
+
+    if 'http' in document:
+        if collect_values:
+            values[3], document = pull_hyperlinks(document)
+        else:
+            document = url_regex.sub(' url ', document)
+    elif collect_values:
+        values[3] = ''
+
+    count = 0
+    if '<' in document:
+        document, count = tag_regex.subn(' ', document)
+    if collect_values:
+        values[4] = count
+
+    count = 0
+    if 'Image:' in document:
+        document, count = image_regex.subn(' image ', document)
+    if collect_values:
+        values[5] = count
+
+    count = 0
+    if '(' in document or '[' in document:
+        document, count = bracket_regex.subn(r'\1', document)
+    if collect_values:
+        values[6] = count
+
+    count = 0
+    if '&#' in document:
+        document, count = emoji_regex.subn(' ', document)
+    if collect_values:
+        values[7] = count
+
+    count = 0
+    if '#' in document:
+        count, document = split_hashtags(document)
+    if collect_values:
+        values[8] = count
+
+    if collect_values:
+        if document.isascii():
+            encoded = document.encode('ascii')
+            values[9] = len(encoded) - len(encoded.translate(None, upper_bytes))
+        else:
+            values[9] = sum(1 for character in document if character.isupper())
+    document = document.lower()
+
+    count = 0
+    if '.' in document:
+        document, count = acronym.subn(remove_acronym_periods, document)
+    if collect_values:
+        values[10] = count
+
+    digit_count, repeat_count = 0, 0
+
+    def replace_digit_repeat(match):
+        nonlocal digit_count, repeat_count
+        if match.group(4) is None:
+            digit_count += 1
+            return ' '
+
+        repeat_count += 1
+        return match.group(4)
+
+    document = digit_repeat_regex.sub(replace_digit_repeat, document)
+    if collect_values:
+        values[11], values[12] = digit_count, repeat_count
+
+    document = partial_clean.sub(' ', document)
+
+    return values, document
+
+
+def apply_fused_process(document):
+    """ Applies the fused standard pre-processing chain, without collecting values """
+    return fused_process(document)[1]
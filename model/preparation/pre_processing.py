@@ -1,10 +1,18 @@
 from multiprocessing import Pool
 from functools import partial
+from time import perf_counter
+from numpy import arange, fromiter, cumsum, column_stack, int64
 from config import n_threads
-from utilities import load_data
-from model.preparation.contexts import split_into_contexts
-from utilities import save_contexts
-from utilities.pre_processing import *
+from utilities import load_data, load_data_chunks, get_header
+from model.preparation.contexts import split_into_contexts, get_document_contexts
+from utilities import save_contexts, append_contexts, tokenize_contexts, ContextTokenizer
+from utilities.instrumentation import metrics, instrument_worker, collect_worker_results
+from utilities.pre_processing import original_length, remove_quotes, manage_special_characters, pull_hyperlinks, \
+    count_tags, count_images, count_bracket_text, count_emojis, split_hashtags, count_upper, count_acronym, \
+    count_digits, count_repeat_instances, run_partial_clean, final_clean
+from model.preparation.fused_processing import apply_fused_process, fused_process
+from model.preparation.feature_table import FeatureTable
+from model.preparation.pre_processing_cache import PreProcessingCache, get_chain_identity
 
 # Default set and ordering of pre-processing functions
 standard_processes = [
@@ -23,25 +31,96 @@ standard_processes = [
     count_repeat_instances,
     run_partial_clean,
 ]
+default_chunk_size = 10000  # Documents per chunk when streaming is only implied by the cache
 
 
-def apply_process(document, processes):
+def apply_process(document, processes, collect_values=False):
     """
     Applies the pre-processing filters to a document
 
     :param str document: Contents of a document
     :param list processes: A list of processes to be applied
-    :return str: Processed document content
+    :param bool collect_values: Whether to also return the values computed by each process
+    :return str: Processed document content, preceded by the list of process values if collect_values
     """
+    values = []
 
     # For each pre-processing step to be applied
     for process in processes:
-        _, document = process(document if isinstance(document, str) else '')
+        value, document = process(document if isinstance(document, str) else '')
+        values.append(value)
 
-    return document
+    return (values, document) if collect_values else document
 
 
-def process_documents(source_path, target_path, processes=None, content_index=0):
+def apply_timed_process(document, processes, collect_values=False):
+    """ apply_process, adding the time spent in each process to the metrics of the (worker) process """
+    values = []
+
+    for process in processes:
+        start = perf_counter()
+        value, document = process(document if isinstance(document, str) else '')
+        metrics.add_process_time(process.__name__, perf_counter() - start)
+        values.append(value)
+
+    return (values, document) if collect_values else document
+
+
+def prepare_document(document, processor, collect_values=False):
+    """
+    Pre-processes a document then splits it into cleaned contexts (run on the workers when streaming)
+
+    :param str document: Contents of a document
+    :param function processor: Pre-processing function, (document_content) -> processed_content
+    :param bool collect_values: Whether the processor also returns the process values (see get_processor)
+    :return list: List of contexts, cleaned with final_clean, preceded by the process values if collect_values
+    """
+    values, document = processor(document) if collect_values else (None, processor(document))
+    contexts = [final_clean(context) for context in get_document_contexts(document)]
+
+    return (values, contexts) if collect_values else contexts
+
+
+def get_processor(processes=None, fused=False, collect_values=False):
+    """
+    Gets the document pre-processing function
+
+    :param list processes: List of pre-processing functions [standard_processes by default]
+    :param bool fused: Whether to use the (equivalent) fused engine for the standard processes
+    :param bool collect_values: Whether the function also returns the process values
+    :return function: (document_content) -> processed_content, or (values, processed_content) if collect_values
+    """
+    # The fused engine has no per-process boundaries, so instrumented runs time the equivalent process chain
+    if metrics.enabled:
+        return partial(
+            apply_timed_process, processes=standard_processes if processes is None else processes,
+            collect_values=collect_values
+        )
+    if processes is None and fused:
+        return partial(fused_process, collect_values=True) if collect_values else apply_fused_process
+    return partial(
+        apply_process, processes=standard_processes if processes is None else processes, collect_values=collect_values
+    )
+
+
+def index_contexts(document_contexts, document_offset):
+    """
+    Builds the (document_index, context_index) pairs of the contexts of consecutive documents
+
+    :param list document_contexts: List of the context lists of each document
+    :param int document_offset: Index of the first document
+    :return ndarray: (contexts x 2) array of indexes
+    """
+    lengths = fromiter(map(len, document_contexts), int64, len(document_contexts))
+    starts = cumsum(lengths) - lengths
+
+    document_indexes = arange(document_offset, document_offset + len(lengths)).repeat(lengths)
+    context_indexes = arange(lengths.sum()) - starts.repeat(lengths)
+    return column_stack((document_indexes, context_indexes))
+
+
+def process_documents(source_path, target_path, processes=None, content_index=0, tokenized_path=None, fused=False,
+                      chunk_size=None, features_path=None, cache_path=None):
     """
     Pre-processes all documents within a CSV file.
 
@@ -49,17 +128,129 @@ def process_documents(source_path, target_path, processes=None, content_index=0)
     :param Path target_path: Filename for destination file
     :param list processes: List of pre-processing functions, (document_content) -> (value, modified_content)
     :param int content_index: Index of the document content
+    :param Path tokenized_path: Directory for the pre-tokenized (token id, offset, vocabulary) contexts [not saved by default]
+    :param bool fused: Whether to use the (equivalent) fused engine for the standard processes
+    :param int chunk_size: Number of documents per chunk when streaming [loads all documents by default]
+    :param Path features_path: Destination of the table of process values, collected in the same pass [not saved]
+    :param Path cache_path: Database of cached prepared documents, only unseen documents are processed [not cached]
+    :return dict: Cache hits and misses if a cache is used
     """
-    data = load_data(source_path, index_col=None).values[:, content_index]
+    collect_values = features_path is not None
+    processor = get_processor(processes, fused, collect_values)
+    chain = standard_processes if processes is None else processes
+    features = FeatureTable(chain) if collect_values else None
+
+    # The cache works on chunks, so it implies streaming
+    if chunk_size is not None or cache_path is not None:
+        cache = None
+        if cache_path is not None:
+            cache = PreProcessingCache(cache_path, get_chain_identity(chain, collect_values))
 
-    if processes is None:
-        processes = standard_processes
-    processor = partial(apply_process, processes=processes)
+        stream_documents(source_path, target_path, processor, content_index, tokenized_path,
+                         chunk_size or default_chunk_size, features, cache)
+        if features is not None:
+            features.save(features_path)
+        if cache is not None:
+            cache.close()
+            return cache.get_statistics()
+        return
+
+    content_column = get_header(source_path)[content_index]
+    data = load_data(
+        source_path, columns=[content_column], index_col=None, dtypes={content_column: object}
+    )[content_column].values
 
     workers = Pool(n_threads)                   # Define workers
-    documents = workers.map(processor, data)   # Apply processing
+    documents = workers.map(instrument_worker(processor), data)     # Apply processing
     workers.close()                             # Close document queue
     workers.join()                              # Wait for processes to finish
+    documents = list(collect_worker_results(documents))     # Merge the workers' process times when instrumented
+
+    if features is not None:
+        document_values = [values for values, _ in documents]
+        documents = [document for _, document in documents]
+        features.add(document_values)
+        features.save(features_path)
 
     contexts, indexes = split_into_contexts(documents)
+    if tokenized_path is not None:
+        contexts = list(map(final_clean, contexts))
+        tokenize_contexts(contexts).save(tokenized_path)
+
     save_contexts(contexts, indexes, target_path)
+
+
+def stream_documents(source_path, target_path, processor, content_index, tokenized_path, chunk_size, features=None,
+                     cache=None):
+    """
+    Pre-processes the documents of a CSV file chunk by chunk, appending the contexts of each chunk to the destination.
+    Workers process, split, and clean the documents, the next chunk is queued before the current one is written.
+
+    :param Path source_path: Filename for the source CSV file
+    :param Path target_path: Filename for destination file
+    :param function processor: Pre-processing function, (document_content) -> processed_content
+    :param int content_index: Index of the document content
+    :param Path tokenized_path: Directory for the pre-tokenized contexts [not saved if None]
+    :param int chunk_size: Number of documents per chunk
+    :param FeatureTable features: Table the process values are added to, the processor must collect them [optional]
+    :param PreProcessingCache cache: Cache of prepared documents, only the missing documents are sent to the workers
+    """
+    worker_chunk_size = max(chunk_size // (n_threads * 4), 1)     # Same heuristic as Pool.map
+    prepare = partial(prepare_document, processor=processor, collect_values=features is not None)
+    tokenizer = ContextTokenizer() if tokenized_path is not None else None
+    document_offset, context_offset = 0, 0
+
+    def write_chunk(results, num_documents, keys, cached, missing_keys):
+        nonlocal document_offset, context_offset
+        document_contexts = list(results)
+
+        # Store the new results then merge them with the cached ones, in document order
+        if cache is not None:
+            cache.put_many(missing_keys, document_contexts)
+            prepared = dict(zip(missing_keys, document_contexts))
+            document_contexts = [cached[key] if key in cached else prepared[key] for key in keys]
+
+        if features is not None:
+            features.add([values for values, _ in document_contexts], document_offset)
+            document_contexts = [contexts for _, contexts in document_contexts]
+        contexts = [context for contexts in document_contexts for context in contexts]
+
+        indexes = index_contexts(document_contexts, document_offset)
+        append_contexts(contexts, indexes, target_path, context_offset)
+        if tokenizer is not None:
+            tokenizer.add(contexts)
+
+        document_offset += num_documents
+        context_offset += len(contexts)
+
+    content_column = get_header(source_path)[content_index]
+    source_chunks = load_data_chunks(
+        source_path, chunk_size, columns=[content_column], index_col=None, dtypes={content_column: object}
+    )
+
+    with Pool(n_threads) as workers:
+        pending = None
+        for chunk in source_chunks:
+            data = chunk[content_column].values
+            keys, cached, missing, missing_keys = None, None, data, None
+            if cache is not None:
+                keys = [cache.make_key(document) for document in data]
+                cached = cache.get_many(keys)
+
+                # Documents repeated within the chunk are only processed once
+                missing = {key: document for document, key in zip(data, keys) if key not in cached}
+                missing_keys, missing = list(missing), list(missing.values())
+
+            results = collect_worker_results(
+                workers.imap(instrument_worker(prepare), missing, chunksize=worker_chunk_size)
+            )
+
+            if pending is not None:
+                write_chunk(*pending)
+            pending = (results, len(data), keys, cached, missing_keys)
+
+        if pending is not None:
+            write_chunk(*pending)
+
+    if tokenizer is not None:
+        tokenizer.get_tokenized().save(tokenized_path)
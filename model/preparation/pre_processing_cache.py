@@ -0,0 +1,185 @@
+from pathlib import Path
+from hashlib import blake2b
+from pickle import dumps, loads, HIGHEST_PROTOCOL
+from sqlite3 import connect
+from time import time
+from os import getpid
+from sys import modules
+from types import CodeType
+
+# Bump whenever a change to the pre-processing (or context splitting) changes its output
+processing_version = 1
+query_size = 500    # Keys per query, below the SQLite parameter limit
+
+
+def hash_code(code, code_hash):
+    """ Adds the bytecode and constants of a code object (and of the functions it defines) to a hash """
+    code_hash.update(code.co_code)
+    for constant in code.co_consts:
+        if isinstance(constant, CodeType):
+            hash_code(constant, code_hash)
+        else:
+            code_hash.update(repr(constant).encode('utf-8', 'surrogatepass'))
+
+
+def get_code_hash(processes):
+    """
+    Hashes the code of the processes along with the source of the modules defining them (ex. their regexes),
+    so editing a process changes the chain identity without bumping processing_version
+
+    :param list processes: List of pre-processing functions
+    :return str: Hex digest of the code
+    """
+    code_hash = blake2b(digest_size=8)
+    for process in processes:
+        code = getattr(process, '__code__', None)
+        if code is not None:
+            hash_code(code, code_hash)
+
+        source_path = getattr(modules.get(process.__module__), '__file__', None)
+        if source_path is not None and Path(source_path).suffix == '.py':
+            code_hash.update(Path(source_path).read_bytes())
+
+    return code_hash.hexdigest()
+
+
+def get_chain_identity(processes, collect_values=False):
+    """
+    Identifies a pre-processing chain, cached results are only shared between identical chains
+
+    :param list processes: List of pre-processing functions
+    :param bool collect_values: Whether the results include the process values
+    :return str: Identity of the chain
+    """
+    names = [process.__module__ + '.' + process.__qualname__ for process in processes]
+    return '|'.join(names + [
+        'version=' + str(processing_version), 'code=' + get_code_hash(processes), 'values=' + str(collect_values)
+    ])
+
+
+class PreProcessingCache:
+    """ On-disk cache of prepared documents, addressed by the hash of the raw document and processing chain """
+    def __init__(self, path, chain_identity):
+        """
+        Results are stored in a SQLite database (in WAL mode), so the cache can be shared by concurrent processes.
+        Each process opens its own connection on first use.
+
+        :param Path path: Path of the cache database
+        :param str chain_identity: Identity of the processing chain (see get_chain_identity)
+        """
+        self.path = Path(path)
+        self.chain_identity = chain_identity
+        self.chain_hash = blake2b(chain_identity.encode('utf-8'), digest_size=16).digest()
+        self.connection, self.connection_pid = None, None
+        self.hits, self.misses = 0, 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['connection'], state['connection_pid'] = None, None
+        return state
+
+    def get_connection(self):
+        """ Gets the connection of the current process, creating the database if needed """
+        if self.connection is None or self.connection_pid != getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.connection = connect(str(self.path), timeout=60)
+            self.connection_pid = getpid()
+
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS results '
+                '(key BLOB PRIMARY KEY, chain TEXT NOT NULL, result BLOB NOT NULL, last_used REAL NOT NULL)'
+            )
+            self.connection.commit()
+
+        return self.connection
+
+    def make_key(self, document):
+        """ Computes the cache key of a raw document """
+        document = document if isinstance(document, str) else ''
+        key = blake2b(self.chain_hash, digest_size=20)
+        key.update(document.encode('utf-8', 'surrogatepass'))
+        return key.digest()
+
+    def get_many(self, keys):
+        """
+        Looks up cached results, marking them as used.
+        Hits and misses are counted per requested document, so repeated documents are counted each time.
+
+        :param list keys: List of cache keys
+        :return dict: Cached results keyed by cache key
+        """
+        connection = self.get_connection()
+        requested_keys, keys = keys, list(set(keys))
+        results = {}
+
+        for start in range(0, len(keys), query_size):
+            query_keys = keys[start:start + query_size]
+            rows = connection.execute(
+                'SELECT key, result FROM results WHERE key IN (' + ','.join('?' * len(query_keys)) + ')', query_keys
+            ).fetchall()
+            results.update((key, loads(result)) for key, result in rows)
+
+        if len(results) > 0:
+            with connection:
+                connection.executemany(
+                    'UPDATE results SET last_used = ? WHERE key = ?', [(time(), key) for key in results]
+                )
+
+        num_hits = sum(key in results for key in requested_keys)
+        self.hits += num_hits
+        self.misses += len(requested_keys) - num_hits
+        return results
+
+    def put_many(self, keys, results):
+        """
+        Stores results, all in one transaction
+
+        :param list keys: List of cache keys
+        :param list results: List of corresponding results
+        """
+        now = time()
+        with self.get_connection() as connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)',
+                [(key, self.chain_identity, dumps(result, HIGHEST_PROTOCOL), now) for key, result in zip(keys, results)]
+            )
+
+    def get_statistics(self):
+        """ Returns the number of hits and misses of the lookups of this process """
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def close(self):
+        """ Closes the connection of the current process """
+        if self.connection is not None and self.connection_pid == getpid():
+            self.connection.close()
+        self.connection, self.connection_pid = None, None
+
+
+def compact_cache(path, max_age=None, chain_identity=None):
+    """
+    Evicts cached results then reclaims their space
+
+    :param Path path: Path of the cache database
+    :param float max_age: Results unused for longer (in days) are evicted [kept by default]
+    :param str chain_identity: If given, results of any other processing chain are evicted
+    :return tuple: Number of evicted results, number of remaining results
+    """
+    connection = connect(str(path), timeout=60)
+    try:
+        with connection:
+            evicted = 0
+            if max_age is not None:
+                evicted += connection.execute(
+                    'DELETE FROM results WHERE last_used < ?', (time() - max_age * 86400,)
+                ).rowcount
+            if chain_identity is not None:
+                evicted += connection.execute('DELETE FROM results WHERE chain != ?', (chain_identity,)).rowcount
+
+        connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        connection.execute('VACUUM')
+        remaining = connection.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+    finally:
+        connection.close()
+
+    return evicted, remaining
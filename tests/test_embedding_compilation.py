@@ -0,0 +1,55 @@
+from unittest import TestCase, main
+from tempfile import TemporaryDirectory
+from pathlib import Path
+from numpy import float32
+from numpy.random import RandomState
+from pandas import DataFrame
+from model.core import CompiledEmbedding, is_quantized, quantization_methods
+from model.preparation.embedding_compilation import compile_embeddings, quantize_compiled
+
+
+class StubEmbedding:
+    """ Deterministic stand-in for a fastText model, mirrors the parts of its API used by compile_embeddings """
+    def get_dimension(self):
+        return 8
+
+    def get_word_vector(self, token):
+        return RandomState(sum(token.encode('utf-8'))).standard_normal(8).astype(float32)
+
+
+class TestRecompilation(TestCase):
+    """ Recompiling into a directory that already holds quantized tables """
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        base = Path(self.directory.name)
+        self.context_path = base / 'contexts.csv'
+        self.embedding_path = base / 'model.bin'
+        self.target_dir = base / 'embeddings'
+        self.embedding_path.write_bytes(b'model')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def compile(self, contexts):
+        DataFrame({'contexts': contexts}).to_csv(self.context_path)
+        return compile_embeddings(self.context_path, StubEmbedding(), self.target_dir, self.embedding_path)
+
+    def test_recompile_removes_quantized_tables(self):
+        self.compile(['first context here', 'and another one'])
+        for method in quantization_methods:
+            quantize_compiled(self.target_dir, method, 4)
+            self.assertTrue(is_quantized(self.target_dir, method))
+
+        num_tokens = self.compile(['a different and somewhat longer vocabulary', 'with more tokens than before'])
+        for method in quantization_methods:
+            self.assertFalse(is_quantized(self.target_dir, method))
+
+        # Tables quantized after the recompilation match the new vocabulary
+        for method in quantization_methods:
+            quantize_compiled(self.target_dir, method, 4)
+            embedding = CompiledEmbedding(self.target_dir, quantization=method)
+            self.assertEqual(embedding.matrix.shape[0], num_tokens + 1)
+
+
+if __name__ == '__main__':
+    main()
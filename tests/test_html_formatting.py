@@ -0,0 +1,23 @@
+from unittest import TestCase, main
+from model.preparation.equivalence import fixture_documents, find_mismatches, apply_reference_process, \
+    apply_soup_reference_process
+from utilities.pre_processing import remove_quotes, remove_quotes_reference
+
+
+class TestQuoteRemoval(TestCase):
+    """ The quote scanner against the BeautifulSoup reference it replaces """
+    def test_matches_reference_on_its_own(self):
+        documents = [document for document in fixture_documents if isinstance(document, str)]
+        self.assertEqual(find_mismatches(documents, remove_quotes_reference, remove_quotes), [])
+
+    def test_matches_reference_in_standard_chain(self):
+        self.assertEqual(find_mismatches(fixture_documents, apply_soup_reference_process, apply_reference_process), [])
+
+    def test_unbalanced_markup(self):
+        self.assertEqual(remove_quotes('open <p> para'), (0, 'open <p> para</p>'))
+        self.assertEqual(remove_quotes('stray </a> end'), (0, 'stray  end'))
+        self.assertEqual(remove_quotes('a <br> b &amp; c < d'), (0, 'a <br/> b &amp; c &lt; d'))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,24 @@
-from utilities.io import *
-from utilities.file_management import *
+from utilities.lazy_exports import make_lazy_exports
 
-move_to_root()
+# Names are imported from their submodule on first use, so importing utilities is light and has no side effects
+# (scripts call move_to_root themselves)
+__getattr__, __dir__, __all__ = make_lazy_exports(__name__, {
+    'io': [
+        'file_regex', 'type_map', 'arrow_types', 'context_dtypes', 'make_path', 'check_existence', 'get_header',
+        'read_csv_arrow', 'load_data', 'load_data_chunks', 'output_abusive_intent', 'save_vector', 'append_vector',
+        'load_vector', 'check_execution_targets', 'save_contexts', 'append_contexts',
+    ],
+    'file_management': ['root_dir_file', 'move_to_root', 'in_parent_dir', 'make_dir', 'expand_csv_row_size'],
+    'tokenized_contexts': [
+        'tokens_filename', 'offsets_filename', 'vocabulary_filename', 'TokenizedContexts', 'ContextTokenizer',
+        'save_strings', 'load_strings', 'tokenize_contexts', 'load_tokenized', 'is_tokenized',
+    ],
+    'prediction_store': [
+        'index_columns', 'score_columns', 'cluster_column', 'header_alignment', 'get_prediction_dtype', 'make_records',
+        'save_predictions', 'load_predictions', 'export_predictions_csv', 'make_store_header', 'PredictionStoreWriter',
+    ],
+    'instrumentation': [
+        'latency_buckets', 'metric_prefix', 'Histogram', 'Metrics', 'metrics', 'InstrumentedWorker',
+        'instrument_worker', 'collect_worker_results',
+    ],
+})
@@ -0,0 +1,220 @@
+from time import perf_counter
+from json import dump
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+from config import instrumentation as is_instrumented
+
+latency_buckets = [.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1., 2.5, 5., 10.]     # Upper bounds, in seconds
+metric_prefix = 'intent_detection_'
+
+
+class Histogram:
+    """ Latency histogram with fixed buckets, counted like Prometheus histograms (value <= bucket bound) """
+    def __init__(self, bounds=latency_buckets):
+        """
+        :param list bounds: Ascending upper bounds of the buckets, an overflow (+Inf) bucket is added
+        """
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0.
+        self.count = 0
+
+    def observe(self, value):
+        """ Adds a value to the histogram """
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def get_cumulative(self):
+        """ Cumulative count of each bucket, the last one is the +Inf bucket """
+        cumulative, running = [], 0
+        for count in self.counts:
+            running += count
+            cumulative.append(running)
+        return cumulative
+
+    def get_quantile(self, quantile):
+        """ Upper bound of the bucket holding a quantile (None if it is the overflow bucket or there are no values) """
+        if self.count == 0:
+            return None
+
+        position = bisect_left(self.get_cumulative(), quantile * self.count)
+        return self.bounds[position] if position < len(self.bounds) else None
+
+    def get_summary(self):
+        """ Returns the histogram as a dictionary """
+        return {
+            'count': self.count,
+            'sum': self.total,
+            'mean': self.total / self.count if self.count > 0 else None,
+            'p50': self.get_quantile(.5),
+            'p95': self.get_quantile(.95),
+            'p99': self.get_quantile(.99),
+            'buckets': dict(zip([str(bound) for bound in self.bounds] + ['+Inf'], self.get_cumulative())),
+        }
+
+
+class Metrics:
+    """ Registry of the stage timings, pre-processing timings, gauges, and latency histograms of a run """
+    def __init__(self, enabled=is_instrumented):
+        """
+        Nothing is recorded when disabled, and the instrumented code paths are not taken.
+
+        :param bool enabled: Whether metrics are recorded [instrumentation in config by default]
+        """
+        self.enabled = enabled
+        self.stage_times = {}
+        self.process_times = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    @contextmanager
+    def stage(self, name):
+        """ Times a stage of a run (ex. with metrics.stage('predict'): ...), repeated stages are summed """
+        if not self.enabled:
+            yield
+            return
+
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_times[name] = self.stage_times.get(name, 0.) + perf_counter() - start
+
+    def add_process_time(self, name, seconds):
+        """ Adds one call of a pre-processing function """
+        times = self.process_times.get(name)
+        if times is None:
+            self.process_times[name] = [seconds, 1]
+        else:
+            times[0] += seconds
+            times[1] += 1
+
+    def pop_process_times(self):
+        """ Returns then clears the pre-processing times, (name) -> [seconds, calls] """
+        process_times, self.process_times = self.process_times, {}
+        return process_times
+
+    def merge_process_times(self, process_times):
+        """ Merges pre-processing times recorded by another process (see pop_process_times) """
+        for name, (seconds, calls) in process_times.items():
+            times = self.process_times.setdefault(name, [0., 0])
+            times[0] += seconds
+            times[1] += calls
+
+    def set_gauge(self, name, value):
+        """ Sets the value of a gauge """
+        self.gauges[name] = value
+
+    def set_gauges(self, prefix, statistics):
+        """ Sets a gauge for each numeric value of a dictionary (ex. cache statistics), named prefix_key """
+        for key, value in statistics.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                self.gauges[prefix + '_' + key] = value
+
+    def observe(self, name, value):
+        """ Adds a value to a latency histogram """
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.observe(value)
+
+    def get_summary(self):
+        """ Returns the recorded metrics as a dictionary """
+        return {
+            'stages': dict(self.stage_times),
+            'processes': {
+                name: {'seconds': seconds, 'calls': calls, 'mean': seconds / calls if calls > 0 else None}
+                for name, (seconds, calls) in sorted(self.process_times.items(), key=lambda item: -item[1][0])
+            },
+            'gauges': dict(self.gauges),
+            'histograms': {name: histogram.get_summary() for name, histogram in self.histograms.items()},
+        }
+
+    def get_prometheus(self):
+        """ Returns the recorded metrics in the Prometheus text exposition format """
+        lines = []
+
+        def add_family(name, kind, description, samples):
+            if len(samples) == 0:
+                return
+            lines.extend(['# HELP ' + metric_prefix + name + ' ' + description,
+                          '# TYPE ' + metric_prefix + name + ' ' + kind])
+            lines.extend(metric_prefix + sample + ' ' + repr(float(value)) for sample, value in samples)
+
+        add_family('stage_seconds', 'gauge', 'Wall time of each stage of the run.', [
+            ('stage_seconds{stage="' + name + '"}', seconds) for name, seconds in self.stage_times.items()
+        ])
+        add_family('process_seconds_total', 'counter', 'Time spent in each pre-processing function by all workers.', [
+            ('process_seconds_total{process="' + name + '"}', seconds)
+            for name, (seconds, _) in self.process_times.items()
+        ])
+        add_family('process_calls_total', 'counter', 'Number of calls of each pre-processing function.', [
+            ('process_calls_total{process="' + name + '"}', calls) for name, (_, calls) in self.process_times.items()
+        ])
+        for name, value in self.gauges.items():
+            add_family(name, 'gauge', name.replace('_', ' ').capitalize() + '.', [(name, value)])
+
+        for name, histogram in self.histograms.items():
+            bounds = [repr(float(bound)) for bound in histogram.bounds] + ['+Inf']
+            samples = [
+                (name + '_bucket{le="' + bound + '"}', count) for bound, count in zip(bounds, histogram.get_cumulative())
+            ]
+            add_family(name, 'histogram', 'Latency of each batch, in seconds.',
+                       samples + [(name + '_sum', histogram.total), (name + '_count', histogram.count)])
+
+        return '\n'.join(lines) + '\n'
+
+    def save(self, path):
+        """
+        Saves the metrics as a JSON summary and a Prometheus text file, nothing is saved when disabled
+
+        :param Path path: Destination path, without extension (ex. data/metrics/prepare_data)
+        """
+        if not self.enabled:
+            return
+
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path.with_suffix('.json'), 'w') as summary_file:
+            dump(self.get_summary(), summary_file, indent=2)
+        with open(path.with_suffix('.prom'), 'w') as prometheus_file:
+            prometheus_file.write(self.get_prometheus())
+
+
+# Metrics of the current process
+metrics = Metrics()
+
+
+class InstrumentedWorker:
+    """ Wraps a pool worker function, so the pre-processing times of each call are sent back with its result """
+    def __init__(self, function):
+        self.function = function
+
+    def __call__(self, item):
+        metrics.pop_process_times()     # Drop the times inherited from the parent process (forked workers)
+        return self.function(item), metrics.pop_process_times()
+
+
+def instrument_worker(function):
+    """ Wraps a pool worker function when instrumented (see collect_worker_results) """
+    return InstrumentedWorker(function) if metrics.enabled else function
+
+
+def collect_worker_results(results):
+    """
+    Unwraps the results of an instrumented worker, merging its pre-processing times into the metrics of this process
+
+    :param Iterable results: Results of a pool map (or imap) of a function wrapped with instrument_worker
+    :return Iterable: Iterable of the unwrapped results, the results themselves when not instrumented
+    """
+    if not metrics.enabled:
+        return results
+
+    def unwrap():
+        for result, process_times in results:
+            metrics.merge_process_times(process_times)
+            yield result
+
+    return unwrap()
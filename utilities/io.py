@@ -1,9 +1,11 @@
 from pathlib import Path
-from pandas import read_csv, DataFrame
 from re import compile
-from numpy import asarray, savetxt, ndarray
+from numpy import asarray, savetxt, ndarray, int64, dtype as numpy_dtype
 from sys import argv
 from utilities.pre_processing import final_clean
+from utilities.prediction_store import load_predictions
+
+# pandas is imported by the functions that read or write csv files, so other callers do not pay for loading it
 
 file_regex = compile(r'\w+\.\w+$')
 type_map = {
@@ -11,6 +13,15 @@ type_map = {
     'i': '%d',
     'f': '%.6f'
 }
+arrow_types = {
+    'O': 'string',
+    'U': 'string',
+    'i': 'int64',
+    'f': 'double'
+}
+
+# Columns (and their types) of the contexts saved by save_contexts
+context_dtypes = {'document_index': int64, 'context_index': int64, 'contexts': object}
 
 
 def make_path(filename):
@@ -38,7 +49,37 @@ def check_existence(paths):
             raise FileExistsError(path, 'does not exist.')
 
 
-def load_data(path, columns=None, index_col=0, encoding='utf-8'):
+def get_header(path, encoding='utf-8'):
+    """ Reads the column names of a csv file (without reading its rows) """
+    from pandas import read_csv
+    return list(read_csv(path, nrows=0, encoding=encoding).columns)
+
+
+def read_csv_arrow(path, columns, index_col, encoding, dtypes):
+    """ Reads a csv with the (multi-threaded) pyarrow parser, None if pyarrow is not installed """
+    try:
+        from pyarrow import csv as arrow_csv, type_for_alias
+    except ImportError:
+        return None
+
+    column_types = {name: type_for_alias(arrow_types[numpy_dtype(data_type).kind]) for name, data_type in dtypes.items()}
+    table = arrow_csv.read_csv(
+        path, read_options=arrow_csv.ReadOptions(encoding=encoding),
+        parse_options=arrow_csv.ParseOptions(newlines_in_values=True),
+        convert_options=arrow_csv.ConvertOptions(include_columns=columns, column_types=column_types)
+    )
+
+    data_frame = table.to_pandas()
+    for name, data_type in dtypes.items():     # Keep python strings, as read_csv does
+        if numpy_dtype(data_type).kind == 'O':
+            data_frame[name] = data_frame[name].astype(object)
+
+    if index_col is not None:
+        data_frame = data_frame.set_index(data_frame.columns[index_col])
+    return data_frame
+
+
+def load_data(path, columns=None, index_col=0, encoding='utf-8', dtypes=None, fast=True):
     """
     Opens file as a Panda DataFrame
 
@@ -46,20 +87,44 @@ def load_data(path, columns=None, index_col=0, encoding='utf-8'):
     :param list columns: List of column names to import the data with [uses top row by default]
     :param int index_col: Index of column to use as index values [default first column]
     :param str encoding: Encoding of the file [guesses by default]
+    :param dict dtypes: Types of the columns, keyed by column name (ex. context_dtypes) [inferred by default]
+    :param bool fast: Whether to parse with pyarrow when it is installed and the columns and dtypes are given
     :return DataFrame: DataFrame containing file content
     """
-    data_frame = read_csv(path, usecols=columns, index_col=index_col, encoding=encoding)
+    if fast and columns is not None and dtypes is not None:
+        data_frame = read_csv_arrow(path, columns, index_col, encoding, dtypes)
+        if data_frame is not None:
+            return data_frame
+
+    from pandas import read_csv
+    data_frame = read_csv(path, usecols=columns, index_col=index_col, encoding=encoding, dtype=dtypes)
 
     return data_frame
 
 
+def load_data_chunks(path, chunk_size, columns=None, index_col=0, encoding='utf-8', dtypes=None):
+    """
+    Opens file as an iterator of Panda DataFrames of (at most) chunk_size rows
+
+    :param Path path: Path to file
+    :param int chunk_size: Number of rows per chunk
+    :param list columns: List of column names to import the data with [uses top row by default]
+    :param int index_col: Index of column to use as index values [default first column]
+    :param str encoding: Encoding of the file [guesses by default]
+    :param dict dtypes: Types of the columns, keyed by column name (ex. context_dtypes) [inferred by default]
+    :return Iterator: Iterator of DataFrames
+    """
+    from pandas import read_csv
+    return read_csv(path, usecols=columns, index_col=index_col, encoding=encoding, chunksize=chunk_size, dtype=dtypes)
+
+
 def output_abusive_intent(indexes, predictions, contexts, filename=None):
     """
     Prints abusive intent results to console and saves to disk
 
     :param Iterator indexes: Array of targeted indexes to output (ex. output from argsort)
-    :param ndarray predictions: Array of predictions (3 x N array)
-    :param ndarray contexts: Array of corresponding documents
+    :param ndarray predictions: Array of predictions (3 x N array), or dictionaries keyed by index
+    :param ndarray contexts: Array of corresponding documents, or dictionary keyed by index
     :param Path filename: Path for predictions to be saved to [doesn't save by default]
     """
     indexes = asarray(list(indexes)) if not isinstance(indexes, ndarray) else indexes
@@ -90,13 +155,34 @@ def save_vector(data_vector, path):
     savetxt(path, data_vector, delimiter=',', fmt=type_map[data_type])
 
 
-def load_vector(file_path):
+def append_vector(data_vector, path):
     """
-    Loads data from a csv with a single column and no header
+    Appends a numpy vector to a csv without indexes or column header(s)
+
+    :param ndarray data_vector: Array of values
+    :param Path path: Path of the file to append the array to
+    """
+    data_type = data_vector.dtype.kind
+    if data_type not in type_map:
+        raise TypeError('Unsupported type,', data_type)
+
+    with open(path, 'a') as target_file:
+        savetxt(target_file, data_vector, delimiter=',', fmt=type_map[data_type])
+
+
+def load_vector(file_path, column='abusive_intent', mmap_mode='r'):
+    """
+    Loads data from a csv with a single column and no header, or a column of a prediction store (.npy)
 
     :param Path file_path: Path to target file
+    :param str column: Column loaded from a prediction store
+    :param str mmap_mode: Memory-map mode of a prediction store, the column is then a view of the file (zero-copy)
     :return ndarray: Data from file
     """
+    if Path(file_path).suffix == '.npy':
+        return load_predictions(file_path, mmap_mode)[column]
+
+    from pandas import read_csv
     file_data = read_csv(file_path, header=None)\
         .values.reshape(-1)
 
@@ -122,7 +208,27 @@ def save_contexts(contexts, indexes, target_path):
     :param ndarray indexes: Array of indexes for each context and its parent document
     :param Path target_path: Destination path for contexts
     """
+    from pandas import DataFrame
     dataset = DataFrame(indexes, columns=['document_index', 'context_index'])
 
     dataset['contexts'] = list(map(final_clean, contexts))
     dataset.to_csv(target_path)
+
+
+def append_contexts(contexts, indexes, target_path, start_row=0):
+    """
+    Appends cleaned document contexts and their indexes to a contexts file, in the format of save_contexts
+
+    :param list contexts: List of contexts, already cleaned with final_clean
+    :param ndarray indexes: Array of indexes for each context and its parent document
+    :param Path target_path: Destination path for contexts
+    :param int start_row: Row number of the first context, the file is (re)created with a header when 0
+    """
+    from pandas import DataFrame
+    dataset = DataFrame(
+        indexes, columns=['document_index', 'context_index'],
+        index=range(start_row, start_row + len(contexts))
+    )
+
+    dataset['contexts'] = contexts
+    dataset.to_csv(target_path, mode='w' if start_row == 0 else 'a', header=start_row == 0)
@@ -0,0 +1,28 @@
+from importlib import import_module
+
+
+def make_lazy_exports(package, exports):
+    """
+    Builds the module __getattr__ and __dir__ (PEP 562) of a package whose names are only imported from their
+    submodule, along with the submodule's dependencies, on first access
+
+    :param str package: Name of the package (__name__)
+    :param dict exports: List of the exported names of each submodule, keyed by submodule name
+    :return tuple: __getattr__ function, __dir__ function, list of every exported name (for __all__)
+    """
+    # Later submodules take precedence, as with a sequence of star imports
+    owners = {name: submodule for submodule, names in exports.items() for name in names}
+
+    def get_attribute(name):
+        submodule = owners.get(name)
+        if submodule is None:
+            raise AttributeError('module ' + repr(package) + ' has no attribute ' + repr(name))
+
+        value = getattr(import_module(package + '.' + submodule), name)
+        setattr(import_module(package), name, value)    # Later accesses skip __getattr__
+        return value
+
+    def get_names():
+        return sorted(set(owners) | set(vars(import_module(package))))
+
+    return get_attribute, get_names, list(owners)
@@ -1,6 +1,24 @@
-from utilities.pre_processing.basic_statistics import *
-from utilities.pre_processing.hyperlinks import *
-from utilities.pre_processing.hashtags import *
-from utilities.pre_processing.special_characters import *
-from utilities.pre_processing.html_formatting import *
-from utilities.pre_processing.runtime_processing import *
+from utilities.lazy_exports import make_lazy_exports
+
+# Names are imported from their submodule on first use, so the runtime cleaning does not load the full chain
+__getattr__, __dir__, __all__ = make_lazy_exports(__name__, {
+    'basic_statistics': [
+        'emoji_regex', 'express_regex', 'punctuation_regex', 'partial_clean', 'digit_regex', 'space_regex',
+        'image_regex', 'repeat_regex', 'tag_regex', 'bracket_regex', 'acronym', 'count_upper', 'count_emojis',
+        'original_length', 'count_express', 'count_punctuation', 'count_digits', 'count_images', 'count_bracket_text',
+        'count_repeat_instances', 'count_tags', 'remove_spaces', 'run_partial_clean', 'count_acronym',
+    ],
+    'hyperlinks': ['url_regex', 'pull_hyperlinks'],
+    'hashtags': ['hashtag_regex', 'hashtag_parser_regex', 'split_hashtags'],
+    'special_characters': ['manage_special_characters'],
+    'html_formatting': [
+        'quote_style', 'html_spaces', 'html_tag_regex', 'tag_opening_regex', 'unsupported_markup_regex',
+        'text_entity_regex', 'attribute_regex', 'plain_attributes_regex', 'void_elements', 'unsupported_elements',
+        'list_attributes', 'parse_attributes', 'collapse_whitespace', 'escape_markup', 'unescape_text',
+        'serialize_text', 'serialize_start_tag', 'scan_quotes', 'remove_quotes', 'remove_quotes_reference',
+    ],
+    'runtime_processing': [
+        'non_char', 'extra_space', 'repeats', 'acronym', 'split_pattern', 'clean_acronym', 'pre_intent_clean',
+        'final_clean', 'simulated_runtime_clean', 'runtime_clean',
+    ],
+})
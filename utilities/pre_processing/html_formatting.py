@@ -1,16 +1,215 @@
-from bs4 import BeautifulSoup
+from re import compile, IGNORECASE
+from html import unescape
 from warnings import filterwarnings
 
 # Stop beautiful soup from throwing warnings about url-like text
 filterwarnings("ignore", category=UserWarning, module='bs4')
 
+quote_style = 'margin:20px; margin-top:5px; '
+html_spaces = ' \t\n\r\f'
+html_tag_regex = compile(r'<(/?)([a-zA-Z][^\s/>]*)((?:"[^"]*"|\'[^\']*\'|[^\'">])*)>')
+tag_opening_regex = compile(r'</?[a-zA-Z]')
+unsupported_markup_regex = compile(r'<(?:[!?]|/(?![a-zA-Z]))|\x00')   # Comments, declarations, bogus end tags, nulls
+text_entity_regex = compile(r'&(?:amp|lt|gt|quot|nbsp|#(\d{1,7})|#[xX]([\da-fA-F]{1,6}));')
+attribute_regex = compile(r'([^\s"\'>/=]+)(?:\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s"\'=<>`]+)))?')
+
+# Attributes the scanner re-serializes itself, quoted values without characters the parser reads differently
+plain_attributes_regex = compile(
+    r'(?:[ \n]+[a-zA-Z_:][-\w:.]*(?:=(?:"[^"<>\t\r\f]*"|\'[^\'<>\t\r\f]*\'))?)*[ \n]*/?'
+)
+
+# Tags that are closed by their start tag (as in BeautifulSoup's html tree builder)
+void_elements = {
+    'area', 'base', 'basefont', 'bgsound', 'br', 'col', 'command', 'embed', 'frame', 'hr', 'image', 'img', 'input',
+    'isindex', 'keygen', 'link', 'menuitem', 'meta', 'nextid', 'param', 'source', 'spacer', 'track', 'wbr',
+}
+
+# Tags whose content is parsed or kept differently (raw text, preserved whitespace, special strings)
+unsupported_elements = {
+    'script', 'style', 'pre', 'textarea', 'title', 'template', 'rt', 'rp', 'xmp', 'plaintext', 'iframe', 'noembed',
+    'noframes', 'noscript',
+}
+
+# Attributes BeautifulSoup splits on whitespace (then joins with single spaces), for all tags ('*') or by tag
+list_attributes = {
+    '*': {'class', 'accesskey', 'dropzone'}, 'a': {'rel', 'rev'}, 'link': {'rel', 'rev'}, 'td': {'headers'},
+    'th': {'headers'}, 'form': {'accept-charset'}, 'object': {'archive'}, 'area': {'rel'}, 'icon': {'sizes'},
+    'iframe': {'sandbox'}, 'output': {'for'},
+}
+
+
+def parse_attributes(tag_content):
+    """ Parses the attributes of a tag into a dictionary, as the html parser does (the last duplicate wins) """
+    attributes = {}
+    for name, double_quoted, single_quoted, unquoted in attribute_regex.findall(tag_content):
+        attributes[name.lower()] = unescape(double_quoted or single_quoted or unquoted)
+
+    return attributes
+
+
+def collapse_whitespace(text):
+    """ Collapses whitespace-only text between tags to a single character, as BeautifulSoup does """
+    if text and text not in (' ', '\n') and not text.strip(html_spaces):
+        return '\n' if '\n' in text else ' '
+    return text
+
+
+def escape_markup(text):
+    """ Escapes ampersands and angle brackets, as BeautifulSoup's (default) minimal formatter does """
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def unescape_text(text):
+    """
+    Decodes the entities of the text between two tags, as BeautifulSoup does for the entities its versions agree on
+
+    :param str text: Raw text
+    :return str: Decoded text, or None if the text holds other entities or ampersands (ex. unknown or unterminated
+        entities, or character references BeautifulSoup maps through windows-1252)
+    """
+    if '&' not in text:
+        return text
+
+    num_entities = 0
+    for entity in text_entity_regex.finditer(text):
+        decimal, hexadecimal = entity.groups()
+        if decimal is not None or hexadecimal is not None:
+            code = int(decimal) if decimal is not None else int(hexadecimal, 16)
+            if not (32 <= code < 127 or 160 <= code < 0xD800 or 0xE000 <= code < 0xFFFE):
+                return None
+        num_entities += 1
+
+    return unescape(text) if num_entities == text.count('&') else None
+
+
+def serialize_text(text):
+    """ Serializes the raw text between two tags the way BeautifulSoup outputs it, None if it cannot be decoded """
+    text = unescape_text(text)
+    return None if text is None else escape_markup(collapse_whitespace(text))
+
+
+def serialize_start_tag(name, attributes):
+    """
+    Serializes a start tag the way BeautifulSoup outputs it (attributes are sorted by name)
+
+    :param str name: Lower case name of the tag
+    :param dict attributes: Attributes of the tag (see parse_attributes)
+    :return str: Serialized tag, closed (ex. <br/>) if the tag is a void element
+    """
+    serialized = ['<', name]
+    split_attributes = list_attributes['*'] | list_attributes.get(name, set())
+    for attribute, value in sorted(attributes.items()):
+        if attribute in split_attributes:
+            value = ' '.join(value.split())
+        value = escape_markup(value)
+
+        if '"' not in value:
+            serialized.append(' ' + attribute + '="' + value + '"')
+        elif "'" not in value:
+            serialized.append(' ' + attribute + "='" + value + "'")
+        else:
+            serialized.append(' ' + attribute + '="' + value.replace('"', '&quot;') + '"')
+
+    serialized.append('/>' if name in void_elements else '>')
+    return ''.join(serialized)
+
+
+def scan_quotes(document):
+    """
+    Removes quote and citation divs, along with everything they enclose, with a single scan of the tags.
+    The rest of the document is re-serialized as BeautifulSoup outputs it (ex. <br/>, escaped entities).
+
+    :param str document: Contents of a document
+    :return tuple: Number of quotes, document without quotes, or None if the markup would be repaired by the parser
+        (ex. unclosed or stray tags) or read differently than by the scanner
+    """
+    kept = []
+    text_start = 0
+    open_tags = []
+    drop_depth = None       # Depth of the quote or citation being dropped
+    count = 0
+    num_tags = 0
+
+    for tag in html_tag_regex.finditer(document):
+        if drop_depth is None:
+            kept.append(serialize_text(document[text_start:tag.start()]))
+            if kept[-1] is None:
+                return None
+        text_start = tag.end()
+        num_tags += 1
+
+        name, content = tag.group(2).lower(), tag.group(3)
+        if name in unsupported_elements or plain_attributes_regex.fullmatch(content) is None:
+            return None
+
+        if tag.group(1) == '/':
+            if name in void_elements or len(open_tags) == 0 or open_tags[-1] != name:
+                return None     # Stray or mismatched end tags, dropped or implicitly closed by the parser
+
+            open_tags.pop()
+            if drop_depth is None:
+                kept.append('</' + name + '>')
+            elif len(open_tags) == drop_depth:
+                drop_depth = None
+            continue
+
+        names = [attribute[0].lower() for attribute in attribute_regex.findall(content)]
+        if len(names) != len(set(names)):
+            return None
+        attributes = parse_attributes(content)
+
+        if name == 'div':
+            is_quote = attributes.get('style') == quote_style
+            count += is_quote
+            if drop_depth is None and (is_quote or attributes.get('align') == 'right'):
+                drop_depth = len(open_tags)
+
+        if drop_depth is None:
+            kept.append(serialize_start_tag(name, attributes))
+        if name in void_elements:
+            continue
+
+        # Self-closing tags (ex. <div/>) are closed straight away
+        if content.endswith('/'):
+            if drop_depth is None:
+                kept.append('</' + name + '>')
+            elif len(open_tags) == drop_depth:
+                drop_depth = None
+            continue
+        open_tags.append(name)
+
+    # Unclosed tags are closed by the parser, and incomplete tags are read differently
+    if len(open_tags) > 0 or num_tags != len(tag_opening_regex.findall(document)):
+        return None
+
+    kept.append(serialize_text(document[text_start:]))
+    return None if kept[-1] is None else (count, ''.join(kept))
+
 
 def remove_quotes(document, get_header=False):
-    """ Removes quotes from (primarily) storm-front content """
+    """
+    Removes quotes from (primarily) storm-front content.
+    Well-formed markup is scanned directly, other documents are parsed with BeautifulSoup (see remove_quotes_reference)
+    so that its repairs (ex. closing unclosed tags) are kept. Either way the output matches remove_quotes_reference.
+    """
+    if get_header: return 'quotes'
+    result = None
+    if '<' not in document:     # No markup, so no quotes or citations
+        text = serialize_text(document)
+        result = None if text is None else (0, text)
+    elif unsupported_markup_regex.search(document) is None:
+        result = scan_quotes(document)
+
+    return remove_quotes_reference(document) if result is None else result
+
+
+def remove_quotes_reference(document, get_header=False):
+    """ Removes quotes by parsing the full document with BeautifulSoup (reference for remove_quotes) """
     if get_header: return 'quotes'
+    from bs4 import BeautifulSoup
     soup = BeautifulSoup(document, 'html.parser')
 
-    quotes = soup.find_all('div', {'style': 'margin:20px; margin-top:5px; '})
+    quotes = soup.find_all('div', {'style': quote_style})
     quote_citation = soup.find_all('div', {'align': 'right'})
 
     count = len(quotes)
@@ -1,5 +1,4 @@
 from html import unescape
-from unidecode import unidecode
 
 
 def manage_special_characters(document, get_header=False):
@@ -8,7 +7,8 @@ def manage_special_characters(document, get_header=False):
     # Convert html characters to string equivalent
     document = unescape(document).replace('’', '\'')
 
-    # Convert unicode characters
+    # Convert unicode characters (unidecode is loaded on first use)
+    from unidecode import unidecode
     document = unidecode(document)
 
     return None, document
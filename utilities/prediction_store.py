@@ -0,0 +1,114 @@
+from pathlib import Path
+from struct import pack
+from numpy import dtype, empty, save, load, int64, float32
+from numpy.lib.format import magic, dtype_to_descr
+
+index_columns = ['document_index', 'context_index']
+score_columns = ['abuse', 'intent', 'abusive_intent']
+cluster_column = 'cluster_id'
+header_alignment = 64
+
+
+def get_prediction_dtype(with_clusters=False):
+    """ Record layout of the prediction store, the cluster id column is optional """
+    fields = [(column, int64) for column in index_columns] + [(column, float32) for column in score_columns]
+    if with_clusters:
+        fields.append((cluster_column, int64))
+    return dtype(fields)
+
+
+def make_records(prediction_bundle, indexes=None, cluster_ids=None):
+    """
+    Packs predictions into an array of records
+
+    :param tuple prediction_bundle: Abuse, intent, and abusive-intent predictions
+    :param ndarray indexes: (contexts x 2) array of document and context indexes [-1 if unknown]
+    :param ndarray cluster_ids: Near-duplicate cluster of each context [no cluster column by default]
+    :return ndarray: Structured array of predictions
+    """
+    records = empty(len(prediction_bundle[0]), get_prediction_dtype(cluster_ids is not None))
+
+    for position, column in enumerate(index_columns):
+        records[column] = -1 if indexes is None else indexes[:, position]
+    for predictions, column in zip(prediction_bundle, score_columns):
+        records[column] = predictions
+    if cluster_ids is not None:
+        records[cluster_column] = cluster_ids
+
+    return records
+
+
+def save_predictions(path, prediction_bundle, indexes=None, cluster_ids=None):
+    """
+    Saves predictions and their indexes as a single binary (numpy .npy) store of records
+
+    :param Path path: Destination path of the store
+    :param tuple prediction_bundle: Abuse, intent, and abusive-intent predictions
+    :param ndarray indexes: (contexts x 2) array of document and context indexes [-1 if unknown]
+    :param ndarray cluster_ids: Near-duplicate cluster of each context [no cluster column by default]
+    """
+    with open(path, 'wb') as target_file:
+        save(target_file, make_records(prediction_bundle, indexes, cluster_ids))
+
+
+def load_predictions(path, mmap_mode='r'):
+    """
+    Loads a prediction store, columns are accessed by name (ex. store['abusive_intent'])
+
+    :param Path path: Path of the store
+    :param str mmap_mode: Memory-map mode, None to read into memory
+    :return ndarray: Structured array of predictions
+    """
+    return load(path, mmap_mode=mmap_mode)
+
+
+def export_predictions_csv(records, path):
+    """ Exports a prediction store (or array of records) to a csv """
+    from pandas import DataFrame
+    DataFrame(records).to_csv(path, index=False)
+
+
+def make_store_header(record_dtype, length):
+    """ Builds a fixed size (version 1.0) .npy header, so it can be rewritten in place once the length is known """
+    descriptor = {'descr': dtype_to_descr(record_dtype), 'fortran_order': False, 'shape': (length,)}
+    widest = repr(dict(descriptor, shape=(2 ** 63 - 1,)))
+
+    header_size = -(-(len(magic(1, 0)) + 2 + len(widest) + 1) // header_alignment) * header_alignment
+    header = repr(descriptor).ljust(header_size - len(magic(1, 0)) - 2 - 1) + '\n'
+    return magic(1, 0) + pack('<H', len(header)) + header.encode('latin1')
+
+
+class PredictionStoreWriter:
+    """ Appends predictions to a prediction store chunk by chunk, the header is completed on close """
+    def __init__(self, path, with_clusters=False):
+        """
+        :param Path path: Destination path of the store
+        :param bool with_clusters: Whether the records have a cluster id column
+        """
+        self.path = Path(path)
+        self.record_dtype = get_prediction_dtype(with_clusters)
+        self.length = 0
+
+        self.target_file = open(self.path, 'wb')
+        self.target_file.write(make_store_header(self.record_dtype, 0))
+
+    def append(self, prediction_bundle, indexes=None, cluster_ids=None):
+        """ Appends a chunk of predictions, see make_records """
+        records = make_records(prediction_bundle, indexes, cluster_ids)
+        if records.dtype != self.record_dtype:
+            raise ValueError('Records do not match the layout of the store.')
+
+        self.target_file.write(records.tobytes())
+        self.length += len(records)
+
+    def close(self):
+        """ Rewrites the header with the final length then closes the store """
+        self.target_file.seek(0)
+        self.target_file.write(make_store_header(self.record_dtype, self.length))
+        self.target_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,192 @@
+from pathlib import Path
+from numpy import asarray, fromiter, frombuffer, zeros, arange, cumsum, concatenate, save, savez, load, ndarray, \
+    int32, int64, uint8
+from itertools import chain
+from numbers import Integral
+
+tokens_filename = 'tokens.npy'
+offsets_filename = 'offsets.npy'
+vocabulary_filename = 'vocabulary.npz'
+
+
+class TokenizedContexts:
+    """ Pre-tokenized contexts stored as a flat (CSR-style) array of token ids with per-context offsets """
+    def __init__(self, tokens, offsets, vocabulary):
+        """
+        :param ndarray tokens: Flat int32 array of token ids of all contexts
+        :param ndarray offsets: int64 array of context boundaries, context i spans [offsets[i], offsets[i + 1])
+        :param ndarray vocabulary: Object array of tokens, indexed by token id
+        """
+        self.tokens = tokens
+        self.offsets = offsets
+        self.vocabulary = vocabulary
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def get_lengths(self):
+        """ Number of tokens in each context """
+        return self.offsets[1:] - self.offsets[:-1]
+
+    def __getitem__(self, index):
+        """
+        Gets a context (as a string) or a subset of contexts
+
+        :param int|slice|ndarray index: Context index, slice, index array, or boolean mask
+        :return str|TokenizedContexts: Context string for an integer index, otherwise a TokenizedContexts subset
+        """
+        if isinstance(index, Integral):
+            return ' '.join(self.vocabulary[self.tokens[self.offsets[index]:self.offsets[index + 1]]])
+
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step == 1:
+                stop = max(start, stop)
+                offsets = self.offsets[start:stop + 1]
+                return TokenizedContexts(self.tokens[offsets[0]:offsets[-1]], offsets - offsets[0], self.vocabulary)
+            index = arange(start, stop, step)
+
+        index = asarray(index)
+        if index.dtype == bool:
+            index = index.nonzero()[0]
+
+        starts = self.offsets[index]
+        lengths = self.offsets[index + 1] - starts
+        offsets = zeros(len(index) + 1, int64)
+        cumsum(lengths, out=offsets[1:])
+
+        # Position of every selected token in the flat array, built without a Python loop
+        positions = arange(offsets[-1]) - (offsets[:-1] - starts).repeat(lengths)
+        return TokenizedContexts(self.tokens[positions], offsets, self.vocabulary)
+
+    def token_matrix(self, max_tokens, width=None):
+        """
+        Builds the padded id matrix of the contexts, ids are shifted by one so that 0 is padding
+
+        :param int max_tokens: Maximum number of tokens taken from each context
+        :param int width: Width of the matrix [max_tokens by default]
+        :return ndarray: int32 matrix of shape (contexts, width)
+        """
+        width = max_tokens if width is None else width
+        lengths = self.get_lengths().clip(max=min(max_tokens, width))
+        mask = arange(width) < lengths[:, None]
+
+        # Column j of context i comes from offsets[i] + j
+        positions = (self.offsets[:-1, None] + arange(width))[mask]
+
+        token_ids = zeros((len(self), width), int32)
+        token_ids[mask] = self.tokens[positions] + 1
+        return token_ids
+
+    def save(self, directory):
+        """ Saves the token, offset, and vocabulary arrays to a directory """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+
+        save(directory / tokens_filename, self.tokens)
+        save(directory / offsets_filename, self.offsets)
+        save_strings(directory / vocabulary_filename, self.vocabulary)
+
+
+class ContextTokenizer:
+    """ Incrementally tokenizes batches of cleaned contexts against a shared vocabulary """
+    def __init__(self):
+        self.vocabulary = {}
+        self.token_chunks = []
+        self.length_chunks = []
+
+    def __len__(self):
+        return sum(map(len, self.length_chunks))
+
+    def add(self, contexts):
+        """
+        Tokenizes cleaned contexts (split on spaces, as during embedding) and appends them
+
+        :param list contexts: List of cleaned contexts
+        """
+        vocabulary = self.vocabulary
+        token_lists = [context.split(' ') for context in contexts]
+        lengths = fromiter(map(len, token_lists), int64, len(token_lists))
+
+        # Token ids are assigned in order of first appearance
+        tokens = fromiter(
+            (vocabulary.setdefault(token, len(vocabulary)) for token in chain.from_iterable(token_lists)),
+            int32, int(lengths.sum())
+        )
+
+        self.token_chunks.append(tokens)
+        self.length_chunks.append(lengths)
+
+    def get_tokenized(self):
+        """ Builds the TokenizedContexts of all added contexts """
+        lengths = concatenate(self.length_chunks) if len(self.length_chunks) > 0 else zeros(0, int64)
+        offsets = zeros(len(lengths) + 1, int64)
+        cumsum(lengths, out=offsets[1:])
+
+        tokens = concatenate(self.token_chunks) if len(self.token_chunks) > 0 else zeros(0, int32)
+        return TokenizedContexts(tokens, offsets, asarray(list(self.vocabulary), dtype=object))
+
+
+def save_strings(path, strings):
+    """
+    Saves strings as a single UTF-8 blob with per-string offsets, so that storage grows with the total length of the
+    strings (a fixed-width unicode array pads every string to the longest one)
+
+    :param Path path: Destination path of the .npz file
+    :param list strings: List (or array) of strings
+    """
+    encoded = [string.encode('utf-8', 'surrogatepass') for string in strings]
+    offsets = zeros(len(encoded) + 1, int64)
+    cumsum(fromiter(map(len, encoded), int64, len(encoded)), out=offsets[1:])
+
+    savez(path, data=frombuffer(b''.join(encoded), uint8), offsets=offsets)
+
+
+def load_strings(path):
+    """
+    Loads strings saved with save_strings
+
+    :param Path path: Path of the .npz file
+    :return ndarray: Object array of strings
+    """
+    with load(path) as arrays:
+        data, offsets = arrays['data'].tobytes(), arrays['offsets'].tolist()
+
+    return asarray(
+        [data[start:end].decode('utf-8', 'surrogatepass') for start, end in zip(offsets[:-1], offsets[1:])],
+        dtype=object
+    )
+
+
+def tokenize_contexts(contexts):
+    """
+    Tokenizes cleaned contexts (split on spaces, as during embedding) into a TokenizedContexts
+
+    :param list contexts: List of cleaned contexts
+    :return TokenizedContexts: Pre-tokenized contexts
+    """
+    tokenizer = ContextTokenizer()
+    tokenizer.add(contexts)
+    return tokenizer.get_tokenized()
+
+
+def load_tokenized(directory, mmap_mode='r'):
+    """
+    Loads pre-tokenized contexts saved with TokenizedContexts.save
+
+    :param Path directory: Directory containing the saved arrays
+    :param str mmap_mode: Memory-map mode of the token and offset arrays, None to read into memory
+    :return TokenizedContexts: Pre-tokenized contexts
+    """
+    directory = Path(directory)
+    return TokenizedContexts(
+        load(directory / tokens_filename, mmap_mode=mmap_mode),
+        load(directory / offsets_filename, mmap_mode=mmap_mode),
+        load_strings(directory / vocabulary_filename)
+    )
+
+
+def is_tokenized(directory):
+    """ Checks whether a directory contains pre-tokenized contexts """
+    directory = Path(directory)
+    return all((directory / filename).exists() for filename in (tokens_filename, offsets_filename, vocabulary_filename))